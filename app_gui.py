@@ -1,7 +1,10 @@
 import streamlit as st
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials
 import os
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- INICIALIZAÇÃO INTELIGENTE E ROBUSTA DO FIREBASE (VERSÃO FINAL) ---
 @st.cache_resource
@@ -11,12 +14,16 @@ def inicializar_firebase():
     Prioriza a verificação do ficheiro local e depois tenta os secrets da nuvem.
     """
     try:
+        # MÉTODO 0: ARMAZENAMENTO LOCAL (memória ou SQLite, sem credenciais; ver armazenamento.py)
+        if armazenamento.backend_configurado() != armazenamento.BACKEND_FIRESTORE:
+            return armazenamento.conectar()
+
         # MÉTODO 1: LOCAL (Prioridade para desenvolvimento)
         if os.path.exists('firebase_credentials.json'):
             if not firebase_admin._apps:
                 cred = credentials.Certificate('firebase_credentials.json')
                 firebase_admin.initialize_app(cred)
-            return firestore.client()
+            return armazenamento.conectar()
 
         # MÉTODO 2: NUVEM (Streamlit Secrets com Verificação Completa e Individual)
         required_secrets = [
@@ -32,7 +39,7 @@ def inicializar_firebase():
             if not firebase_admin._apps:
                 cred = credentials.Certificate(cred_dict)
                 firebase_admin.initialize_app(cred)
-            return firestore.client()
+            return armazenamento.conectar()
         else:
             missing_secrets = [secret for secret in required_secrets if secret not in st.secrets]
             if not missing_secrets:
@@ -54,6 +61,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+instrumentacao.iniciar_rerun("Coach de Concursos")
 
 db = inicializar_firebase()
 
@@ -63,8 +71,7 @@ st.markdown("A sua plataforma personalizada para gestão de estudos.")
 if db:
     # --- Carregar e selecionar perfis ---
     try:
-        perfis_ref = db.collection('perfis_concursos').where('status', '==', 'Ativo').stream()
-        perfis_ativos = {doc.id: doc.to_dict() for doc in perfis_ref}
+        perfis_ativos = repositorio.carregar_perfis(db, status='Ativo')
     except Exception as e:
         st.error(f"Não foi possível carregar os perfis da base de dados: {e}")
         perfis_ativos = {}
@@ -98,12 +105,34 @@ if db:
                 
                 st.session_state.perfil_selecionado = perfil_selecionado_data
                 st.session_state.perfil_id_selecionado = perfil_id_selecionado
+                # Os dados do perfil começam a ser lidos em segundo plano, enquanto o utilizador navega
+                st.session_state.aquecimento = repositorio.aquecer_perfil(db, perfil_selecionado_data)
                 
                 st.success(f"Perfil '{perfil_selecionado_data['nome']}' carregado com sucesso!")
                 st.info("Pode agora navegar para as outras páginas no menu à esquerda.")
             else:
                 st.warning("Por favor, selecione um perfil.")
 
+        aquecimento = st.session_state.get('aquecimento')
+        if aquecimento is not None:
+            em_curso = not aquecimento.terminado
+
+            # Só este fragmento é reexecutado enquanto as leituras decorrem; a página não fica bloqueada.
+            @st.fragment(run_every=0.5 if em_curso else None)
+            def mostrar_aquecimento():
+                if not aquecimento.terminado:
+                    st.progress(aquecimento.concluidas / aquecimento.total,
+                                text=f"A preparar os dados do perfil: {aquecimento.concluidas}/{aquecimento.total}")
+                elif em_curso:
+                    # Terminou: volta a correr a página uma vez para parar a atualização periódica.
+                    st.rerun(scope="app")
+                else:
+                    for nome, erro in aquecimento.erros().items():
+                        st.warning(f"Não foi possível pré-carregar '{nome}': {erro}")
+                    st.caption("✅ Dados do perfil prontos.")
+
+            mostrar_aquecimento()
+
     st.markdown("---")
     if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecionado:
         perfil_atual = st.session_state.perfil_selecionado
@@ -113,3 +142,4 @@ if db:
 else:
     st.error("A aplicação não conseguiu conectar-se à base de dados. As funcionalidades estão desativadas.")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
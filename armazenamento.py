@@ -0,0 +1,843 @@
+import copy
+import json
+import operator
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- ARMAZENAMENTO DE DOCUMENTOS ---
+#
+# O repositório, as páginas e a CLI falam com esta interface em vez do cliente
+# do Firestore. Há três implementações com a mesma semântica: o Firestore, usado
+# em produção, e duas locais (memória e SQLite) que permitem correr, medir e
+# perfilar a aplicação sem credenciais.
+#
+# O backend é escolhido pela variável de ambiente COACH_ARMAZENAMENTO:
+#   firestore (omissão) | memoria | sqlite | sqlite:caminho/do/ficheiro.db
+#
+# Semântica comum:
+#   - documentos são dicionários; datas sem fuso são tratadas como UTC e lidas com fuso UTC;
+#   - gravar(..., mesclar=True) funde mapas aninhados; atualizar substitui os campos
+#     de topo e falha com DocumentoInexistente se o documento não existir;
+#   - Incremento(n) soma n ao valor atual do campo (0 se não existir);
+#   - lotes e transações são atómicos; nas transações as leituras vêm antes das escritas;
+#   - filtros são tuplos (campo, operador, valor); documentos sem o campo não correspondem.
+
+VARIAVEL_AMBIENTE = 'COACH_ARMAZENAMENTO'
+BACKEND_FIRESTORE = 'firestore'
+BACKEND_MEMORIA = 'memoria'
+BACKEND_SQLITE = 'sqlite'
+CAMINHO_SQLITE_PADRAO = 'coach_local.db'
+
+# Máximo de escritas num lote do Firestore.
+LIMITE_LOTE = 500
+# Documentos por página em percorrer().
+TAMANHO_PAGINA = 1000
+# Escritas em massa (gravar_em_massa) no Firestore.
+MAXIMO_ESCRITAS_POR_SEGUNDO = 5000
+TENTATIVAS_EM_MASSA = 10
+CODIGOS_TRANSITORIOS = {4, 8, 10, 13, 14}  # DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, ABORTED, INTERNAL, UNAVAILABLE
+INTERVALO_PROGRESSO = 0.25  # segundos
+
+# Tipos de alteração entregues a quem observa uma coleção.
+ALTERADO = 'alterado'
+REMOVIDO = 'removido'
+
+OPERADORES = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge,
+}
+
+
+class DocumentoInexistente(LookupError):
+    """Uma atualização referiu um documento que não existe."""
+
+
+class IndiceEmFalta(RuntimeError):
+    """A consulta precisa de um índice composto que ainda não foi criado (ver firestore.indexes.json)."""
+
+
+class Incremento:
+    """Soma atómica a um campo numérico, aplicada pelo servidor (equivalente a firestore.Increment)."""
+
+    def __init__(self, valor):
+        self.valor = valor
+
+    def __repr__(self):
+        return f"Incremento({self.valor!r})"
+
+
+class Escritor(ABC):
+    """Operações de escrita comuns aos lotes e às transações."""
+
+    @abstractmethod
+    def gravar(self, colecao, id_documento, dados, mesclar=False): ...
+
+    @abstractmethod
+    def atualizar(self, colecao, id_documento, dados): ...
+
+    @abstractmethod
+    def apagar(self, colecao, id_documento): ...
+
+
+class Lote(Escritor):
+    """Conjunto de escritas aplicado de uma só vez por confirmar()."""
+
+    @abstractmethod
+    def confirmar(self): ...
+
+
+class Transacao(Escritor):
+    """Leituras consistentes seguidas de escritas, aplicadas atomicamente no fim."""
+
+    @abstractmethod
+    def ler(self, colecao, id_documento): ...
+
+    @abstractmethod
+    def ler_varios(self, colecao, ids_documentos): ...
+
+
+class Observacao(ABC):
+    """Subscrição das alterações de uma coleção (ver Armazenamento.observar)."""
+
+    @property
+    @abstractmethod
+    def ativo(self): ...
+
+    @abstractmethod
+    def cancelar(self): ...
+
+
+class Armazenamento(ABC):
+    """Interface de um armazenamento de documentos organizados em coleções."""
+
+    nome = None
+    # True se observar() entrega cada alteração antes de a escrita retornar.
+    notificacoes_sincronas = False
+
+    @abstractmethod
+    def novo_id(self, colecao):
+        """Gera um identificador livre para um novo documento da coleção."""
+
+    @abstractmethod
+    def ler(self, colecao, id_documento):
+        """Devolve os dados de um documento, ou None se não existir."""
+
+    @abstractmethod
+    def ler_varios(self, colecao, ids_documentos):
+        """Devolve {id: dados} dos documentos pedidos que existem."""
+
+    @abstractmethod
+    def listar(self, colecao, filtros=(), campos=None):
+        """Devolve {id: dados} dos documentos que passam todos os filtros; `campos` limita os campos lidos."""
+
+    @abstractmethod
+    def listar_pagina(self, colecao, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        """Devolve {id: dados}, por ordem de id, dos primeiros `limite` documentos com id maior que `apos`."""
+
+    @abstractmethod
+    def listar_ordenado(self, colecao, ordem, descendente=False, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        """
+        Devolve {id: dados} dos primeiros `limite` documentos, ordenados pelo campo `ordem` e, em caso de
+        empate, pelo id. `apos` é o cursor (valor de `ordem`, id) do último documento da página anterior.
+        Documentos sem o campo `ordem` ficam de fora.
+        """
+
+    @abstractmethod
+    def agregar(self, colecao, somas=(), filtros=()):
+        """Devolve {'contagem': n, campo: soma, ...} dos documentos que passam os filtros, sem os descarregar."""
+
+    @abstractmethod
+    def lote(self):
+        """Abre um Lote de escritas."""
+
+    @abstractmethod
+    def executar_transacao(self, funcao):
+        """Executa funcao(transacao) numa Transacao, repetindo-a se houver conflito, e devolve o seu resultado."""
+
+    @abstractmethod
+    def observar(self, colecao, ao_alterar):
+        """
+        Chama ao_alterar([(tipo, id, dados), ...]) primeiro com todos os documentos da coleção e depois
+        a cada alteração. Devolve uma Observacao.
+        """
+
+    def gravar(self, colecao, id_documento, dados, mesclar=False):
+        lote = self.lote()
+        lote.gravar(colecao, id_documento, dados, mesclar=mesclar)
+        lote.confirmar()
+
+    def atualizar(self, colecao, id_documento, dados):
+        lote = self.lote()
+        lote.atualizar(colecao, id_documento, dados)
+        lote.confirmar()
+
+    def apagar(self, colecao, id_documento):
+        lote = self.lote()
+        lote.apagar(colecao, id_documento)
+        lote.confirmar()
+
+    def percorrer(self, colecao, tamanho_pagina=TAMANHO_PAGINA, filtros=(), campos=None):
+        """Gera as páginas ({id: dados}, por ordem de id) de uma coleção, sem a ter toda em memória."""
+        apos = None
+        while True:
+            pagina = self.listar_pagina(colecao, apos, tamanho_pagina, filtros, campos)
+            if pagina:
+                yield pagina
+            if len(pagina) < tamanho_pagina:
+                return
+            apos = next(reversed(pagina))
+
+    def gravar_em_massa(self, colecao, documentos, ao_progredir=None):
+        """
+        Grava os pares (id, dados) de `documentos` (um iterável, consumido aos poucos) o mais depressa
+        que o backend permitir, sem atomicidade entre documentos. Chama ao_progredir(gravados), na
+        thread de quem chamou, à medida que avança. Devolve {id: erro} dos documentos que falharam.
+        """
+        falhas, gravados, blocos = {}, 0, _em_blocos(documentos, LIMITE_LOTE)
+        for bloco in blocos:
+            lote = self.lote()
+            for id_documento, dados in bloco:
+                lote.gravar(colecao, id_documento, dados)
+            try:
+                lote.confirmar()
+                gravados += len(bloco)
+            except Exception as e:
+                falhas.update((id_documento, e) for id_documento, _ in bloco)
+            if ao_progredir:
+                ao_progredir(gravados)
+        return falhas
+
+
+def _em_blocos(iteravel, tamanho):
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+# --- FIRESTORE ---
+
+def _para_firestore(dados):
+    from firebase_admin import firestore
+    convertidos = {}
+    for campo, valor in dados.items():
+        if isinstance(valor, Incremento):
+            convertidos[campo] = firestore.Increment(valor.valor)
+        elif isinstance(valor, dict):
+            convertidos[campo] = _para_firestore(valor)
+        else:
+            convertidos[campo] = valor
+    return convertidos
+
+@contextmanager
+def _traduzir_erros_firestore():
+    from google.api_core import exceptions
+    try:
+        yield
+    except exceptions.NotFound as e:
+        raise DocumentoInexistente(str(e)) from e
+    except exceptions.FailedPrecondition as e:
+        if 'index' not in str(e):
+            raise
+        raise IndiceEmFalta(str(e)) from e
+
+
+class _EscritorFirestore(Escritor):
+
+    def __init__(self, cliente, escritor):
+        self._cliente = cliente
+        self._escritor = escritor
+
+    def _ref(self, colecao, id_documento):
+        return self._cliente.collection(colecao).document(id_documento)
+
+    def gravar(self, colecao, id_documento, dados, mesclar=False):
+        self._escritor.set(self._ref(colecao, id_documento), _para_firestore(dados), merge=mesclar)
+
+    def atualizar(self, colecao, id_documento, dados):
+        self._escritor.update(self._ref(colecao, id_documento), _para_firestore(dados))
+
+    def apagar(self, colecao, id_documento):
+        self._escritor.delete(self._ref(colecao, id_documento))
+
+
+class _LoteFirestore(_EscritorFirestore, Lote):
+
+    def confirmar(self):
+        with _traduzir_erros_firestore():
+            self._escritor.commit()
+
+
+class _TransacaoFirestore(_EscritorFirestore, Transacao):
+
+    def ler(self, colecao, id_documento):
+        snapshot = self._ref(colecao, id_documento).get(transaction=self._escritor)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def ler_varios(self, colecao, ids_documentos):
+        refs = [self._ref(colecao, id_documento) for id_documento in ids_documentos]
+        return {snapshot.id: snapshot.to_dict() for snapshot in self._escritor.get_all(refs) if snapshot.exists}
+
+
+class _ObservacaoFirestore(Observacao):
+
+    def __init__(self, watch):
+        self._watch = watch
+
+    @property
+    def ativo(self):
+        return self._watch.is_active
+
+    def cancelar(self):
+        self._watch.unsubscribe()
+
+
+class ArmazenamentoFirestore(Armazenamento):
+    """Armazenamento sobre um cliente do Firestore (firebase_admin.firestore.client())."""
+
+    nome = BACKEND_FIRESTORE
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+
+    def _consulta(self, colecao, filtros=()):
+        from firebase_admin import firestore
+        consulta = self.cliente.collection(colecao)
+        for campo, operador, valor in filtros:
+            consulta = consulta.where(filter=firestore.FieldFilter(campo, operador, valor))
+        return consulta
+
+    def novo_id(self, colecao):
+        return self.cliente.collection(colecao).document().id
+
+    def ler(self, colecao, id_documento):
+        snapshot = self.cliente.collection(colecao).document(id_documento).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def ler_varios(self, colecao, ids_documentos):
+        refs = [self.cliente.collection(colecao).document(id_documento) for id_documento in ids_documentos]
+        if not refs:
+            return {}
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.cliente.get_all(refs) if snapshot.exists}
+
+    def listar(self, colecao, filtros=(), campos=None):
+        consulta = self._consulta(colecao, filtros)
+        if campos is not None:
+            consulta = consulta.select(list(campos))
+        return {doc.id: doc.to_dict() or {} for doc in consulta.stream()}
+
+    def listar_pagina(self, colecao, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        from firebase_admin import firestore
+        consulta = self._consulta(colecao, filtros)
+        if apos is not None:
+            referencia = self.cliente.collection(colecao).document(apos)
+            consulta = consulta.where(filter=firestore.FieldFilter('__name__', '>', referencia))
+        consulta = consulta.order_by('__name__').limit(limite)
+        if campos is not None:
+            consulta = consulta.select(list(campos))
+        return {doc.id: doc.to_dict() or {} for doc in consulta.stream()}
+
+    def listar_ordenado(self, colecao, ordem, descendente=False, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        from firebase_admin import firestore
+        direcao = firestore.Query.DESCENDING if descendente else firestore.Query.ASCENDING
+        # Com filtros de igualdade, a ordenação precisa de um índice composto (firestore.indexes.json).
+        consulta = self._consulta(colecao, filtros).order_by(ordem, direction=direcao).order_by('__name__', direction=direcao)
+        if apos is not None:
+            valor, id_documento = apos
+            consulta = consulta.start_after({ordem: valor, '__name__': self.cliente.collection(colecao).document(id_documento)})
+        consulta = consulta.limit(limite)
+        if campos is not None:
+            consulta = consulta.select(list(campos))
+        with _traduzir_erros_firestore():
+            return {doc.id: doc.to_dict() or {} for doc in consulta.stream()}
+
+    def agregar(self, colecao, somas=(), filtros=()):
+        agregacao = self._consulta(colecao, filtros).count(alias='contagem')
+        for campo in somas:
+            agregacao = agregacao.sum(campo, alias=campo)
+        return {resultado.alias: resultado.value for resultado in agregacao.get()[0]}
+
+    def lote(self):
+        return _LoteFirestore(self.cliente, self.cliente.batch())
+
+    def executar_transacao(self, funcao):
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def executar(transaction):
+            return funcao(_TransacaoFirestore(self.cliente, transaction))
+
+        with _traduzir_erros_firestore():
+            return executar(self.cliente.transaction())
+
+    def gravar_em_massa(self, colecao, documentos, ao_progredir=None):
+        # BulkWriter: lotes enviados em paralelo, com limitação de débito (começa nas 500
+        # escritas/s recomendadas para coleções novas) e novas tentativas com recuo.
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+        escritor = self.cliente.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=500, max_ops_per_second=MAXIMO_ESCRITAS_POR_SEGUNDO))
+        lock, falhas, gravados = threading.Lock(), {}, [0]
+
+        def ao_gravar(referencia, resultado, _escritor):
+            with lock:
+                gravados[0] += 1
+
+        def ao_falhar(falha, _escritor):
+            if falha.code in CODIGOS_TRANSITORIOS and falha.attempts < TENTATIVAS_EM_MASSA:
+                return True
+            with lock:
+                falhas[falha.operation.reference.id] = RuntimeError(f"[{falha.code}] {falha.message}")
+            return False
+
+        escritor.on_write_result(ao_gravar)
+        escritor.on_write_error(ao_falhar)
+        colecao_ref = self.cliente.collection(colecao)
+        for id_documento, dados in documentos:
+            escritor.set(colecao_ref.document(id_documento), _para_firestore(dados))
+
+        # Os resultados chegam nas threads do BulkWriter; o progresso é comunicado nesta.
+        fecho = threading.Thread(target=escritor.close, daemon=True)
+        fecho.start()
+        while fecho.is_alive():
+            fecho.join(INTERVALO_PROGRESSO)
+            if ao_progredir:
+                with lock:
+                    ao_progredir(gravados[0])
+        return falhas
+
+    def observar(self, colecao, ao_alterar):
+        def ao_receber_snapshot(snapshot_colecao, alteracoes, read_time):
+            ao_alterar([
+                (REMOVIDO if alteracao.type.name == 'REMOVED' else ALTERADO,
+                 alteracao.document.id, alteracao.document.to_dict())
+                for alteracao in alteracoes
+            ])
+        return _ObservacaoFirestore(self.cliente.collection(colecao).on_snapshot(ao_receber_snapshot))
+
+
+# --- IMPLEMENTAÇÕES LOCAIS (MEMÓRIA E SQLITE) ---
+
+def _normalizar_valor(valor):
+    """Converte um valor para a forma em que o Firestore o devolveria."""
+    if isinstance(valor, datetime):
+        return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor.astimezone(timezone.utc)
+    if isinstance(valor, dict):
+        return {campo: _normalizar_valor(v) for campo, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar_valor(v) for v in valor]
+    if type(valor).__module__ == 'numpy' and hasattr(valor, 'item'):
+        return valor.item()
+    return valor
+
+def _aplicar_campos(base, dados, fundir_mapas):
+    """Aplica `dados` sobre `base`, resolvendo os Incrementos e fundindo mapas se `fundir_mapas`."""
+    resultado = dict(base or {})
+    for campo, valor in dados.items():
+        atual = resultado.get(campo)
+        if isinstance(valor, Incremento):
+            numerico = isinstance(atual, (int, float)) and not isinstance(atual, bool)
+            resultado[campo] = (atual if numerico else 0) + valor.valor
+        elif isinstance(valor, dict):
+            resultado[campo] = _aplicar_campos(atual if fundir_mapas and isinstance(atual, dict) else None, valor, True)
+        else:
+            resultado[campo] = _normalizar_valor(valor)
+    return resultado
+
+def _corresponde(dados, filtros):
+    for campo, operador, valor in filtros:
+        if campo not in dados:
+            return False
+        try:
+            if not OPERADORES[operador](dados[campo], _normalizar_valor(valor)):
+                return False
+        except TypeError:
+            # Valores de tipos diferentes não se comparam, como no Firestore.
+            return False
+    return True
+
+def _projetar(dados, campos):
+    if campos is None:
+        return dados
+    return {campo: dados[campo] for campo in campos if campo in dados}
+
+
+class _EscritorLocal(Escritor):
+
+    def __init__(self):
+        self._operacoes = []
+
+    def gravar(self, colecao, id_documento, dados, mesclar=False):
+        self._operacoes.append(('gravar', colecao, id_documento, dados, mesclar))
+
+    def atualizar(self, colecao, id_documento, dados):
+        self._operacoes.append(('atualizar', colecao, id_documento, dados, False))
+
+    def apagar(self, colecao, id_documento):
+        self._operacoes.append(('apagar', colecao, id_documento, None, False))
+
+
+class _LoteLocal(_EscritorLocal, Lote):
+
+    def __init__(self, armazenamento):
+        super().__init__()
+        self._armazenamento = armazenamento
+
+    def confirmar(self):
+        self._armazenamento._aplicar(self._operacoes)
+        self._operacoes = []
+
+
+class _TransacaoLocal(_EscritorLocal, Transacao):
+
+    def __init__(self, armazenamento):
+        super().__init__()
+        self._armazenamento = armazenamento
+
+    def ler(self, colecao, id_documento):
+        if self._operacoes:
+            raise RuntimeError("As leituras de uma transação têm de preceder as escritas.")
+        return self._armazenamento.ler(colecao, id_documento)
+
+    def ler_varios(self, colecao, ids_documentos):
+        if self._operacoes:
+            raise RuntimeError("As leituras de uma transação têm de preceder as escritas.")
+        return self._armazenamento.ler_varios(colecao, ids_documentos)
+
+
+class _ObservacaoLocal(Observacao):
+
+    def __init__(self, armazenamento, colecao, ao_alterar):
+        self._armazenamento = armazenamento
+        self.colecao = colecao
+        self.ao_alterar = ao_alterar
+        self._ativo = True
+
+    @property
+    def ativo(self):
+        return self._ativo
+
+    def cancelar(self):
+        self._ativo = False
+        self._armazenamento._remover_observacao(self)
+
+
+class _ArmazenamentoLocal(Armazenamento):
+    """
+    Base das implementações locais. Todas as operações são serializadas por um lock reentrante;
+    as transações detêm-no do início ao fim, pelo que nunca entram em conflito.
+    """
+
+    notificacoes_sincronas = True
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._profundidade = 0
+        self._observacoes = {}   # colecao -> [_ObservacaoLocal]
+        self._a_notificar = []   # (colecao, alteracoes) à espera do fim da operação exclusiva
+
+    # Operações específicas de cada implementação, sempre chamadas com o lock detido.
+    @abstractmethod
+    def _ler_documento(self, colecao, id_documento): ...
+
+    @abstractmethod
+    def _ler_colecao(self, colecao): ...
+
+    def _percorrer_colecao(self, colecao, apos):
+        """Gera (id, dados) por ordem de id, a partir do primeiro id maior que `apos`."""
+        documentos = self._ler_colecao(colecao)
+        for id_documento in sorted(documentos):
+            if apos is None or id_documento > apos:
+                yield id_documento, documentos[id_documento]
+
+    @abstractmethod
+    def _persistir(self, alterados): ...
+
+    def _iniciar(self):
+        pass
+
+    def _confirmar(self):
+        pass
+
+    def _desfazer(self):
+        pass
+
+    @contextmanager
+    def _exclusivo(self):
+        with self._lock:
+            self._profundidade += 1
+            try:
+                if self._profundidade == 1:
+                    self._iniciar()
+                try:
+                    yield
+                except BaseException:
+                    if self._profundidade == 1:
+                        self._desfazer()
+                        self._a_notificar = []
+                    raise
+                if self._profundidade == 1:
+                    self._confirmar()
+                    a_notificar, self._a_notificar = self._a_notificar, []
+                    for colecao, alteracoes in a_notificar:
+                        for observacao in list(self._observacoes.get(colecao, [])):
+                            try:
+                                observacao.ao_alterar(alteracoes)
+                            except Exception:
+                                # Como no Firestore, uma exceção no callback encerra a observação.
+                                observacao.cancelar()
+            finally:
+                self._profundidade -= 1
+
+    def novo_id(self, colecao):
+        return uuid.uuid4().hex[:20]
+
+    def ler(self, colecao, id_documento):
+        with self._lock:
+            return copy.deepcopy(self._ler_documento(colecao, id_documento))
+
+    def ler_varios(self, colecao, ids_documentos):
+        with self._lock:
+            documentos = {id_documento: self._ler_documento(colecao, id_documento) for id_documento in ids_documentos}
+        return {id_documento: copy.deepcopy(dados) for id_documento, dados in documentos.items() if dados is not None}
+
+    def listar(self, colecao, filtros=(), campos=None):
+        with self._lock:
+            documentos = self._ler_colecao(colecao)
+            return {
+                id_documento: copy.deepcopy(_projetar(dados, campos))
+                for id_documento, dados in sorted(documentos.items())
+                if _corresponde(dados, filtros)
+            }
+
+    def listar_pagina(self, colecao, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        pagina = {}
+        with self._lock:
+            for id_documento, dados in self._percorrer_colecao(colecao, apos):
+                if _corresponde(dados, filtros):
+                    pagina[id_documento] = copy.deepcopy(_projetar(dados, campos))
+                    if len(pagina) == limite:
+                        break
+        return pagina
+
+    def listar_ordenado(self, colecao, ordem, descendente=False, apos=None, limite=TAMANHO_PAGINA, filtros=(), campos=None):
+        with self._lock:
+            documentos = [
+                ((dados[ordem], id_documento), dados)
+                for id_documento, dados in self._ler_colecao(colecao).items()
+                if ordem in dados and _corresponde(dados, filtros)
+            ]
+            # Como no Firestore, o cursor é comparado na mesma ordem (valor, id) da consulta.
+            documentos.sort(key=lambda item: item[0], reverse=descendente)
+            if apos is not None:
+                cursor = (_normalizar_valor(apos[0]), apos[1])
+                documentos = [item for item in documentos if (item[0] < cursor if descendente else item[0] > cursor)]
+            return {chave[1]: copy.deepcopy(_projetar(dados, campos)) for chave, dados in documentos[:limite]}
+
+    def agregar(self, colecao, somas=(), filtros=()):
+        with self._lock:
+            documentos = [dados for dados in self._ler_colecao(colecao).values() if _corresponde(dados, filtros)]
+        resultado = {'contagem': len(documentos)}
+        for campo in somas:
+            resultado[campo] = sum(
+                dados[campo] for dados in documentos
+                if isinstance(dados.get(campo), (int, float)) and not isinstance(dados.get(campo), bool)
+            )
+        return resultado
+
+    def lote(self):
+        return _LoteLocal(self)
+
+    def executar_transacao(self, funcao):
+        with self._exclusivo():
+            transacao = _TransacaoLocal(self)
+            resultado = funcao(transacao)
+            self._aplicar(transacao._operacoes)
+            return resultado
+
+    def _aplicar(self, operacoes):
+        with self._exclusivo():
+            alterados = {}  # (colecao, id) -> dados novos, ou None se apagado
+            for tipo, colecao, id_documento, dados, mesclar in operacoes:
+                chave = (colecao, id_documento)
+                atual = alterados[chave] if chave in alterados else self._ler_documento(colecao, id_documento)
+                if tipo == 'apagar':
+                    alterados[chave] = None
+                elif tipo == 'atualizar':
+                    if atual is None:
+                        raise DocumentoInexistente(f"{colecao}/{id_documento}")
+                    alterados[chave] = _aplicar_campos(atual, dados, fundir_mapas=False)
+                else:
+                    alterados[chave] = _aplicar_campos(atual if mesclar else None, dados, fundir_mapas=True)
+            self._persistir(alterados)
+
+            por_colecao = {}
+            for (colecao, id_documento), dados in alterados.items():
+                alteracao = (REMOVIDO, id_documento, None) if dados is None else (ALTERADO, id_documento, copy.deepcopy(dados))
+                por_colecao.setdefault(colecao, []).append(alteracao)
+            self._a_notificar.extend(por_colecao.items())
+
+    def observar(self, colecao, ao_alterar):
+        with self._lock:
+            observacao = _ObservacaoLocal(self, colecao, ao_alterar)
+            self._observacoes.setdefault(colecao, []).append(observacao)
+            iniciais = [(ALTERADO, id_documento, copy.deepcopy(dados)) for id_documento, dados in self._ler_colecao(colecao).items()]
+            ao_alterar(iniciais)
+        return observacao
+
+    def _remover_observacao(self, observacao):
+        with self._lock:
+            observacoes = self._observacoes.get(observacao.colecao, [])
+            if observacao in observacoes:
+                observacoes.remove(observacao)
+
+
+class ArmazenamentoMemoria(_ArmazenamentoLocal):
+    """Armazenamento em memória do processo; os dados perdem-se ao terminar."""
+
+    nome = BACKEND_MEMORIA
+
+    def __init__(self):
+        super().__init__()
+        self._colecoes = {}  # colecao -> {id: dados}
+
+    def _ler_documento(self, colecao, id_documento):
+        return self._colecoes.get(colecao, {}).get(id_documento)
+
+    def _ler_colecao(self, colecao):
+        return self._colecoes.get(colecao, {})
+
+    def _persistir(self, alterados):
+        for (colecao, id_documento), dados in alterados.items():
+            documentos = self._colecoes.setdefault(colecao, {})
+            if dados is None:
+                documentos.pop(id_documento, None)
+            else:
+                documentos[id_documento] = dados
+
+
+def _codificar_json(valor):
+    if isinstance(valor, datetime):
+        return {'$data': valor.isoformat()}
+    raise TypeError(f"Tipo não suportado: {type(valor).__name__}")
+
+def _descodificar_json(objeto):
+    if len(objeto) == 1 and '$data' in objeto:
+        return datetime.fromisoformat(objeto['$data'])
+    return objeto
+
+
+class ArmazenamentoSQLite(_ArmazenamentoLocal):
+    """
+    Armazenamento num ficheiro SQLite, com um documento JSON por linha. Cada lote ou transação
+    corre numa transação BEGIN IMMEDIATE, pelo que também é atómico entre processos; as
+    notificações de observar() só chegam a quem observa no mesmo processo.
+    """
+
+    nome = BACKEND_SQLITE
+
+    def __init__(self, caminho=CAMINHO_SQLITE_PADRAO):
+        super().__init__()
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS documentos ("
+            " colecao TEXT NOT NULL, id TEXT NOT NULL, dados TEXT NOT NULL,"
+            " PRIMARY KEY (colecao, id))"
+        )
+
+    def _ler_documento(self, colecao, id_documento):
+        linha = self._conexao.execute(
+            "SELECT dados FROM documentos WHERE colecao = ? AND id = ?", (colecao, id_documento)
+        ).fetchone()
+        return json.loads(linha[0], object_hook=_descodificar_json) if linha else None
+
+    def _ler_colecao(self, colecao):
+        return {
+            id_documento: json.loads(dados, object_hook=_descodificar_json)
+            for id_documento, dados in self._conexao.execute(
+                "SELECT id, dados FROM documentos WHERE colecao = ?", (colecao,)
+            )
+        }
+
+    def _percorrer_colecao(self, colecao, apos):
+        # Ordem BINARY do SQLite, a mesma dos ids em Python e no Firestore (bytes UTF-8). Lê aos
+        # blocos, com fetchall, para não deixar cursores abertos entre operações.
+        apos = '' if apos is None else apos
+        while True:
+            linhas = self._conexao.execute(
+                "SELECT id, dados FROM documentos WHERE colecao = ? AND id > ? ORDER BY id LIMIT ?",
+                (colecao, apos, TAMANHO_PAGINA)
+            ).fetchall()
+            for id_documento, dados in linhas:
+                yield id_documento, json.loads(dados, object_hook=_descodificar_json)
+            if len(linhas) < TAMANHO_PAGINA:
+                return
+            apos = linhas[-1][0]
+
+    def _persistir(self, alterados):
+        for (colecao, id_documento), dados in alterados.items():
+            if dados is None:
+                self._conexao.execute("DELETE FROM documentos WHERE colecao = ? AND id = ?", (colecao, id_documento))
+            else:
+                self._conexao.execute(
+                    "INSERT OR REPLACE INTO documentos (colecao, id, dados) VALUES (?, ?, ?)",
+                    (colecao, id_documento, json.dumps(dados, default=_codificar_json, ensure_ascii=False))
+                )
+
+    def _iniciar(self):
+        self._conexao.execute("BEGIN IMMEDIATE")
+
+    def _confirmar(self):
+        self._conexao.execute("COMMIT")
+
+    def _desfazer(self):
+        self._conexao.execute("ROLLBACK")
+
+
+# --- ESCOLHA DO BACKEND ---
+
+_lock_instancias = threading.Lock()
+_instancias = {}  # configuração -> Armazenamento, partilhado por todas as páginas do processo
+
+
+def backend_configurado():
+    """Devolve o nome do backend escolhido em COACH_ARMAZENAMENTO."""
+    return os.environ.get(VARIAVEL_AMBIENTE, BACKEND_FIRESTORE).split(':', 1)[0].strip().lower()
+
+def conectar(configuracao=None):
+    """
+    Devolve o armazenamento de uma configuração ('firestore', 'memoria', 'sqlite[:caminho]'),
+    por omissão a de COACH_ARMAZENAMENTO. O Firestore exige o firebase_admin já inicializado.
+    Com COACH_INSTRUMENTACAO ativa devolve-o instrumentado (ver instrumentacao.py).
+    """
+    configuracao = configuracao or os.environ.get(VARIAVEL_AMBIENTE, BACKEND_FIRESTORE)
+    backend, _, parametro = configuracao.partition(':')
+    backend = backend.strip().lower()
+
+    with _lock_instancias:
+        if configuracao not in _instancias:
+            if backend == BACKEND_FIRESTORE:
+                from firebase_admin import firestore
+                _instancias[configuracao] = ArmazenamentoFirestore(firestore.client())
+            elif backend == BACKEND_MEMORIA:
+                _instancias[configuracao] = ArmazenamentoMemoria()
+            elif backend == BACKEND_SQLITE:
+                _instancias[configuracao] = ArmazenamentoSQLite(parametro or CAMINHO_SQLITE_PADRAO)
+            else:
+                raise ValueError(f"Backend de armazenamento desconhecido: '{backend}'.")
+            import instrumentacao
+            if instrumentacao.ativa():
+                _instancias[configuracao] = instrumentacao.instrumentar(_instancias[configuracao])
+        return _instancias[configuracao]
@@ -0,0 +1,352 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timezone
+import armazenamento
+import importacao
+import repositorio
+
+# --- EXPORTAÇÃO E RESTAURO DE PERFIS ---
+#
+# Um backup contém o documento do perfil e todas as suas coleções (dashboard,
+# históricos, catálogo e resumos), identificadas pelo papel e não pelo nome,
+# para que possam ser restauradas com outro ID de perfil ou noutro projeto.
+#
+# Os documentos são lidos página a página (Armazenamento.percorrer) e escritos
+# à medida; o restauro grava blocos de BLOCO_RESTAURO documentos com
+# gravar_em_massa (o BulkWriter, no Firestore). A memória usada não depende do
+# tamanho do perfil.
+#
+# Formatos:
+#   ndjson   - um ficheiro (.ndjson, ou .ndjson.gz comprimido) com um documento por linha;
+#   parquet  - uma pasta com um ficheiro .parquet por coleção, com uma coluna tipada por
+#              campo (ver _esquema_parquet), e o perfil em perfil.json. Exige o pyarrow.
+#
+# No parquet, os campos fora do esquema da coleção, os valores de outro tipo e os
+# campos a None vão, em JSON, para a coluna COLUNA_EXTRAS; uma coluna nula quer
+# dizer campo ausente. Assim o restauro reconstrói cada documento tal como foi
+# lido. As datas ficam sem fuso, em UTC.
+#
+#   python backup.py exportar ID_PERFIL backup.ndjson.gz
+#   python backup.py restaurar backup.ndjson.gz --perfil NOVO_ID [--substituir]
+
+FORMATO_NDJSON = 'ndjson'
+FORMATO_PARQUET = 'parquet'
+VERSAO_FORMATO = 1
+BLOCO_RESTAURO = 2000
+ARQUIVO_PERFIL_PARQUET = 'perfil.json'
+COLUNA_ID = 'id'
+COLUNA_EXTRAS = '_extras'
+NOME_ARQUIVO_CREDENCIAL = 'firebase_credentials.json'
+
+PAPEL_DASHBOARD = 'dashboard'
+PAPEL_HISTORICO = 'historico'
+PAPEL_HISTORICO_TEMPO = 'historico_tempo'
+PAPEL_CATALOGO = 'catalogo'
+PAPEL_RESUMOS_DIARIOS = 'resumos_diarios'
+PAPEL_RESUMOS_SEMANAIS = 'resumos_semanais'
+PAPEIS = [PAPEL_DASHBOARD, PAPEL_HISTORICO, PAPEL_HISTORICO_TEMPO, PAPEL_CATALOGO,
+          PAPEL_RESUMOS_DIARIOS, PAPEL_RESUMOS_SEMANAIS]
+
+
+def colecoes_perfil(perfil):
+    """Devolve {papel: nome da coleção} de todas as coleções de um perfil."""
+    return {
+        PAPEL_DASHBOARD: perfil['colecao_dashboard'],
+        PAPEL_HISTORICO: perfil['colecao_historico'],
+        PAPEL_HISTORICO_TEMPO: repositorio.colecao_historico_tempo(perfil),
+        PAPEL_CATALOGO: repositorio.colecao_catalogo(perfil['id_documento']),
+        PAPEL_RESUMOS_DIARIOS: repositorio.colecao_resumos(perfil, repositorio.PERIODO_DIA),
+        PAPEL_RESUMOS_SEMANAIS: repositorio.colecao_resumos(perfil, repositorio.PERIODO_SEMANA),
+    }
+
+def _codificar(valor):
+    if isinstance(valor, datetime):
+        return {'$data': valor.isoformat()}
+    raise TypeError(f"Tipo não suportado no backup: {type(valor).__name__}")
+
+def _descodificar(objeto):
+    if len(objeto) == 1 and '$data' in objeto:
+        return datetime.fromisoformat(objeto['$data'])
+    return objeto
+
+def _json(dados):
+    return json.dumps(dados, default=_codificar, ensure_ascii=False)
+
+def _abrir_texto(caminho, modo):
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, modo + 't', encoding='utf-8')
+    return open(caminho, modo, encoding='utf-8')
+
+def _esquema_parquet(papel):
+    """Devolve {campo: tipo do Arrow} das colunas tipadas de um papel no formato parquet."""
+    import pyarrow as pa
+    inteiro, real, texto, data = pa.int64(), pa.float64(), pa.string(), pa.timestamp('us')
+    if papel == PAPEL_DASHBOARD:
+        return {'ID': inteiro, 'Disciplina': texto, 'Tópico do Edital': texto, 'Teoria (T)': texto,
+                'Domínio': texto, '%': real, 'Total_Questoes_Topico': inteiro, 'Total_Acertos_Topico': inteiro,
+                'Ultima_Medicao': texto}
+    if papel == PAPEL_HISTORICO:
+        return {'ID_Topico': inteiro, 'Data': texto, repositorio.CAMPO_DATA: data,
+                'Total_Questoes': inteiro, 'Acertos': inteiro, '%': real}
+    if papel == PAPEL_HISTORICO_TEMPO:
+        return {'Disciplina': texto, 'Data': texto, repositorio.CAMPO_DATA: data, 'Tempo_Estudado_Minutos': inteiro}
+    if papel == PAPEL_CATALOGO:
+        return {'Parte': inteiro, 'IDs': pa.list_(inteiro), 'Disciplinas': pa.list_(texto), 'Topicos': pa.list_(texto)}
+    metricas = {m: inteiro for m in repositorio.METRICAS_RESUMO}
+    return dict({'Inicio': data}, **metricas, Disciplinas=pa.map_(texto, pa.struct(list(metricas.items()))))
+
+def _cabe(valor, tipo):
+    """Indica se um valor pode ser guardado numa coluna do tipo indicado e voltar exatamente igual."""
+    import pyarrow as pa
+    if pa.types.is_int64(tipo):
+        return type(valor) is int and -2**63 <= valor < 2**63
+    if pa.types.is_float64(tipo):
+        return type(valor) is float
+    if pa.types.is_string(tipo):
+        return isinstance(valor, str)
+    if pa.types.is_timestamp(tipo):
+        return isinstance(valor, datetime)
+    if pa.types.is_list(tipo):
+        return isinstance(valor, list) and all(_cabe(v, tipo.value_type) for v in valor)
+    if pa.types.is_map(tipo):
+        return isinstance(valor, dict) and all(
+            _cabe(chave, tipo.key_type) and _cabe(v, tipo.item_type) for chave, v in valor.items())
+    if pa.types.is_struct(tipo):
+        campos = {tipo.field(i).name: tipo.field(i).type for i in range(tipo.num_fields)}
+        return isinstance(valor, dict) and all(
+            chave in campos and _cabe(v, campos[chave]) for chave, v in valor.items())
+    return False
+
+def _para_arrow(valor, tipo):
+    import pyarrow as pa
+    if isinstance(valor, datetime) and valor.tzinfo is not None:
+        return valor.astimezone(timezone.utc).replace(tzinfo=None)
+    if pa.types.is_map(tipo):
+        return list(valor.items())  # o Arrow recebe os mapas como pares (chave, valor)
+    return valor
+
+def _de_arrow(valor, tipo):
+    import pyarrow as pa
+    if pa.types.is_map(tipo):
+        # As métricas ausentes de uma disciplina voltam como None no struct.
+        return {chave: {m: v for m, v in item.items() if v is not None} for chave, item in valor}
+    return valor
+
+def _tabela_parquet(pagina, esquema, campos):
+    """Converte uma página ({id: dados}) numa tabela do Arrow com as colunas do esquema."""
+    import pyarrow as pa
+    colunas = {campo: [None] * len(pagina) for campo in campos}
+    extras = [None] * len(pagina)
+    for posicao, dados in enumerate(pagina.values()):
+        resto = {}
+        for campo, valor in dados.items():
+            if campo in campos and valor is not None and _cabe(valor, campos[campo]):
+                colunas[campo][posicao] = _para_arrow(valor, campos[campo])
+            else:
+                resto[campo] = valor
+        if resto:
+            extras[posicao] = _json(resto)
+    return pa.table(dict({COLUNA_ID: list(pagina)}, **colunas, **{COLUNA_EXTRAS: extras}), schema=esquema)
+
+def _documento_parquet(linha, campos):
+    """Reconstrói (id, dados) a partir de uma linha lida de um ficheiro parquet."""
+    id_documento = linha.pop(COLUNA_ID)
+    extras = linha.pop(COLUNA_EXTRAS, None)
+    if 'dados' in linha:
+        # Backups anteriores às colunas tipadas: o documento inteiro em JSON.
+        return id_documento, json.loads(linha['dados'], object_hook=_descodificar)
+    dados = {campo: _de_arrow(valor, campos[campo]) for campo, valor in linha.items() if valor is not None}
+    if extras:
+        dados.update(json.loads(extras, object_hook=_descodificar))
+    return id_documento, dados
+
+def _formato(caminho, formato=None):
+    if formato:
+        return formato
+    return FORMATO_NDJSON if '.ndjson' in os.path.basename(caminho) or caminho.endswith('.gz') else FORMATO_PARQUET
+
+
+# --- EXPORTAÇÃO ---
+
+def exportar_perfil(db, id_perfil, destino, formato=None, ao_progredir=None):
+    """
+    Exporta um perfil e as suas coleções para `destino`, página a página.
+    Chama ao_progredir(papel, exportados) após cada página; devolve {papel: nº de documentos}.
+    """
+    perfil = db.ler(repositorio.COLECAO_PERFIS, id_perfil)
+    if perfil is None:
+        raise armazenamento.DocumentoInexistente(f"{repositorio.COLECAO_PERFIS}/{id_perfil}")
+    perfil['id_documento'] = id_perfil
+    cabecalho = {
+        'versao': VERSAO_FORMATO, 'perfil': id_perfil,
+        'exportado_em': datetime.now(timezone.utc).isoformat(),
+        'dados': {campo: valor for campo, valor in perfil.items() if campo != 'id_documento'},
+    }
+
+    def paginas(papel, colecao):
+        exportados = 0
+        for pagina in db.percorrer(colecao):
+            exportados += len(pagina)
+            yield pagina
+            if ao_progredir:
+                ao_progredir(papel, exportados)
+
+    contagens = {}
+    if _formato(destino, formato) == FORMATO_NDJSON:
+        with _abrir_texto(destino, 'w') as ficheiro:
+            ficheiro.write(_json(dict(cabecalho, tipo='perfil')) + '\n')
+            for papel, colecao in colecoes_perfil(perfil).items():
+                contagens[papel] = 0
+                for pagina in paginas(papel, colecao):
+                    for id_documento, dados in pagina.items():
+                        ficheiro.write(_json({'tipo': 'documento', 'colecao': papel, 'id': id_documento, 'dados': dados}) + '\n')
+                    contagens[papel] += len(pagina)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(destino, exist_ok=True)
+        with open(os.path.join(destino, ARQUIVO_PERFIL_PARQUET), 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write(_json(cabecalho))
+        for papel, colecao in colecoes_perfil(perfil).items():
+            contagens[papel] = 0
+            campos = _esquema_parquet(papel)
+            esquema = pa.schema([(COLUNA_ID, pa.string())] + list(campos.items()) + [(COLUNA_EXTRAS, pa.string())])
+            # Cada página é um row group: o ficheiro nunca está todo em memória.
+            with pq.ParquetWriter(os.path.join(destino, f"{papel}.parquet"), esquema, compression='zstd') as escritor:
+                for pagina in paginas(papel, colecao):
+                    escritor.write_table(_tabela_parquet(pagina, esquema, campos))
+                    contagens[papel] += len(pagina)
+    return contagens
+
+
+# --- RESTAURO ---
+
+def _ler_backup(origem, formato=None):
+    """Devolve (cabeçalho, gerador de (papel, id, dados)) de um backup, lido aos poucos."""
+    if _formato(origem, formato) == FORMATO_NDJSON:
+        ficheiro = _abrir_texto(origem, 'r')
+        cabecalho = json.loads(ficheiro.readline(), object_hook=_descodificar)
+
+        def documentos():
+            with ficheiro:
+                for linha in ficheiro:
+                    if linha.strip():
+                        registo = json.loads(linha, object_hook=_descodificar)
+                        yield registo['colecao'], registo['id'], registo['dados']
+        return cabecalho, documentos()
+
+    import pyarrow.parquet as pq
+    with open(os.path.join(origem, ARQUIVO_PERFIL_PARQUET), encoding='utf-8') as ficheiro:
+        cabecalho = json.loads(ficheiro.read(), object_hook=_descodificar)
+
+    def documentos():
+        for papel in PAPEIS:
+            caminho = os.path.join(origem, f"{papel}.parquet")
+            if not os.path.exists(caminho):
+                continue
+            campos = _esquema_parquet(papel)
+            for grupo in pq.ParquetFile(caminho).iter_batches(batch_size=BLOCO_RESTAURO):
+                for linha in grupo.to_pylist():
+                    yield (papel,) + _documento_parquet(linha, campos)
+    return cabecalho, documentos()
+
+def _esvaziar_colecao(db, colecao):
+    for pagina in db.percorrer(colecao, armazenamento.LIMITE_LOTE, campos=[]):
+        lote = db.lote()
+        for id_documento in pagina:
+            lote.apagar(colecao, id_documento)
+        lote.confirmar()
+
+def restaurar_perfil(db, origem, id_perfil=None, substituir=False, formato=None, ao_progredir=None):
+    """
+    Restaura um backup, com o ID original ou com `id_perfil`. Recusa-se a escrever sobre um perfil
+    existente, salvo com `substituir`, que primeiro esvazia as suas coleções. O documento do perfil
+    é gravado por último, como na importação do edital. Devolve {papel: nº de documentos}.
+    """
+    cabecalho, documentos = _ler_backup(origem, formato)
+    if cabecalho.get('versao') != VERSAO_FORMATO:
+        raise ValueError(f"Versão de backup não suportada: {cabecalho.get('versao')}.")
+    id_perfil = id_perfil or cabecalho['perfil']
+    if not substituir and db.ler(repositorio.COLECAO_PERFIS, id_perfil) is not None:
+        raise ValueError(f"O perfil '{id_perfil}' já existe. Use outro ID ou a opção de substituir.")
+
+    perfil_doc = dict(cabecalho['dados'])
+    perfil_doc['colecao_dashboard'] = f"dashboard_{id_perfil}"
+    perfil_doc['colecao_historico'] = f"historico_{id_perfil}"
+    destinos = colecoes_perfil(dict(perfil_doc, id_documento=id_perfil))
+    if substituir:
+        for colecao in destinos.values():
+            _esvaziar_colecao(db, colecao)
+
+    contagens = {}
+    bloco, papel_bloco = {}, None
+
+    def gravar_bloco():
+        importacao.gravar_documentos(db, destinos[papel_bloco], bloco)
+        contagens[papel_bloco] = contagens.get(papel_bloco, 0) + len(bloco)
+        if ao_progredir:
+            ao_progredir(papel_bloco, contagens[papel_bloco])
+
+    for papel, id_documento, dados in documentos:
+        if papel != papel_bloco or len(bloco) == BLOCO_RESTAURO:
+            if bloco:
+                gravar_bloco()
+            bloco, papel_bloco = {}, papel
+        bloco[id_documento] = dados
+    if bloco:
+        gravar_bloco()
+
+    db.gravar(repositorio.COLECAO_PERFIS, id_perfil, perfil_doc)
+    repositorio.invalidar(None, repositorio.COLECAO_PERFIS)
+    for colecao in destinos.values():
+        repositorio.invalidar(id_perfil, colecao)
+    return contagens
+
+
+# --- LINHA DE COMANDOS ---
+
+def conectar(credenciais=NOME_ARQUIVO_CREDENCIAL):
+    """Liga ao armazenamento de COACH_ARMAZENAMENTO; o Firestore usa o ficheiro de credenciais indicado."""
+    if armazenamento.backend_configurado() == armazenamento.BACKEND_FIRESTORE:
+        import firebase_admin
+        from firebase_admin import credentials
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(credenciais))
+    return armazenamento.conectar()
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Exporta e restaura perfis completos (perfil, dashboard, históricos e resumos).")
+    parser.add_argument('--credenciais', default=NOME_ARQUIVO_CREDENCIAL,
+                        help="Credenciais do Firestore (permite restaurar noutro projeto).")
+    parser.add_argument('--formato', choices=[FORMATO_NDJSON, FORMATO_PARQUET],
+                        help="Por omissão, ndjson para .ndjson/.gz e parquet para pastas.")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+    exportar = comandos.add_parser('exportar', help="Exporta um perfil.")
+    exportar.add_argument('perfil')
+    exportar.add_argument('destino')
+    restaurar = comandos.add_parser('restaurar', help="Restaura um perfil exportado.")
+    restaurar.add_argument('origem')
+    restaurar.add_argument('--perfil', help="ID do perfil restaurado (por omissão, o original).")
+    restaurar.add_argument('--substituir', action='store_true', help="Escreve sobre um perfil existente.")
+    args = parser.parse_args(argumentos)
+
+    db = conectar(args.credenciais)
+    repositorio.USAR_ESPELHO = False
+
+    def mostrar_progresso(papel, documentos):
+        print(f"\r{papel}: {documentos} documentos", end='', flush=True)
+
+    if args.comando == 'exportar':
+        contagens = exportar_perfil(db, args.perfil, args.destino, args.formato, mostrar_progresso)
+    else:
+        contagens = restaurar_perfil(db, args.origem, args.perfil, args.substituir, args.formato, mostrar_progresso)
+    print()
+    for papel, documentos in contagens.items():
+        print(f"- {papel}: {documentos} documentos")
+
+if __name__ == "__main__":
+    sys.exit(main())
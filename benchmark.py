@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import armazenamento
+import repositorio
+
+# --- BENCHMARK DOS CAMINHOS PRINCIPAIS COM PERFIS SINTÉTICOS ---
+#
+# Gera perfis com o formato gravado por criar_novo_perfil e pela página de
+# lançamento (dashboard, catálogo, históricos e resumos) num armazenamento
+# local ou no emulador do Firestore, e mede as operações de que as páginas
+# dependem. Os resultados vão para um ficheiro JSON, para comparar versões:
+#
+#   python benchmark.py --backend memoria --topicos 100 1000 --registros 1000 100000
+#   python benchmark.py --backend sqlite:/tmp/bench.db --comparar resultados_anteriores.json
+#   FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmark.py --backend firestore
+
+ARQUIVO_RESULTADOS = 'resultados_benchmark.json'
+TOPICOS_PADRAO = [100, 1000, 10000]
+REGISTROS_PADRAO = [1000, 100000]
+REPETICOES_PADRAO = 5
+TOPICOS_POR_SIMULADO = 10
+DISCIPLINAS = [
+    'Língua Portuguesa', 'Raciocínio Lógico', 'Direito Constitucional', 'Direito Administrativo',
+    'Informática', 'Legislação Específica', 'Conhecimentos Gerais', 'Administração Pública',
+]
+DIAS_DE_HISTORICO = 365
+TAMANHO_LOTE = 500
+
+
+# --- GERAÇÃO DOS DADOS SINTÉTICOS ---
+
+def _gravar_em_lotes(db, colecao, documentos):
+    lote, pendentes = db.lote(), 0
+    for id_documento, dados in documentos:
+        lote.gravar(colecao, id_documento, dados)
+        pendentes += 1
+        if pendentes == TAMANHO_LOTE:
+            lote.confirmar()
+            lote, pendentes = db.lote(), 0
+    if pendentes:
+        lote.confirmar()
+
+def gerar_perfil(db, n_topicos, n_registros, semente=42):
+    """
+    Grava um perfil sintético com n_topicos tópicos, n_registros lançamentos de questões e
+    n_registros // 4 sessões de tempo nos últimos DIAS_DE_HISTORICO dias. Devolve o perfil.
+    """
+    rng = np.random.default_rng(semente)
+    id_perfil = f"benchmark_{n_topicos}_{n_registros}"
+    colecao_dashboard = f"dashboard_{id_perfil}"
+    colecao_historico = f"historico_{id_perfil}"
+
+    ids = np.arange(1, n_topicos + 1)
+    disciplinas = np.array(DISCIPLINAS)[rng.integers(0, len(DISCIPLINAS), n_topicos)]
+
+    # Histórico de questões, com o formato gravado por lancar_simulado
+    hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    topicos_q = rng.integers(1, n_topicos + 1, n_registros)
+    questoes = rng.integers(5, 41, n_registros)
+    acertos = rng.binomial(questoes, rng.uniform(0.4, 0.95, n_registros))
+    dias_q = rng.integers(0, DIAS_DE_HISTORICO, n_registros)
+
+    def historico_questoes():
+        for i in range(n_registros):
+            data = hoje - timedelta(days=int(dias_q[i]))
+            yield f"q{i:08d}", {
+                'ID_Topico': int(topicos_q[i]),
+                'Data': data.strftime('%d/%m/%Y'),
+                repositorio.CAMPO_DATA: data,
+                'Total_Questoes': int(questoes[i]),
+                'Acertos': int(acertos[i]),
+                '%': acertos[i] / questoes[i] * 100,
+            }
+    _gravar_em_lotes(db, colecao_historico, historico_questoes())
+
+    # Histórico de tempo, com o formato gravado por registrar_tempo
+    n_sessoes = max(1, n_registros // 4)
+    disciplinas_t = np.array(DISCIPLINAS)[rng.integers(0, len(DISCIPLINAS), n_sessoes)]
+    minutos = rng.integers(1, 73, n_sessoes) * 5
+    dias_t = rng.integers(0, DIAS_DE_HISTORICO, n_sessoes)
+
+    def historico_tempo():
+        for i in range(n_sessoes):
+            data = hoje - timedelta(days=int(dias_t[i]))
+            yield f"t{i:08d}", {
+                'Disciplina': str(disciplinas_t[i]),
+                'Data': data.strftime('%d/%m/%Y'),
+                repositorio.CAMPO_DATA: data,
+                'Tempo_Estudado_Minutos': int(minutos[i]),
+            }
+    _gravar_em_lotes(db, f"historico_tempo_{id_perfil}", historico_tempo())
+
+    # Dashboard coerente com o histórico, com o formato gravado por criar_novo_perfil
+    total_q = np.bincount(topicos_q, weights=questoes, minlength=n_topicos + 1)[1:].astype(int)
+    total_a = np.bincount(topicos_q, weights=acertos, minlength=n_topicos + 1)[1:].astype(int)
+    percentual, dominio = repositorio.calcular_derivados(pd.Series(total_q), pd.Series(total_a))
+    df_edital = pd.DataFrame({
+        'Disciplina': disciplinas,
+        'Tópico do Edital': [f"Tópico sintético {i} do conteúdo programático" for i in ids],
+        'ID': ids,
+        'Teoria (T)': '[ ]',
+        'Domínio': dominio,
+        '%': percentual,
+        'Total_Questoes_Topico': total_q,
+        'Total_Acertos_Topico': total_a,
+        'Ultima_Medicao': '-',
+    })
+    _gravar_em_lotes(db, colecao_dashboard, (
+        (str(linha['ID']), linha) for linha in df_edital.to_dict('records')
+    ))
+    repositorio.gravar_catalogo(db, id_perfil, df_edital)
+
+    perfil = {
+        'nome': f"Benchmark {n_topicos} tópicos / {n_registros} registros", 'cargo': 'Sintético',
+        'ano': hoje.year, 'status': 'Arquivado', 'nota_final': 70.0,
+        'estrutura_prova': {disciplina: {'num_questoes': 10, 'peso': 1.0} for disciplina in DISCIPLINAS},
+        'colecao_dashboard': colecao_dashboard, 'colecao_historico': colecao_historico,
+        'datas_tipadas': True,
+    }
+    db.gravar(repositorio.COLECAO_PERFIS, id_perfil, perfil)
+    perfil['id_documento'] = id_perfil
+    return perfil
+
+
+# --- OPERAÇÕES MEDIDAS ---
+
+def _agregacoes_relatorios(df_resumo):
+    """Os mesmos agrupamentos que a página de Relatórios faz sobre os resumos diários."""
+    df_questoes = df_resumo[df_resumo['Total_Questoes'] > 0]
+    df_tempo = df_resumo[df_resumo['Tempo_Estudado_Minutos'] > 0]
+    por_disciplina = df_questoes.groupby('Disciplina', observed=True).agg(
+        Total_Questoes=('Total_Questoes', 'sum'), Total_Acertos=('Acertos', 'sum')
+    )
+    por_dia = df_questoes.groupby(df_questoes['Data'].dt.date).agg(
+        Total_Questoes=('Total_Questoes', 'sum'), Acertos=('Acertos', 'sum')
+    )
+    tempo = df_tempo.groupby('Disciplina', observed=True)['Tempo_Estudado_Minutos'].sum()
+    return por_disciplina, por_dia, tempo, df_tempo['Data'].nunique()
+
+def _invalidar_perfil(perfil):
+    id_perfil = perfil['id_documento']
+    for colecao in (perfil['colecao_dashboard'], perfil['colecao_historico'],
+                    repositorio.colecao_historico_tempo(perfil), repositorio.colecao_catalogo(id_perfil)):
+        repositorio.invalidar(id_perfil, colecao)
+    repositorio._invalidar_resumos(perfil)
+
+def operacoes(db, perfil, rng):
+    """Devolve [(nome, função)] das operações medidas; cada chamada parte de caches vazias."""
+    n_topicos = len(repositorio.carregar_catalogo(db, perfil))
+    documentos_dashboard = list(db.listar(perfil['colecao_dashboard']).values())
+    perfil_resumos = dict(perfil, resumos_disponiveis=True)
+    perfil_historico = dict(perfil, resumos_disponiveis=False)
+    desde_30_dias = datetime.now() - timedelta(days=30)
+
+    def dashboard_leitura():
+        _invalidar_perfil(perfil)
+        repositorio.carregar_dashboard_df(db, perfil)
+
+    def dashboard_normalizacao():
+        repositorio.normalizar_dashboard(documentos_dashboard)
+
+    def kpis():
+        _invalidar_perfil(perfil)
+        repositorio.carregar_kpis(db, perfil)
+
+    def relatorios_resumos():
+        _invalidar_perfil(perfil)
+        _agregacoes_relatorios(repositorio.carregar_resumos(db, perfil_resumos, repositorio.PERIODO_DIA))
+        _agregacoes_relatorios(repositorio.carregar_resumos(db, perfil_resumos, repositorio.PERIODO_DIA, desde=desde_30_dias))
+
+    def relatorios_historico():
+        _invalidar_perfil(perfil)
+        _agregacoes_relatorios(repositorio.carregar_resumos(db, perfil_historico, repositorio.PERIODO_DIA))
+        _agregacoes_relatorios(repositorio.carregar_resumos(db, perfil_historico, repositorio.PERIODO_DIA, desde=desde_30_dias))
+
+    def simulado(modo):
+        def lancar():
+            ids = rng.choice(np.arange(1, n_topicos + 1), size=min(TOPICOS_POR_SIMULADO, n_topicos), replace=False)
+            resultados = {int(id_topico): {'questoes': 20, 'acertos': int(rng.integers(0, 21))} for id_topico in ids}
+            repositorio.lancar_simulado(db, perfil_resumos, resultados, datetime.now(), modo=modo)
+        return lancar
+
+    def analise_final():
+        _invalidar_perfil(perfil)
+        repositorio.calcular_analise_final(perfil['estrutura_prova'], repositorio.carregar_dashboard_df(db, perfil))
+
+    return [
+        ('dashboard_leitura_normalizacao', dashboard_leitura),
+        ('dashboard_normalizacao', dashboard_normalizacao),
+        ('kpis_agregacao', kpis),
+        ('relatorios_resumos', relatorios_resumos),
+        ('relatorios_historico', relatorios_historico),
+        ('lancar_simulado_incremento', simulado(repositorio.MODO_INCREMENTO)),
+        ('lancar_simulado_transacao', simulado(repositorio.MODO_TRANSACAO)),
+        ('analise_final', analise_final),
+    ]
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        'repeticoes': repeticoes,
+        'min_s': min(tempos),
+        'mediana_s': statistics.median(tempos),
+        'media_s': statistics.fmean(tempos),
+        'max_s': max(tempos),
+    }
+
+
+# --- EXECUÇÃO ---
+
+def conectar(configuracao):
+    if configuracao.split(':', 1)[0] != armazenamento.BACKEND_FIRESTORE:
+        return armazenamento.conectar(configuracao)
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        # O benchmark grava milhões de documentos: nunca contra o projeto real.
+        raise SystemExit("O backend 'firestore' só corre contra o emulador (defina FIRESTORE_EMULATOR_HOST).")
+    from google.cloud import firestore as cloud_firestore
+    projeto = os.environ.get('GCLOUD_PROJECT', 'coach-benchmark')
+    return armazenamento.ArmazenamentoFirestore(cloud_firestore.Client(project=projeto))
+
+def _versao_codigo():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+def executar(configuracao, lista_topicos, lista_registros, repeticoes):
+    db = conectar(configuracao)
+    # Leituras a frio: cada repetição mede o custo completo, sem listeners.
+    repositorio.USAR_ESPELHO = False
+    rng = np.random.default_rng(7)
+
+    resultados = []
+    for n_topicos in lista_topicos:
+        for n_registros in lista_registros:
+            print(f"\n[{n_topicos} tópicos, {n_registros} registros] a gerar dados...", flush=True)
+            inicio = time.perf_counter()
+            perfil = gerar_perfil(db, n_topicos, n_registros)
+            geracao = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            repositorio.reconstruir_resumos(db, perfil)
+            reconstrucao = time.perf_counter() - inicio
+            cenario = {'topicos': n_topicos, 'registros': n_registros}
+            resultados.append({'cenario': cenario, 'operacao': 'geracao_dados', **medida_unica(geracao)})
+            resultados.append({'cenario': cenario, 'operacao': 'reconstruir_resumos', **medida_unica(reconstrucao)})
+
+            for nome, funcao in operacoes(db, perfil, rng):
+                medida = medir(funcao, repeticoes)
+                resultados.append({'cenario': cenario, 'operacao': nome, **medida})
+                print(f"  {nome:<32} mediana {medida['mediana_s'] * 1000:10.2f} ms", flush=True)
+
+    return {
+        'gerado_em': datetime.now(timezone.utc).isoformat(),
+        'versao_codigo': _versao_codigo(),
+        'backend': configuracao,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'resultados': resultados,
+    }
+
+def medida_unica(segundos):
+    return {'repeticoes': 1, 'min_s': segundos, 'mediana_s': segundos, 'media_s': segundos, 'max_s': segundos}
+
+def comparar(atual, anterior):
+    """Mostra, por cenário e operação, a razão entre as medianas atual e anterior."""
+    referencia = {
+        (r['cenario']['topicos'], r['cenario']['registros'], r['operacao']): r['mediana_s']
+        for r in anterior.get('resultados', [])
+    }
+    print(f"\nComparação com {anterior.get('versao_codigo') or 'a execução anterior'} (mediana atual / anterior):")
+    for r in atual['resultados']:
+        chave = (r['cenario']['topicos'], r['cenario']['registros'], r['operacao'])
+        if referencia.get(chave):
+            razao = r['mediana_s'] / referencia[chave]
+            alerta = '  <-- regressão' if razao > 1.2 else ''
+            print(f"  {chave[0]:>6} / {chave[1]:>8}  {chave[2]:<32} {razao:6.2f}x{alerta}")
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos principais com perfis sintéticos.")
+    parser.add_argument('--backend', default=armazenamento.BACKEND_MEMORIA,
+                        help="memoria, sqlite[:caminho] ou firestore (só com FIRESTORE_EMULATOR_HOST).")
+    parser.add_argument('--topicos', type=int, nargs='+', default=TOPICOS_PADRAO)
+    parser.add_argument('--registros', type=int, nargs='+', default=REGISTROS_PADRAO)
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES_PADRAO)
+    parser.add_argument('--saida', default=ARQUIVO_RESULTADOS)
+    parser.add_argument('--comparar', help="Ficheiro de resultados anterior para comparar.")
+    args = parser.parse_args(argumentos)
+
+    relatorio = executar(args.backend, args.topicos, args.registros, args.repeticoes)
+    with open(args.saida, 'w', encoding='utf-8') as ficheiro:
+        json.dump(relatorio, ficheiro, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em '{args.saida}'.")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as ficheiro:
+            comparar(relatorio, json.load(ficheiro))
+
+if __name__ == "__main__":
+    sys.exit(main())
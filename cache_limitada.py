@@ -0,0 +1,202 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# --- CACHE COM ORÇAMENTO DE MEMÓRIA ---
+#
+# A cache dos valores derivados do repositório (DataFrames dos históricos e do
+# dashboard, indicadores, catálogos) é partilhada por todas as sessões do
+# servidor. Sem limite, cresce com o número de perfis abertos até esgotar a
+# memória do contentor.
+#
+# CacheLimitada mede cada valor ao guardá-lo (memory_usage(deep=True) nos
+# DataFrames) e, quando a ocupação passa do orçamento, despeja primeiro o
+# perfil usado há mais tempo, com todas as suas entradas. O orçamento é lido
+# de COACH_CACHE_MB (ORCAMENTO_PADRAO_MB por omissão).
+#
+# DADOS é a instância partilhada pelo repositório e pelos espelhos das coleções
+# (ver espelho.py), para que ambos contem no mesmo orçamento: um espelho
+# despejado fecha o seu listener.
+
+VARIAVEL_AMBIENTE = 'COACH_CACHE_MB'
+ORCAMENTO_PADRAO_MB = 256
+
+_lock = threading.Lock()
+_caches = {}  # nome -> CacheLimitada, para estatisticas()
+
+
+def orcamento_configurado():
+    """Devolve o orçamento, em bytes, pedido em COACH_CACHE_MB."""
+    valor = os.environ.get(VARIAVEL_AMBIENTE, '').strip()
+    megabytes = float(valor) if valor else ORCAMENTO_PADRAO_MB
+    return int(megabytes * 1024 * 1024)
+
+def tamanho_em_bytes(valor):
+    """Estima a memória ocupada por um valor, incluindo o conteúdo dos DataFrames e dos contentores."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True, index=True).sum())
+    if isinstance(valor, (pd.Series, pd.Index)):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(chave) + tamanho_em_bytes(v) for chave, v in valor.items())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+class CacheLimitada:
+    """
+    Dicionário de entradas limitado a `orcamento` bytes, com despejo LRU por perfil. As chaves são
+    tuplos cujo primeiro elemento é o id do perfil. ao_despejar(valor) é chamado para cada entrada
+    despejada por falta de espaço, fora do lock interno.
+    """
+
+    def __init__(self, nome, orcamento=None, medir=tamanho_em_bytes, ao_despejar=None):
+        self.nome = nome
+        self.orcamento = orcamento_configurado() if orcamento is None else orcamento
+        self._medir = medir
+        self._ao_despejar = ao_despejar
+        self._lock = threading.RLock()
+        self._entradas = {}            # chave -> (valor, bytes)
+        self._perfis = OrderedDict()   # id do perfil -> OrderedDict(chave -> None); o mais antigo primeiro
+        self.ocupacao = 0
+        self.despejos = 0              # perfis despejados por falta de espaço
+        self.entradas_despejadas = 0
+        self.rejeitadas = 0            # entradas maiores que o orçamento, nunca guardadas
+        with _lock:
+            _caches[nome] = self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entradas)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entradas))
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._entradas
+
+    def perfis(self):
+        """Devolve os ids dos perfis com entradas, do usado há mais tempo para o mais recente."""
+        with self._lock:
+            return list(self._perfis)
+
+    def get(self, chave, padrao=None):
+        """Devolve o valor de uma entrada e marca-a, e ao seu perfil, como usados agora."""
+        with self._lock:
+            if chave not in self._entradas:
+                return padrao
+            perfil = self._perfis[chave[0]]
+            perfil.move_to_end(chave)
+            self._perfis.move_to_end(chave[0])
+            return self._entradas[chave][0]
+
+    def __setitem__(self, chave, valor):
+        tamanho = self._medir(valor)
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            if tamanho > self.orcamento:
+                self.rejeitadas += 1
+                return
+            self._entradas[chave] = (valor, tamanho)
+            self._perfis.setdefault(chave[0], OrderedDict())[chave] = None
+            self._perfis.move_to_end(chave[0])
+            self.ocupacao += tamanho
+            despejados = self._despejar(chave[0])
+        self._notificar(despejados)
+
+    def __delitem__(self, chave):
+        with self._lock:
+            self._remover(chave)
+
+    def pop(self, chave, padrao=None):
+        """Remove uma entrada e devolve o seu valor, sem chamar ao_despejar."""
+        with self._lock:
+            if chave not in self._entradas:
+                return padrao
+            return self._remover(chave)
+
+    def redimensionar(self, chave, tamanho):
+        """
+        Atualiza o tamanho de uma entrada que cresce depois de guardada (por ex. um espelho) e despeja
+        o que for preciso. Devolve False se a entrada deixou de caber no orçamento e foi removida.
+        """
+        with self._lock:
+            if chave not in self._entradas:
+                return False
+            valor, anterior = self._entradas[chave]
+            if tamanho > self.orcamento:
+                self._remover(chave)
+                self.rejeitadas += 1
+                despejados = [valor]
+            else:
+                self._entradas[chave] = (valor, tamanho)
+                self.ocupacao += tamanho - anterior
+                despejados = self._despejar(chave[0])
+            cabe = chave in self._entradas
+        self._notificar(despejados)
+        return cabe
+
+    def _remover(self, chave):
+        valor, tamanho = self._entradas.pop(chave)
+        self.ocupacao -= tamanho
+        perfil = self._perfis[chave[0]]
+        del perfil[chave]
+        if not perfil:
+            del self._perfis[chave[0]]
+        return valor
+
+    def _despejar(self, perfil_atual):
+        despejados = []
+        # Primeiro os outros perfis, do usado há mais tempo para o mais recente.
+        while self.ocupacao > self.orcamento and len(self._perfis) > 1:
+            perfil = next(id_perfil for id_perfil in self._perfis if id_perfil != perfil_atual)
+            chaves = list(self._perfis[perfil])
+            despejados.extend(self._remover(chave) for chave in chaves)
+            self.despejos += 1
+            self.entradas_despejadas += len(chaves)
+        # Um só perfil acima do orçamento: as suas entradas mais antigas.
+        while self.ocupacao > self.orcamento:
+            chave = next(iter(self._perfis[perfil_atual]))
+            despejados.append(self._remover(chave))
+            self.entradas_despejadas += 1
+        return despejados
+
+    def _notificar(self, despejados):
+        if self._ao_despejar is not None:
+            for valor in despejados:
+                self._ao_despejar(valor)
+
+    def estatisticas(self):
+        """Ocupação e contadores da cache."""
+        with self._lock:
+            return {
+                'orcamento_bytes': self.orcamento,
+                'ocupacao_bytes': self.ocupacao,
+                'entradas': len(self._entradas),
+                'perfis': len(self._perfis),
+                'despejos': self.despejos,
+                'entradas_despejadas': self.entradas_despejadas,
+                'rejeitadas': self.rejeitadas,
+            }
+
+
+def estatisticas():
+    """Devolve {nome: estatísticas} de todas as caches criadas no processo."""
+    with _lock:
+        caches = list(_caches.values())
+    return {cache.nome: cache.estatisticas() for cache in caches}
+
+
+def _fechar_despejado(valor):
+    # Os espelhos guardados na cache fecham o listener quando são despejados.
+    fechar = getattr(valor, 'fechar', None)
+    if fechar is not None:
+        fechar()
+
+DADOS = CacheLimitada('dados', ao_despejar=_fechar_despejado)
@@ -1,10 +1,14 @@
 # Importando as bibliotecas necessárias
 import pandas as pd
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials
 from datetime import datetime
 import sys
 import os
+import armazenamento
+import importacao
+import instrumentacao
+import repositorio
 
 # --- CONFIGURAÇÕES DE EXIBIÇÃO DO PANDAS ---
 pd.set_option('display.width', 1000)
@@ -16,12 +20,14 @@ NOME_ARQUIVO_CREDENCIAL = 'firebase_credentials.json'
 
 # --- INICIALIZAÇÃO DO FIREBASE ---
 def inicializar_firebase():
-    """Inicializa a conexão com o Firebase."""
+    """Inicializa a conexão com o Firebase, ou com o armazenamento local escolhido em COACH_ARMAZENAMENTO."""
     try:
+        if armazenamento.backend_configurado() != armazenamento.BACKEND_FIRESTORE:
+            return armazenamento.conectar()
         if not firebase_admin._apps:
             cred = credentials.Certificate(NOME_ARQUIVO_CREDENCIAL)
             firebase_admin.initialize_app(cred)
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception as e:
         print(f"ERRO CRÍTICO: Não foi possível conectar ao Firebase. Verifique o arquivo '{NOME_ARQUIVO_CREDENCIAL}'.")
         print(f"Detalhe do erro: {e}")
@@ -29,42 +35,15 @@ def inicializar_firebase():
 
 db = inicializar_firebase()
 
+# A CLI executa ações pontuais: ler a coleção diretamente sai mais barato do que manter listeners.
+repositorio.USAR_ESPELHO = False
+
 # --- FUNÇÕES DE DADOS (SENSÍVEIS AO PERFIL) ---
 def carregar_dashboard(perfil):
     """Carrega os dados do Firebase para um perfil específico e retorna um DataFrame."""
-    colecao_dashboard = perfil['colecao_dashboard']
     print(f"\nCarregando dashboard da nuvem (Perfil: {perfil['nome']})...")
     try:
-        docs = db.collection(colecao_dashboard).stream()
-        lista_de_topicos = [doc.to_dict() for doc in docs]
-        
-        if not lista_de_topicos:
-            return pd.DataFrame()
-
-        df_bruto = pd.DataFrame(lista_de_topicos)
-        colunas_finais = ['ID', 'Disciplina', 'Tópico do Edital', 'Teoria (T)', 'Qsts', 'Acertos', 'Domínio', '%', 'Últ. Medição']
-        df_final = pd.DataFrame()
-
-        df_bruto.rename(columns={'Total_Questoes_Topico': 'Qsts', 
-                                 'Total_Acertos_Topico': 'Acertos', 
-                                 'Ultima_Medicao': 'Últ. Medição'}, inplace=True, errors='ignore')
-
-        for col in colunas_finais:
-            if col in df_bruto.columns:
-                df_final[col] = df_bruto[col]
-            else:
-                df_final[col] = 0 if col in ['Qsts', 'Acertos', '%'] else '-'
-        
-        df_final.fillna({'Qsts': 0, 'Acertos': 0, '%': 0}, inplace=True)
-        df_final.fillna('-', inplace=True)
-        
-        for col in ['ID', '%', 'Qsts', 'Acertos']:
-             df_final[col] = pd.to_numeric(df_final[col], errors='coerce').fillna(0)
-
-        df_final['ID'] = df_final['ID'].astype(int)
-        df_final = df_final.sort_values(by='ID').reset_index(drop=True)
-        return df_final[colunas_finais]
-
+        return repositorio.carregar_dashboard_df(db, perfil)
     except Exception as e:
         print(f"Erro ao carregar dados do Firebase: {e}")
         return pd.DataFrame()
@@ -88,71 +67,74 @@ def visualizar_dashboard(df_dashboard):
         print(f"Percentual de Acerto Geral: {percentual_geral}%")
     print("-------------------------------------------------\n")
 
-def get_nivel_dominio(percentual):
-    if percentual >= 90: return '[Domínio Mestre]'
-    elif 80 <= percentual < 90: return '[Domínio Sólido]'
-    elif 65 <= percentual < 80: return '[Em Desenvolvimento]'
-    else: return '[Revisão Urgente]'
-
 # --- FUNÇÕES DO PERFIL ATIVO ---
 
-@firestore.transactional
-def transacao_lancar_simulado(transaction, doc_ref, novas_questoes, novos_acertos):
-    """Executa a atualização de um tópico do simulado dentro de uma transação."""
-    snapshot = doc_ref.get(transaction=transaction)
-    
-    total_questoes_antigo = snapshot.get('Total_Questoes_Topico') or 0
-    total_acertos_antigo = snapshot.get('Total_Acertos_Topico') or 0
-
-    novo_total_questoes = total_questoes_antigo + novas_questoes
-    novo_total_acertos = total_acertos_antigo + novos_acertos
-    
-    percentual_geral = round((novo_total_acertos / novo_total_acertos) * 100, 2) if novo_total_acertos > 0 else 0
-    
-    dados_para_atualizar = {
-        'Total_Questoes_Topico': novo_total_questoes,
-        'Total_Acertos_Topico': novo_total_acertos,
-        '%': percentual_geral,
-        'Domínio': get_nivel_dominio(percentual_geral),
-        'Ultima_Medicao': datetime.now().strftime('%d/%m/%Y')
-    }
-    transaction.update(doc_ref, dados_para_atualizar)
-
 def lancar_simulado(perfil):
     """Registra o resultado de um simulado para o perfil ativo."""
     print("\n--- LANÇAMENTO DE RESULTADO DE SIMULADO ---")
     try:
         ids_str = input("Digite os IDs dos tópicos, separados por vírgula (ex: 1,2,3): ")
         ids_avaliados = [int(i.strip()) for i in ids_str.split(',')]
-        
-        colecao_dashboard = perfil['colecao_dashboard']
-        colecao_historico = perfil['colecao_historico']
 
+        resultados = {}
         for id_topico in ids_avaliados:
             total_questoes = int(input(f"Quantas questões do tópico ID {id_topico}? "))
             acertos = int(input(f"Quantas você acertou para o tópico ID {id_topico}? "))
-            
-            if total_questoes > 0:
-                doc_ref = db.collection(colecao_dashboard).document(str(id_topico))
-                transaction = db.transaction()
-                transacao_lancar_simulado(transaction, doc_ref, total_questoes, acertos)
-
-                db.collection(colecao_historico).add({
-                    'ID_Topico': id_topico,
-                    'Data': datetime.now().strftime('%d/%m/%Y'),
-                    'Total_Questoes': total_questoes,
-                    'Acertos': acertos,
-                    '%': round((acertos / total_questoes) * 100, 2)
-                })
-                print(f"-> Tópico {id_topico} atualizado com sucesso!")
-            else:
-                print(f"Número de questões para o tópico {id_topico} deve ser maior que zero.")
+            resultados[id_topico] = {'questoes': total_questoes, 'acertos': acertos}
+
+        erros = repositorio.validar_resultados(resultados)
+        if erros:
+            for erro in erros:
+                print(erro)
+            print("Nenhum tópico foi gravado. Corrija os valores e tente novamente.")
+            return
+
+        # Todos os tópicos são gravados num único commit atómico.
+        ids_atualizados = repositorio.lancar_simulado(db, perfil, resultados, datetime.now())
+        repositorio.reconciliar_derivados(db, perfil, ids_atualizados)
+        print(f"-> {len(resultados)} tópico(s) atualizado(s) com sucesso!")
         print("\nSimulado registrado e sincronizado!")
-    except ValueError:
-        print("Entrada inválida. Certifique-se de digitar os números corretamente.")
+    except ValueError as e:
+        print(f"Entrada inválida. Certifique-se de digitar os números corretamente. ({e})")
     except Exception as e:
         print(f"Ocorreu um erro: {e}")
 
+def importar_lancamentos(perfil):
+    """Importa de um arquivo CSV/JSON vários resultados de simulado ou sessões de estudo."""
+    print("\n--- IMPORTAÇÃO DE LANÇAMENTOS ---")
+    print("[Q] Resultados de simulado (colunas: Data, ID_Topico, Questoes, Acertos)")
+    print("[T] Sessões de estudo (colunas: Data, Disciplina, Minutos)")
+    tipo = {'Q': importacao.TIPO_QUESTOES, 'T': importacao.TIPO_TEMPO}.get(input("Escolha o tipo: ").upper())
+    if tipo is None:
+        print("Opção inválida.")
+        return
+    caminho = input("Insira o caminho completo para o arquivo: ")
+
+    try:
+        df_lancamentos = importacao.carregar_lancamentos(db, perfil, caminho, tipo)
+    except importacao.ErroValidacao as e:
+        for erro in e.erros:
+            print(erro)
+        print("Nenhum lançamento foi gravado. Corrija o arquivo e tente novamente.")
+        return
+    except Exception as e:
+        print(f"Não foi possível ler o arquivo: {e}")
+        return
+
+    def mostrar_progresso(gravados, total):
+        print(f"\rA gravar: {gravados}/{total}", end='', flush=True)
+
+    try:
+        if tipo == importacao.TIPO_QUESTOES:
+            ids_atualizados = repositorio.lancar_questoes_em_massa(db, perfil, df_lancamentos, mostrar_progresso)
+            repositorio.reconciliar_derivados(db, perfil, ids_atualizados)
+            print(f"\n-> {len(df_lancamentos)} lançamentos gravados em {len(ids_atualizados)} tópico(s).")
+        else:
+            gravadas = repositorio.registrar_tempo_em_massa(db, perfil, df_lancamentos, mostrar_progresso)
+            print(f"\n-> {gravadas} sessões de estudo gravadas.")
+    except Exception as e:
+        print(f"\nOcorreu um erro: {e}")
+
 # --- FUNÇÃO DE CRIAÇÃO DE PERFIL ---
 def criar_novo_perfil():
     """Guia o usuário para criar um novo perfil de concurso."""
@@ -169,7 +151,7 @@ def criar_novo_perfil():
         except ValueError:
             print("ERRO: O ano deve ser um número inteiro. Tente novamente.")
 
-    id_perfil = f"{nome.lower().replace(' ', '_').replace('/', '')}_{cargo.lower().replace(' ', '_')}_{ano}"
+    id_perfil = importacao.id_perfil(nome, cargo, ano)
     
     print("\nAgora, vamos importar o conteúdo programático.")
     print("Você precisará de um arquivo CSV com duas colunas, com os cabeçalhos exatos: Disciplina,Tópico do Edital")
@@ -179,10 +161,7 @@ def criar_novo_perfil():
         if not os.path.exists(caminho_csv):
             raise FileNotFoundError("Arquivo CSV não encontrado no caminho especificado.")
 
-        df_edital = pd.read_csv(caminho_csv, encoding='latin-1', sep=';')
-        
-        if not all(col in df_edital.columns for col in ['Disciplina', 'Tópico do Edital']):
-            raise ValueError("O arquivo CSV deve conter as colunas 'Disciplina' e 'Tópico do Edital'.")
+        df_edital = importacao.ler_edital_csv(caminho_csv)
 
         # CADASTRO DA ESTRUTURA DA PROVA
         print("\n--- CADASTRO DA ESTRUTURA DA PROVA ---")
@@ -199,15 +178,6 @@ def criar_novo_perfil():
                 except ValueError:
                     print("ERRO: O número de questões e o peso devem ser números. Tente novamente.")
 
-        # Cria a estrutura do dashboard
-        df_edital['ID'] = df_edital.index + 1
-        df_edital['Teoria (T)'] = '[ ]'
-        df_edital['Domínio'] = '[Não Medido]'
-        df_edital['%'] = 0.0
-        df_edital['Total_Questoes_Topico'] = 0
-        df_edital['Total_Acertos_Topico'] = 0
-        df_edital['Ultima_Medicao'] = '-'
-        
         colecao_dashboard = f"dashboard_{id_perfil}"
         colecao_historico = f"historico_{id_perfil}"
         
@@ -215,18 +185,19 @@ def criar_novo_perfil():
             'nome': nome, 'cargo': cargo, 'ano': ano, 'status': 'Ativo',
             'nota_final': None, 'estrutura_prova': estrutura_prova,
             'colecao_dashboard': colecao_dashboard,
-            'colecao_historico': colecao_historico
+            'colecao_historico': colecao_historico,
+            'resumos_disponiveis': True,
+            'datas_tipadas': True
         }
-        db.collection('perfis_concursos').document(id_perfil).set(perfil_doc)
 
-        batch = db.batch()
-        for _, row in df_edital.iterrows():
-            doc_ref = db.collection(colecao_dashboard).document(str(row['ID']))
-            batch.set(doc_ref, row.to_dict())
-        batch.commit()
+        def mostrar_progresso(gravados, total):
+            print(f"\rA importar tópicos: {gravados}/{total}", end='', flush=True)
+
+        importados = importacao.importar_edital(db, id_perfil, perfil_doc, df_edital, mostrar_progresso)
+        print()
         
         print(f"\nPerfil '{nome} - {cargo}' criado com sucesso!")
-        print(f"{len(df_edital)} tópicos foram importados para o seu novo dashboard.")
+        print(f"{importados} tópicos foram importados para o seu novo dashboard.")
 
     except Exception as e:
         print(f"\n--- OCORREU UM ERRO INESPERADO ---")
@@ -241,16 +212,30 @@ def menu_perfil_ativo(perfil):
         print(f"\n=== Perfil Ativo: {perfil['nome']} - {perfil['cargo']} ({perfil['ano']}) ===")
         print("[1] Visualizar Dashboard Completo")
         print("[2] Lançar Resultado de Simulado")
-        print("[3] Voltar para a seleção de perfis")
+        print("[3] Reconstruir resumos diários e semanais")
+        print("[4] Importar lançamentos de um arquivo (CSV/JSON)")
+        print("[5] Voltar para a seleção de perfis")
         
         escolha = input("Escolha uma opção: ")
 
         if escolha == '1':
-            df_dashboard_atualizado = carregar_dashboard(perfil)
-            visualizar_dashboard(df_dashboard_atualizado)
+            with instrumentacao.medir_acao("cli:visualizar_dashboard"):
+                df_dashboard_atualizado = carregar_dashboard(perfil)
+                visualizar_dashboard(df_dashboard_atualizado)
         elif escolha == '2':
-            lancar_simulado(perfil)
+            with instrumentacao.medir_acao("cli:lancar_simulado"):
+                lancar_simulado(perfil)
         elif escolha == '3':
+            with instrumentacao.medir_acao("cli:reconstruir_resumos"):
+                try:
+                    gravados = repositorio.reconstruir_resumos(db, perfil)
+                    print(f"\n{gravados} documentos de resumo gravados!")
+                except Exception as e:
+                    print(f"\nErro ao reconstruir os resumos: {e}")
+        elif escolha == '4':
+            with instrumentacao.medir_acao("cli:importar_lancamentos"):
+                importar_lancamentos(perfil)
+        elif escolha == '5':
             break
         else:
             print("Opção inválida.")
@@ -270,31 +255,13 @@ def gerar_relatorio_final(perfil, df_dashboard):
         print("ERRO: A nota final da prova não foi registrada para este perfil.")
         return
 
-    resultados = []
-    nota_simulada_total = 0.0
-
-    for disciplina, dados_prova in estrutura_prova.items():
-        df_disciplina = df_dashboard[df_dashboard['Disciplina'] == disciplina]
-        
-        total_acertos_disciplina = df_disciplina['Acertos'].sum()
-        total_questoes_disciplina = df_disciplina['Qsts'].sum()
-
-        perf_estudos = (total_acertos_disciplina / total_questoes_disciplina * 100) if total_questoes_disciplina > 0 else 0
-        
-        num_questoes_prova = dados_prova.get('num_questoes', 0)
-        peso = dados_prova.get('peso', 1.0)
-        
-        pontuacao_maxima_disciplina = num_questoes_prova * peso
-        pontuacao_estimada = (perf_estudos / 100) * pontuacao_maxima_disciplina
-        nota_simulada_total += pontuacao_estimada
-
-        resultados.append({
-            'Disciplina': disciplina,
-            'Perf. Estudos (%)': f"{perf_estudos:.2f}",
-            'Pontuação Estimada': f"{pontuacao_estimada:.2f} de {pontuacao_maxima_disciplina:.2f}"
-        })
-
-    df_relatorio = pd.DataFrame(resultados)
+    df_pontuacao, nota_simulada_total = repositorio.calcular_analise_final(estrutura_prova, df_dashboard)
+    df_relatorio = pd.DataFrame({
+        'Disciplina': df_pontuacao['Disciplina'],
+        'Perf. Estudos (%)': df_pontuacao['Perf. Estudos (%)'].map(lambda v: f"{v:.2f}"),
+        'Pontuação Estimada': [f"{estimada:.2f} de {maxima:.2f}" for estimada, maxima in
+                               zip(df_pontuacao['Pontuação Estimada'], df_pontuacao['Pontuação Máxima'])]
+    })
     
     print(df_relatorio.to_string(index=False))
     print("---------------------------------------------------------------")
@@ -307,13 +274,11 @@ def gerenciar_perfis():
     """Permite visualizar e gerenciar todos os perfis de concurso."""
     while True:
         print("\n--- GERENCIADOR DE PERFIS (ARQUIVO) ---")
-        perfis_ref = db.collection('perfis_concursos').stream()
-        todos_perfis_docs = list(perfis_ref)
+        todos_perfis_docs = db.listar(repositorio.COLECAO_PERFIS)
         
         todos_perfis = {}
-        for i, doc in enumerate(todos_perfis_docs):
-            perfil_data = doc.to_dict()
-            perfil_data['id_documento'] = doc.id
+        for i, (id_documento, perfil_data) in enumerate(todos_perfis_docs.items()):
+            perfil_data['id_documento'] = id_documento
             todos_perfis[str(i+1)] = perfil_data
 
         if not todos_perfis:
@@ -347,8 +312,7 @@ def gerenciar_perfis():
                 if sub_escolha == '1':
                     # Lógica para REATIVAR
                     try:
-                        doc_ref = db.collection('perfis_concursos').document(perfil_selecionado['id_documento'])
-                        doc_ref.update({'status': 'Ativo'})
+                        db.atualizar(repositorio.COLECAO_PERFIS, perfil_selecionado['id_documento'], {'status': 'Ativo'})
                         print("\nPerfil reativado com sucesso!")
                     except Exception as e:
                         print(f"Erro ao reativar o perfil: {e}")
@@ -377,8 +341,7 @@ def gerenciar_perfis():
                                 print("ERRO: A nota deve ser um número. Tente novamente.")
                     
                     try:
-                        doc_ref = db.collection('perfis_concursos').document(perfil_selecionado['id_documento'])
-                        doc_ref.update({'status': 'Arquivado', 'nota_final': nota_final})
+                        db.atualizar(repositorio.COLECAO_PERFIS, perfil_selecionado['id_documento'], {'status': 'Arquivado', 'nota_final': nota_final})
                         print("\nPerfil arquivado com sucesso!")
                     except Exception as e:
                         print(f"Erro ao arquivar o perfil: {e}")
@@ -386,6 +349,45 @@ def gerenciar_perfis():
             print("Opção inválida.")
 
 
+# --- MIGRAÇÕES ---
+def migrar_datas():
+    """Grava a data de cada registro do histórico como timestamp, em todos os perfis (ativos e arquivados)."""
+    print("\n--- MIGRAÇÃO DAS DATAS DO HISTÓRICO ---")
+    try:
+        perfis = repositorio.carregar_perfis(db)
+    except Exception as e:
+        print(f"Erro ao carregar os perfis: {e}")
+        return
+    for perfil in perfis.values():
+        if perfil.get('datas_tipadas'):
+            print(f"- {perfil['nome']}: já migrado.")
+            continue
+        try:
+            atualizados = repositorio.migrar_datas_historico(db, perfil)
+            print(f"- {perfil['nome']}: {atualizados} registros atualizados.")
+        except repositorio.DatasInvalidas as e:
+            print(f"- {perfil['nome']}: {e}")
+        except Exception as e:
+            print(f"- {perfil['nome']}: erro na migração ({e}).")
+
+
+def reconciliar_contadores():
+    """Recalcula os contadores do dashboard a partir do histórico, em todos os perfis (em paralelo)."""
+    print("\n--- RECONCILIAÇÃO DOS CONTADORES DO DASHBOARD ---")
+    try:
+        perfis = repositorio.carregar_perfis(db)
+    except Exception as e:
+        print(f"Erro ao carregar os perfis: {e}")
+        return
+    resultados = repositorio.reconstruir_contadores_perfis(db, perfis)
+    for id_perfil, resultado in resultados.items():
+        nome = perfis[id_perfil]['nome']
+        if isinstance(resultado, Exception):
+            print(f"- {nome}: erro na reconciliação ({resultado}).")
+        else:
+            print(f"- {nome}: {resultado} tópicos corrigidos.")
+
+
 # --- NOVO MENU PRINCIPAL ---
 def main():
     if not db: return
@@ -393,13 +395,12 @@ def main():
     while True:
         print("\n=== GERENCIADOR DE PERFIS DE CONCURSO ===")
         
-        perfis_ref = db.collection('perfis_concursos').where(field_path='status', op_string='==', value='Ativo').stream()
-        perfis_ativos_docs = list(perfis_ref)
+        with instrumentacao.medir_acao("cli:menu_principal"):
+            perfis_ativos_docs = db.listar(repositorio.COLECAO_PERFIS, filtros=[('status', '==', 'Ativo')])
         
         perfis_ativos = {}
-        for i, doc in enumerate(perfis_ativos_docs):
-            perfil_data = doc.to_dict()
-            perfil_data['id_documento'] = doc.id
+        for i, (id_documento, perfil_data) in enumerate(perfis_ativos_docs.items()):
+            perfil_data['id_documento'] = id_documento
             perfis_ativos[str(i+1)] = perfil_data
 
         if perfis_ativos:
@@ -412,6 +413,8 @@ def main():
         print("-----------------------------------------")
         print("[N] Criar Novo Perfil de Concurso")
         print("[A] Acessar e Gerenciar Arquivo de Concursos")
+        print("[M] Migrar datas do histórico (todos os perfis)")
+        print("[R] Reconciliar contadores do dashboard (todos os perfis)")
         print("[S] Sair")
         
         escolha_main = input("Escolha uma opção: ").upper()
@@ -420,9 +423,17 @@ def main():
             perfil_selecionado = perfis_ativos[escolha_main]
             menu_perfil_ativo(perfil_selecionado)
         elif escolha_main == 'N':
-            criar_novo_perfil()
+            with instrumentacao.medir_acao("cli:criar_novo_perfil"):
+                criar_novo_perfil()
         elif escolha_main == 'A':
-            gerenciar_perfis()
+            with instrumentacao.medir_acao("cli:gerenciar_perfis"):
+                gerenciar_perfis()
+        elif escolha_main == 'M':
+            with instrumentacao.medir_acao("cli:migrar_datas"):
+                migrar_datas()
+        elif escolha_main == 'R':
+            with instrumentacao.medir_acao("cli:reconciliar_contadores"):
+                reconciliar_contadores()
         elif escolha_main == 'S':
             print("Bons estudos! Seus dados estão salvos e sincronizados na nuvem.")
             break
@@ -0,0 +1,150 @@
+import sys
+import threading
+import armazenamento
+import cache_limitada
+
+# --- ESPELHO EM MEMÓRIA DAS COLEÇÕES (ON_SNAPSHOT) ---
+#
+# Cada coleção espelhada é lida por completo uma única vez, na semeadura do
+# listener (Armazenamento.observar); a partir daí só os documentos alterados
+# atravessam a rede. O espelho é partilhado por todo o processo (todas as
+# sessões do Streamlit).
+#
+# Os espelhos ficam na mesma cache limitada dos valores derivados
+# (cache_limitada.DADOS), sob a chave (id do perfil, ESPELHO, coleção), com o
+# tamanho dos seus documentos. Contam assim no orçamento de COACH_CACHE_MB e são
+# despejados por perfil, juntamente com o resto dos dados desse perfil.
+
+ESPELHO = 'espelho'
+# Cada perfil espelha até seis coleções (dashboard, históricos de questões e de
+# tempo, catálogo e resumos diários e semanais), cada uma com o seu listener.
+# Para lá deste número de perfis, os espelhos do perfil usado há mais tempo são fechados.
+MAXIMO_PERFIS_ESPELHADOS = 8
+ESPERA_CARGA_INICIAL = 15  # segundos
+
+
+class EspelhoColecao:
+    """Mantém uma cópia local de uma coleção, atualizada pelos deltas do listener."""
+
+    def __init__(self, db, colecao):
+        self.colecao = colecao
+        self._documentos = {}
+        self._tamanhos = {}  # id -> bytes do documento
+        self.tamanho = 0
+        self._versao = 0
+        self._condicao = threading.Condition()
+        self._carregado = threading.Event()
+        self._falhou = False
+        # Com notificações síncronas o delta de uma escrita já chegou quando ela retorna.
+        self.sincrono = db.notificacoes_sincronas
+        self._observacao = db.observar(colecao, self._ao_receber_alteracoes)
+
+    def _ao_receber_alteracoes(self, alteracoes):
+        try:
+            with self._condicao:
+                for tipo, id_documento, dados in alteracoes:
+                    self.tamanho -= self._tamanhos.pop(id_documento, 0)
+                    if tipo == armazenamento.REMOVIDO:
+                        self._documentos.pop(id_documento, None)
+                    else:
+                        self._documentos[id_documento] = dados
+                        self._tamanhos[id_documento] = sys.getsizeof(id_documento) + cache_limitada.tamanho_em_bytes(dados)
+                        self.tamanho += self._tamanhos[id_documento]
+                self._versao += 1
+                self._condicao.notify_all()
+            self._carregado.set()
+        except Exception:
+            # Uma exceção aqui mata o listener; a partir daí o espelho deixa de ser usado.
+            self._falhou = True
+            raise
+
+    @property
+    def versao(self):
+        with self._condicao:
+            return self._versao
+
+    @property
+    def ativo(self):
+        return not self._falhou and self._observacao.ativo
+
+    def aguardar_carga(self, timeout=ESPERA_CARGA_INICIAL):
+        """Espera pela semeadura inicial do espelho."""
+        return self._carregado.wait(timeout)
+
+    def aguardar_versao(self, versao_minima, timeout):
+        """Espera até o espelho atingir uma versão, devolvendo False se o tempo esgotar."""
+        with self._condicao:
+            return self._condicao.wait_for(lambda: self._versao >= versao_minima, timeout)
+
+    def instantaneo(self):
+        """Devolve a versão e uma cópia consistente dos documentos ({id: dados})."""
+        with self._condicao:
+            return self._versao, dict(self._documentos)
+
+    def fechar(self):
+        try:
+            self._observacao.cancelar()
+        except Exception:
+            pass
+
+
+_lock = threading.Lock()
+_cache = cache_limitada.DADOS
+_grandes_demais = set()  # (id, coleção) maiores que o orçamento inteiro: lidas sempre diretamente
+
+
+def espelho_existente(id_perfil, colecao):
+    """Devolve o espelho de uma coleção se já estiver a ser mantido, sem criar um novo."""
+    return _cache.get((id_perfil, ESPELHO, colecao))
+
+def _perfis_espelhados():
+    return [id_perfil for id_perfil in _cache.perfis()
+            if any(chave[0] == id_perfil and chave[1] == ESPELHO for chave in _cache)]
+
+def obter_espelho(db, id_perfil, colecao):
+    """
+    Devolve o espelho pronto a ler de uma coleção de um perfil, criando o listener se necessário.
+    Devolve None se o listener não puder ser usado; nesse caso quem chama deve ler a coleção diretamente.
+    """
+    if db is None or not colecao or (id_perfil, colecao) in _grandes_demais:
+        return None
+
+    chave = (id_perfil, ESPELHO, colecao)
+    a_fechar = []
+    with _lock:
+        espelho = _cache.get(chave)
+        if espelho is not None and not espelho.ativo:
+            a_fechar.append(_cache.pop(chave))
+            espelho = None
+        if espelho is None:
+            try:
+                espelho = EspelhoColecao(db, colecao)
+            except Exception:
+                espelho = None
+            else:
+                _cache[chave] = espelho
+                perfis = _perfis_espelhados()
+                for antigo in perfis[:max(0, len(perfis) - MAXIMO_PERFIS_ESPELHADOS)]:
+                    a_fechar.extend(_cache.pop(c) for c in list(_cache) if c[0] == antigo and c[1] == ESPELHO)
+
+    for antigo in a_fechar:
+        if antigo is not None:
+            antigo.fechar()
+
+    if espelho is None or not espelho.aguardar_carga() or not espelho.ativo:
+        return None
+    # O tamanho muda com os deltas: é atualizado a cada utilização.
+    if not _cache.redimensionar(chave, espelho.tamanho):
+        # Despejado (e fechado) para dar lugar a outros dados, ou maior que o orçamento inteiro.
+        if espelho.tamanho > _cache.orcamento:
+            _grandes_demais.add((id_perfil, colecao))
+        return None
+    return espelho
+
+def fechar_todos():
+    """Encerra todos os listeners ativos."""
+    with _lock:
+        espelhos = [_cache.pop(chave) for chave in list(_cache) if chave[1] == ESPELHO]
+    for espelho in espelhos:
+        if espelho is not None:
+            espelho.fechar()
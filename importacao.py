@@ -0,0 +1,242 @@
+import io
+import json
+import time
+import unicodedata
+import numpy as np
+import pandas as pd
+import repositorio
+
+# --- IMPORTAÇÃO DO EDITAL ---
+#
+# O CSV do edital é convertido coluna a coluna (sem uma Series por linha) e os
+# tópicos são gravados com Armazenamento.gravar_em_massa: no Firestore, pelo
+# BulkWriter, em paralelo e com limitação de débito, sem o limite de 500
+# escritas de um lote.
+#
+# O documento do perfil é gravado por último: se a importação falhar, o perfil
+# não aparece a meio. Os IDs dos tópicos são determinísticos (a posição no
+# edital), pelo que repetir a importação retoma-a, regravando os mesmos
+# documentos.
+
+COLUNAS_EDITAL = ['Disciplina', 'Tópico do Edital']
+TENTATIVAS_IMPORTACAO = 3
+ESPERA_ENTRE_TENTATIVAS = 2.0  # segundos, multiplicados pelo número da tentativa
+
+
+class ErroImportacao(RuntimeError):
+    """Alguns documentos não foram gravados, mesmo depois de todas as tentativas."""
+
+    def __init__(self, colecao, falhas):
+        self.colecao = colecao
+        self.falhas = falhas
+        exemplos = ', '.join(sorted(falhas)[:5])
+        super().__init__(f"{len(falhas)} documentos de '{colecao}' não foram gravados (ex.: {exemplos}). "
+                         "Repita a importação para a retomar.")
+
+
+def id_perfil(nome, cargo, ano):
+    """Identificador do documento do perfil, derivado do nome, do cargo e do ano."""
+    return f"{nome.lower().replace(' ', '_').replace('/', '')}_{cargo.lower().replace(' ', '_')}_{ano}"
+
+def ler_edital_csv(origem):
+    """Lê o CSV do edital (';', latin-1) de um caminho ou de um ficheiro aberto e valida as colunas."""
+    df = pd.read_csv(origem, sep=';', encoding='latin-1')
+    df.columns = df.columns.str.strip()
+    em_falta = [coluna for coluna in COLUNAS_EDITAL if coluna not in df.columns]
+    if em_falta:
+        raise ValueError(f"O arquivo CSV deve conter as colunas {COLUNAS_EDITAL}; em falta: {em_falta}.")
+    return df
+
+def preparar_edital(df_edital):
+    """Acrescenta ao edital o ID e os campos iniciais de cada tópico do dashboard."""
+    df = df_edital.copy()
+    df['ID'] = range(1, len(df) + 1)
+    df['Teoria (T)'] = '[ ]'
+    df['Domínio'] = '[Não Medido]'
+    df['%'] = 0.0
+    df['Total_Questoes_Topico'] = 0
+    df['Total_Acertos_Topico'] = 0
+    df['Ultima_Medicao'] = '-'
+    return df
+
+def documentos_edital(df):
+    """Gera (id, dados) de cada tópico a partir das colunas, já convertidas para tipos do Python."""
+    colunas = list(df.columns)
+    valores = [df[coluna].tolist() for coluna in colunas]
+    for linha in zip(*valores):
+        dados = dict(zip(colunas, linha))
+        yield str(dados['ID']), dados
+
+def gravar_documentos(db, colecao, documentos, ao_progredir=None):
+    """
+    Grava {id: dados} com gravar_em_massa, voltando a tentar só os que falharam.
+    Chama ao_progredir(gravados, total); levanta ErroImportacao se algum ficar por gravar.
+    """
+    total = len(documentos)
+    pendentes = documentos
+    for tentativa in range(1, TENTATIVAS_IMPORTACAO + 1):
+        ja_gravados = total - len(pendentes)
+        falhas = db.gravar_em_massa(
+            colecao, pendentes.items(),
+            ao_progredir and (lambda gravados: ao_progredir(ja_gravados + gravados, total)),
+        )
+        if not falhas:
+            return total
+        pendentes = {id_documento: documentos[id_documento] for id_documento in falhas}
+        if tentativa < TENTATIVAS_IMPORTACAO:
+            time.sleep(ESPERA_ENTRE_TENTATIVAS * tentativa)
+    raise ErroImportacao(colecao, falhas)
+
+def importar_edital(db, id_perfil, perfil_doc, df_edital, ao_progredir=None):
+    """
+    Cria um perfil a partir do edital: grava os tópicos do dashboard, o catálogo e, por fim, o
+    documento do perfil. Devolve o número de tópicos importados.
+    """
+    df = preparar_edital(df_edital)
+    gravar_documentos(db, perfil_doc['colecao_dashboard'], dict(documentos_edital(df)), ao_progredir)
+    repositorio.gravar_catalogo(db, id_perfil, df)
+    db.gravar(repositorio.COLECAO_PERFIS, id_perfil, perfil_doc)
+    repositorio.invalidar(None, repositorio.COLECAO_PERFIS)
+    return len(df)
+
+
+# --- IMPORTAÇÃO DE LANÇAMENTOS (SIMULADOS E SESSÕES DE ESTUDO) ---
+#
+# Ficheiros CSV (separados por ',' ou ';') ou JSON (lista de objetos) com um
+# lançamento por linha:
+#   questões: Data, ID_Topico, Questoes, Acertos
+#   tempo:    Data, Disciplina, Minutos
+# Os nomes das colunas aceitam acentos, maiúsculas e alguns sinónimos. A
+# validação é feita sobre as colunas inteiras; se alguma linha for inválida,
+# nada é gravado.
+
+TIPO_QUESTOES = 'questoes'
+TIPO_TEMPO = 'tempo'
+COLUNAS_LANCAMENTOS = {
+    TIPO_QUESTOES: ['Data', 'ID_Topico', 'Total_Questoes', 'Acertos'],
+    TIPO_TEMPO: ['Data', 'Disciplina', 'Tempo_Estudado_Minutos'],
+}
+SINONIMOS_COLUNAS = {
+    'data': 'Data',
+    'id_topico': 'ID_Topico', 'id': 'ID_Topico', 'topico': 'ID_Topico',
+    'questoes': 'Total_Questoes', 'total_questoes': 'Total_Questoes',
+    'acertos': 'Acertos',
+    'disciplina': 'Disciplina', 'materia': 'Disciplina',
+    'minutos': 'Tempo_Estudado_Minutos', 'tempo_estudado_minutos': 'Tempo_Estudado_Minutos',
+}
+MAXIMO_MINUTOS_SESSAO = 6 * 60
+MAXIMO_LINHAS_POR_ERRO = 10
+
+
+class ErroValidacao(ValueError):
+    """O ficheiro de lançamentos tem linhas inválidas; `erros` lista-as, agrupadas por motivo."""
+
+    def __init__(self, erros):
+        self.erros = erros
+        super().__init__("\n".join(erros))
+
+
+def _nome_coluna(nome):
+    nome = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode()
+    chave = nome.strip().lower().replace(' ', '_')
+    return SINONIMOS_COLUNAS.get(chave, nome.strip())
+
+def ler_lancamentos(origem, nome_ficheiro=None):
+    """Lê um ficheiro de lançamentos (caminho ou ficheiro aberto) para um DataFrame de texto."""
+    nome_ficheiro = nome_ficheiro or (origem if isinstance(origem, str) else getattr(origem, 'name', ''))
+    if isinstance(origem, str):
+        with open(origem, 'rb') as ficheiro:
+            conteudo = ficheiro.read()
+    else:
+        conteudo = origem.read()
+    try:
+        texto = conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = conteudo.decode('latin-1')
+
+    if str(nome_ficheiro).lower().endswith('.json'):
+        registos = json.loads(texto)
+        if isinstance(registos, dict):
+            registos = registos.get('lancamentos', [registos])
+        df = pd.DataFrame(registos, dtype=object)
+    else:
+        df = pd.read_csv(io.StringIO(texto), sep=None, engine='python', dtype=str, skipinitialspace=True)
+    # Sinónimos da mesma coluna (por ex. objetos JSON com chaves diferentes) são fundidos numa só.
+    colunas = {}
+    for posicao, nome in enumerate(map(_nome_coluna, df.columns)):
+        valores = df.iloc[:, posicao]
+        colunas[nome] = colunas[nome].fillna(valores) if nome in colunas else valores
+    return pd.DataFrame(colunas)
+
+def _linhas(mascara):
+    """Números (a partir de 1) das linhas assinaladas, abreviados se forem muitas."""
+    numeros = (np.flatnonzero(np.asarray(mascara)) + 1).tolist()
+    texto = ', '.join(map(str, numeros[:MAXIMO_LINHAS_POR_ERRO]))
+    if len(numeros) > MAXIMO_LINHAS_POR_ERRO:
+        texto += f" e mais {len(numeros) - MAXIMO_LINHAS_POR_ERRO}"
+    return f"Linha {texto}" if len(numeros) == 1 else f"Linhas {texto}"
+
+def _inteiros(coluna):
+    numeros = pd.to_numeric(coluna, errors='coerce')
+    return numeros.where(numeros == np.floor(numeros))
+
+def validar_lancamentos(df, tipo, ids_validos=(), disciplinas_validas=()):
+    """
+    Valida e converte os lançamentos lidos por ler_lancamentos. Devolve o DataFrame com as colunas
+    de COLUNAS_LANCAMENTOS[tipo], já tipadas; levanta ErroValidacao se alguma linha for inválida.
+    """
+    colunas = COLUNAS_LANCAMENTOS[tipo]
+    em_falta = [coluna for coluna in colunas if coluna not in df.columns]
+    if em_falta:
+        raise ErroValidacao([f"O arquivo não tem a(s) coluna(s) {', '.join(em_falta)}; esperadas: {', '.join(colunas)}."])
+    if df.empty:
+        raise ErroValidacao(["O arquivo não tem lançamentos."])
+
+    df = df[colunas].reset_index(drop=True)
+    textos_data = df['Data'].astype(str).str.strip()
+    datas = pd.to_datetime(textos_data, format='%d/%m/%Y', errors='coerce')
+    datas = datas.fillna(pd.to_datetime(textos_data, format='ISO8601', errors='coerce'))
+    datas = datas.dt.tz_localize(None) if datas.dt.tz is not None else datas
+
+    regras = [
+        (datas.isna(), "data inválida (use DD/MM/AAAA ou AAAA-MM-DD)."),
+        (datas > pd.Timestamp.now(), "a data não pode estar no futuro."),
+    ]
+    if tipo == TIPO_QUESTOES:
+        ids = _inteiros(df['ID_Topico'])
+        questoes = _inteiros(df['Total_Questoes'])
+        acertos = _inteiros(df['Acertos'])
+        regras += [
+            (ids.isna() | ~ids.isin(list(ids_validos)), "ID de tópico inexistente no edital."),
+            (questoes.isna() | (questoes <= 0), "o número de questões deve ser um inteiro maior que zero."),
+            (acertos.isna() | (acertos < 0), "o número de acertos deve ser um inteiro não negativo."),
+            (acertos > questoes, "o número de acertos não pode ser maior que o número de questões."),
+        ]
+        convertidas = {'ID_Topico': ids, 'Total_Questoes': questoes, 'Acertos': acertos}
+    else:
+        disciplinas = df['Disciplina'].astype(str).str.strip()
+        minutos = _inteiros(df['Tempo_Estudado_Minutos'])
+        regras += [
+            (~disciplinas.isin(list(disciplinas_validas)), "disciplina inexistente no edital."),
+            (minutos.isna() | (minutos <= 0) | (minutos > MAXIMO_MINUTOS_SESSAO),
+             f"o tempo deve ser um número inteiro de minutos entre 1 e {MAXIMO_MINUTOS_SESSAO}."),
+        ]
+        convertidas = {'Disciplina': disciplinas, 'Tempo_Estudado_Minutos': minutos}
+
+    erros = [f"{_linhas(mascara)}: {mensagem}" for mascara, mensagem in regras if mascara.any()]
+    if erros:
+        raise ErroValidacao(erros)
+
+    df = df.assign(Data=datas.dt.normalize())
+    for coluna, valores in convertidas.items():
+        df[coluna] = valores if coluna == 'Disciplina' else valores.astype('int64')
+    return df
+
+def carregar_lancamentos(db, perfil, origem, tipo, nome_ficheiro=None):
+    """Lê e valida um ficheiro de lançamentos contra o catálogo de tópicos do perfil."""
+    df_catalogo = repositorio.carregar_catalogo(db, perfil)
+    return validar_lancamentos(
+        ler_lancamentos(origem, nome_ficheiro), tipo,
+        ids_validos=df_catalogo['ID'].tolist(),
+        disciplinas_validas=df_catalogo['Disciplina'].unique().tolist(),
+    )
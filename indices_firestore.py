@@ -0,0 +1,43 @@
+import argparse
+import json
+import sys
+import backup
+import repositorio
+
+# --- ÍNDICES COMPOSTOS DO FIRESTORE ---
+#
+# O histórico de um tópico é paginado no servidor (filtro por ID_Topico, ordem
+# por data descendente), o que exige um índice composto. Como cada perfil tem a
+# sua própria coleção de histórico, os índices são gerados a partir dos perfis
+# existentes (ver repositorio.indices_compostos) e publicados com:
+#
+#   python indices_firestore.py
+#   firebase deploy --only firestore:indexes
+#
+# Sem o índice, a página volta a ordenar o histórico localmente.
+
+ARQUIVO_INDICES = 'firestore.indexes.json'
+
+
+def gerar_indices(db):
+    """Devolve o conteúdo do firestore.indexes.json para todos os perfis."""
+    indices = []
+    for perfil in repositorio.carregar_perfis(db).values():
+        indices.extend(repositorio.indices_compostos(perfil))
+    return {'indexes': indices, 'fieldOverrides': []}
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Gera o firestore.indexes.json com os índices compostos de todos os perfis.")
+    parser.add_argument('--credenciais', default=backup.NOME_ARQUIVO_CREDENCIAL)
+    parser.add_argument('--saida', default=ARQUIVO_INDICES)
+    args = parser.parse_args(argumentos)
+
+    db = backup.conectar(args.credenciais)
+    repositorio.USAR_ESPELHO = False
+    conteudo = gerar_indices(db)
+    with open(args.saida, 'w', encoding='utf-8') as ficheiro:
+        json.dump(conteudo, ficheiro, ensure_ascii=False, indent=2)
+    print(f"{len(conteudo['indexes'])} índices gravados em {args.saida}.")
+
+if __name__ == "__main__":
+    sys.exit(main())
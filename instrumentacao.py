@@ -0,0 +1,462 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import armazenamento
+import cache_limitada
+import perfilador
+
+# --- INSTRUMENTAÇÃO DOS ACESSOS AO ARMAZENAMENTO ---
+#
+# Com COACH_INSTRUMENTACAO=1, armazenamento.conectar() devolve o backend
+# embrulhado em ArmazenamentoInstrumentado, que mede cada leitura, consulta,
+# agregação, lote, transação e listener: documentos lidos e escritos e tempo
+# de parede. O repositório regista ainda os acertos e falhas da sua cache.
+#
+# As medições são agrupadas por rerun de uma página (ou por ação do menu da
+# CLI), entre iniciar_rerun() e concluir_rerun(), e exportadas:
+#   - como uma linha JSON por rerun em ARQUIVO_LOG;
+#   - como contadores acumulados por página, no formato de texto do
+#     Prometheus, em ARQUIVO_METRICAS;
+#   - opcionalmente, num painel na barra lateral da página.
+# O mesmo par de chamadas aciona o perfilador opcional (ver perfilador.py).
+#
+# As leituras contadas seguem a faturação do Firestore: uma consulta custa pelo
+# menos uma leitura, mesmo sem resultados, e uma agregação uma leitura por cada
+# 1000 documentos contados.
+
+VARIAVEL_AMBIENTE = 'COACH_INSTRUMENTACAO'
+ARQUIVO_LOG = 'coach_instrumentacao.jsonl'
+ARQUIVO_METRICAS = 'coach_metricas.prom'
+PAGINA_SEGUNDO_PLANO = '(segundo plano)'
+DOCUMENTOS_POR_LEITURA_AGREGACAO = 1000
+
+_lock = threading.Lock()
+_local = threading.local()
+_abertas = {}  # ident da thread -> Medicao ainda não concluída
+_reruns_por_pagina = defaultdict(int)
+# Contadores acumulados desde o arranque do processo, exportados em ARQUIVO_METRICAS.
+_totais_operacoes = defaultdict(lambda: defaultdict(float))  # (pagina, operacao) -> contador -> valor
+_totais_cache = defaultdict(int)  # (pagina, resultado) -> n
+_totais_reruns = defaultdict(lambda: defaultdict(float))  # pagina -> contador -> valor
+
+_logger = logging.getLogger('coach.instrumentacao')
+
+
+def ativa():
+    """Indica se a instrumentação foi pedida em COACH_INSTRUMENTACAO."""
+    return os.environ.get(VARIAVEL_AMBIENTE, '').strip().lower() in ('1', 'true', 'sim')
+
+
+class Medicao:
+    """Medições de um rerun de uma página (ou de uma ação da CLI)."""
+
+    def __init__(self, pagina, rerun):
+        self.pagina = pagina
+        self.rerun = rerun
+        self.inicio = time.perf_counter()
+        self.iniciado_em = datetime.now(timezone.utc)
+        self.duracao = None
+        # (operacao, colecao) -> {'chamadas', 'lidos', 'escritos', 'segundos'}
+        self.operacoes = defaultdict(lambda: {'chamadas': 0, 'lidos': 0, 'escritos': 0, 'segundos': 0.0})
+        self.cache = {'acertos': 0, 'falhas': 0}
+
+    @property
+    def documentos_lidos(self):
+        return sum(valores['lidos'] for valores in self.operacoes.values())
+
+    @property
+    def documentos_escritos(self):
+        return sum(valores['escritos'] for valores in self.operacoes.values())
+
+    @property
+    def chamadas(self):
+        return sum(valores['chamadas'] for valores in self.operacoes.values())
+
+    @property
+    def segundos_armazenamento(self):
+        return sum(valores['segundos'] for valores in self.operacoes.values())
+
+    @property
+    def taxa_acertos_cache(self):
+        consultas = self.cache['acertos'] + self.cache['falhas']
+        return self.cache['acertos'] / consultas if consultas else None
+
+    def para_dict(self):
+        return {
+            'pagina': self.pagina,
+            'rerun': self.rerun,
+            'inicio': self.iniciado_em.isoformat(),
+            'duracao_s': self.duracao,
+            'chamadas': self.chamadas,
+            'documentos_lidos': self.documentos_lidos,
+            'documentos_escritos': self.documentos_escritos,
+            'armazenamento_s': self.segundos_armazenamento,
+            'cache': dict(self.cache, taxa_acertos=self.taxa_acertos_cache),
+            'operacoes': [
+                {'operacao': operacao, 'colecao': colecao, **valores}
+                for (operacao, colecao), valores in sorted(self.operacoes.items())
+            ],
+        }
+
+
+# --- REGISTO DAS MEDIÇÕES ---
+
+def _medicao_atual():
+    return getattr(_local, 'medicao', None)
+
+def _registar(operacao, colecao, segundos, lidos=0, escritos=0):
+    medicao = _medicao_atual()
+    pagina = medicao.pagina if medicao is not None else PAGINA_SEGUNDO_PLANO
+    with _lock:
+        if medicao is not None:
+            valores = medicao.operacoes[(operacao, colecao)]
+            valores['chamadas'] += 1
+            valores['lidos'] += lidos
+            valores['escritos'] += escritos
+            valores['segundos'] += segundos
+        totais = _totais_operacoes[(pagina, operacao)]
+        totais['chamadas'] += 1
+        totais['lidos'] += lidos
+        totais['escritos'] += escritos
+        totais['segundos'] += segundos
+
+@contextmanager
+def _medir(operacao, colecao):
+    """Mede o tempo de uma chamada; o bloco preenche contagem['lidos'] e contagem['escritos']."""
+    contagem = {'lidos': 0, 'escritos': 0}
+    inicio = time.perf_counter()
+    try:
+        yield contagem
+    finally:
+        _registar(operacao, colecao, time.perf_counter() - inicio, contagem['lidos'], contagem['escritos'])
+
+def registrar_cache(acerto):
+    """Regista um acerto ou uma falha da cache do repositório."""
+    medicao = _medicao_atual()
+    if medicao is None:
+        return
+    resultado = 'acertos' if acerto else 'falhas'
+    with _lock:
+        medicao.cache[resultado] += 1
+        _totais_cache[(medicao.pagina, resultado)] += 1
+
+def propagar(funcao):
+    """Envolve `funcao` para que, corrida noutra thread, as suas medições contem no rerun atual."""
+    medicao = _medicao_atual()
+
+    def executar(*args, **kwargs):
+        anterior = _medicao_atual()
+        _local.medicao = medicao
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            _local.medicao = anterior
+    return executar
+
+def iniciar_rerun(pagina):
+    """
+    Começa a medir um rerun de `pagina` na thread atual. Não faz nada com a instrumentação desligada,
+    além de iniciar o perfilador se COACH_PERFILADOR estiver definida (ver perfilador.py).
+    """
+    perfilador.iniciar(pagina)
+    if not ativa():
+        return None
+    # Um rerun interrompido (st.rerun, st.stop, exceção) nunca chega a concluir_rerun:
+    # fecha-o agora, se a sua thread já terminou ou se é esta mesma thread.
+    atual = threading.get_ident()
+    vivas = {thread.ident for thread in threading.enumerate()}
+    with _lock:
+        interrompidas = [
+            _abertas.pop(ident) for ident in list(_abertas) if ident == atual or ident not in vivas
+        ]
+        _reruns_por_pagina[pagina] += 1
+        medicao = Medicao(pagina, _reruns_por_pagina[pagina])
+        _abertas[atual] = medicao
+    for anterior in interrompidas:
+        _exportar(anterior, concluido=False)
+    _local.medicao = medicao
+    return medicao
+
+def concluir_rerun(mostrar_painel=False):
+    """Fecha e exporta a medição do rerun atual; com mostrar_painel desenha-a na barra lateral."""
+    perfilador.concluir()
+    medicao = _medicao_atual()
+    if medicao is None:
+        return None
+    _local.medicao = None
+    with _lock:
+        _abertas.pop(threading.get_ident(), None)
+    _exportar(medicao, concluido=True)
+    if mostrar_painel:
+        painel_lateral(medicao)
+    return medicao
+
+@contextmanager
+def medir_acao(nome):
+    """Mede uma ação da CLI como um rerun, do início ao fim do bloco."""
+    iniciar_rerun(nome)
+    try:
+        yield
+    finally:
+        concluir_rerun()
+
+
+# --- EXPORTAÇÃO ---
+
+def _configurar_log():
+    if not _logger.handlers:
+        handler = logging.FileHandler(ARQUIVO_LOG, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+def _exportar(medicao, concluido):
+    # De um rerun interrompido não se sabe quando terminou: fica sem duração.
+    medicao.duracao = time.perf_counter() - medicao.inicio if concluido else None
+    with _lock:
+        totais = _totais_reruns[medicao.pagina]
+        totais['reruns'] += 1
+        if concluido:
+            totais['segundos'] += medicao.duracao
+        else:
+            totais['interrompidos'] += 1
+    try:
+        _configurar_log()
+        _logger.info(json.dumps(dict(medicao.para_dict(), concluido=concluido), ensure_ascii=False))
+        escrever_metricas()
+    except OSError:
+        # A instrumentação nunca deve fazer falhar a página que está a medir.
+        pass
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+def escrever_metricas(caminho=ARQUIVO_METRICAS):
+    """Grava os contadores acumulados no formato de texto do Prometheus (textfile collector)."""
+    with _lock:
+        operacoes = {chave: dict(valores) for chave, valores in _totais_operacoes.items()}
+        cache = dict(_totais_cache)
+        reruns = {pagina: dict(valores) for pagina, valores in _totais_reruns.items()}
+
+    linhas = []
+    def metrica(nome, tipo, ajuda, amostras):
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        linhas.extend(f"{nome}{rotulos} {valor:g}" for rotulos, valor in amostras)
+
+    for contador, nome, ajuda in [
+        ('chamadas', 'coach_armazenamento_chamadas_total', 'Chamadas ao armazenamento.'),
+        ('lidos', 'coach_documentos_lidos_total', 'Documentos lidos (leituras faturáveis).'),
+        ('escritos', 'coach_documentos_escritos_total', 'Documentos escritos.'),
+        ('segundos', 'coach_armazenamento_segundos_total', 'Tempo de parede gasto no armazenamento.'),
+    ]:
+        metrica(nome, 'counter', ajuda, [
+            (_rotulos(pagina=pagina, operacao=operacao), valores.get(contador, 0))
+            for (pagina, operacao), valores in sorted(operacoes.items())
+        ])
+    metrica('coach_cache_consultas_total', 'counter', 'Consultas à cache do repositório.', [
+        (_rotulos(pagina=pagina, resultado=resultado), valor) for (pagina, resultado), valor in sorted(cache.items())
+    ])
+    caches = cache_limitada.estatisticas()
+    for contador, nome, tipo, ajuda in [
+        ('ocupacao_bytes', 'coach_cache_ocupacao_bytes', 'gauge', 'Memória ocupada pelos valores em cache.'),
+        ('orcamento_bytes', 'coach_cache_orcamento_bytes', 'gauge', 'Orçamento de memória da cache (COACH_CACHE_MB).'),
+        ('entradas', 'coach_cache_entradas', 'gauge', 'Entradas em cache.'),
+        ('perfis', 'coach_cache_perfis', 'gauge', 'Perfis com entradas em cache.'),
+        ('despejos', 'coach_cache_despejos_total', 'counter', 'Perfis despejados da cache por falta de espaço.'),
+        ('entradas_despejadas', 'coach_cache_entradas_despejadas_total', 'counter', 'Entradas despejadas da cache.'),
+        ('rejeitadas', 'coach_cache_rejeitadas_total', 'counter', 'Valores maiores que o orçamento, não guardados.'),
+    ]:
+        metrica(nome, tipo, ajuda, [(_rotulos(cache=cache), valores[contador]) for cache, valores in sorted(caches.items())])
+    metrica('coach_reruns_total', 'counter', 'Reruns medidos.', [
+        (_rotulos(pagina=pagina), valores.get('reruns', 0)) for pagina, valores in sorted(reruns.items())
+    ])
+    metrica('coach_reruns_interrompidos_total', 'counter', 'Reruns que não chegaram ao fim da página.', [
+        (_rotulos(pagina=pagina), valores.get('interrompidos', 0)) for pagina, valores in sorted(reruns.items())
+    ])
+    metrica('coach_rerun_segundos_total', 'counter', 'Tempo de parede total dos reruns concluídos.', [
+        (_rotulos(pagina=pagina), valores.get('segundos', 0)) for pagina, valores in sorted(reruns.items())
+    ])
+
+    # Escreve num ficheiro temporário e troca-o, para que o coletor nunca leia um ficheiro a meio.
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as ficheiro:
+        ficheiro.write('\n'.join(linhas) + '\n')
+    os.replace(temporario, caminho)
+
+def painel_lateral(medicao):
+    """Desenha o resumo de uma medição num expander da barra lateral do Streamlit."""
+    import streamlit as st
+    import pandas as pd
+
+    with st.sidebar.expander("🔧 Instrumentação", expanded=False):
+        st.caption(f"{medicao.pagina} — rerun {medicao.rerun}")
+        col1, col2 = st.columns(2)
+        col1.metric("Rerun", f"{medicao.duracao * 1000:.0f} ms")
+        col2.metric("Armazenamento", f"{medicao.segundos_armazenamento * 1000:.0f} ms")
+        col1.metric("Docs lidos", medicao.documentos_lidos)
+        col2.metric("Docs escritos", medicao.documentos_escritos)
+        taxa = medicao.taxa_acertos_cache
+        col1.metric("Chamadas", medicao.chamadas)
+        col2.metric("Cache", "-" if taxa is None else f"{taxa:.0%}",
+                    help=f"{medicao.cache['acertos']} acertos, {medicao.cache['falhas']} falhas")
+        for nome, valores in cache_limitada.estatisticas().items():
+            st.caption(f"Cache '{nome}': {valores['ocupacao_bytes'] / 2**20:.1f} de {valores['orcamento_bytes'] / 2**20:.0f} MB, "
+                       f"{valores['entradas']} entradas de {valores['perfis']} perfis, {valores['despejos']} perfis despejados")
+        if medicao.operacoes:
+            df = pd.DataFrame(medicao.para_dict()['operacoes'])
+            df['ms'] = (df.pop('segundos') * 1000).round(1)
+            st.dataframe(df, hide_index=True, use_container_width=True)
+
+
+# --- ARMAZENAMENTO INSTRUMENTADO ---
+
+class _EscritorInstrumentado(armazenamento.Escritor):
+    """Conta as escritas acumuladas num lote ou numa transação."""
+
+    def __init__(self, interno):
+        self._interno = interno
+        self._escritas = defaultdict(int)  # colecao -> n
+
+    def gravar(self, colecao, id_documento, dados, mesclar=False):
+        self._interno.gravar(colecao, id_documento, dados, mesclar=mesclar)
+        self._escritas[colecao] += 1
+
+    def atualizar(self, colecao, id_documento, dados):
+        self._interno.atualizar(colecao, id_documento, dados)
+        self._escritas[colecao] += 1
+
+    def apagar(self, colecao, id_documento):
+        self._interno.apagar(colecao, id_documento)
+        self._escritas[colecao] += 1
+
+    def _colecoes(self):
+        """Coleção a que a operação é atribuída: a única escrita, ou '*' se forem várias."""
+        return next(iter(self._escritas)) if len(self._escritas) == 1 else '*'
+
+
+class _LoteInstrumentado(_EscritorInstrumentado, armazenamento.Lote):
+
+    def confirmar(self):
+        with _medir('lote', self._colecoes()) as contagem:
+            contagem['escritos'] = sum(self._escritas.values())
+            self._interno.confirmar()
+
+
+class _TransacaoInstrumentada(_EscritorInstrumentado, armazenamento.Transacao):
+
+    def __init__(self, interno):
+        super().__init__(interno)
+        self.lidos = 0
+
+    def ler(self, colecao, id_documento):
+        self.lidos += 1
+        return self._interno.ler(colecao, id_documento)
+
+    def ler_varios(self, colecao, ids_documentos):
+        ids_documentos = list(ids_documentos)
+        self.lidos += len(ids_documentos)
+        return self._interno.ler_varios(colecao, ids_documentos)
+
+
+class ArmazenamentoInstrumentado(armazenamento.Armazenamento):
+    """Delega num Armazenamento e regista cada chamada na medição do rerun atual."""
+
+    def __init__(self, interno):
+        self.interno = interno
+        self.nome = interno.nome
+        self.notificacoes_sincronas = interno.notificacoes_sincronas
+
+    def novo_id(self, colecao):
+        return self.interno.novo_id(colecao)
+
+    def ler(self, colecao, id_documento):
+        with _medir('ler', colecao) as contagem:
+            contagem['lidos'] = 1
+            return self.interno.ler(colecao, id_documento)
+
+    def ler_varios(self, colecao, ids_documentos):
+        ids_documentos = list(ids_documentos)
+        with _medir('ler_varios', colecao) as contagem:
+            contagem['lidos'] = len(ids_documentos)
+            return self.interno.ler_varios(colecao, ids_documentos)
+
+    def listar(self, colecao, filtros=(), campos=None):
+        with _medir('listar', colecao) as contagem:
+            documentos = self.interno.listar(colecao, filtros, campos)
+            contagem['lidos'] = max(1, len(documentos))
+            return documentos
+
+    def listar_pagina(self, colecao, apos=None, limite=armazenamento.TAMANHO_PAGINA, filtros=(), campos=None):
+        with _medir('listar_pagina', colecao) as contagem:
+            documentos = self.interno.listar_pagina(colecao, apos, limite, filtros, campos)
+            contagem['lidos'] = max(1, len(documentos))
+            return documentos
+
+    def listar_ordenado(self, colecao, ordem, descendente=False, apos=None, limite=armazenamento.TAMANHO_PAGINA, filtros=(), campos=None):
+        with _medir('listar_ordenado', colecao) as contagem:
+            documentos = self.interno.listar_ordenado(colecao, ordem, descendente, apos, limite, filtros, campos)
+            contagem['lidos'] = max(1, len(documentos))
+            return documentos
+
+    def agregar(self, colecao, somas=(), filtros=()):
+        with _medir('agregar', colecao) as contagem:
+            valores = self.interno.agregar(colecao, somas, filtros)
+            contagem['lidos'] = max(1, math.ceil((valores.get('contagem') or 0) / DOCUMENTOS_POR_LEITURA_AGREGACAO))
+            return valores
+
+    def lote(self):
+        return _LoteInstrumentado(self.interno.lote())
+
+    def gravar_em_massa(self, colecao, documentos, ao_progredir=None):
+        contados = [0]
+
+        def contar(documentos):
+            for documento in documentos:
+                contados[0] += 1
+                yield documento
+
+        with _medir('em_massa', colecao) as contagem:
+            falhas = self.interno.gravar_em_massa(colecao, contar(documentos), ao_progredir)
+            contagem['escritos'] = contados[0] - len(falhas)
+            return falhas
+
+    def executar_transacao(self, funcao):
+        tentativas = []
+
+        def executar(transacao):
+            # Cada nova tentativa (conflito) volta a ler e a escrever; só a última é aplicada.
+            tentativas.append(_TransacaoInstrumentada(transacao))
+            return funcao(tentativas[-1])
+
+        with _medir('transacao', '*') as contagem:
+            try:
+                return self.interno.executar_transacao(executar)
+            finally:
+                contagem['lidos'] = sum(tentativa.lidos for tentativa in tentativas)
+                if tentativas:
+                    contagem['escritos'] = sum(tentativas[-1]._escritas.values())
+
+    def observar(self, colecao, ao_alterar):
+        def ao_alterar_medido(alteracoes):
+            # No Firestore corre na thread do listener e conta para o segundo plano;
+            # nos backends locais corre em quem escreveu e conta para esse rerun.
+            with _medir('observar', colecao) as contagem:
+                contagem['lidos'] = len(alteracoes)
+                ao_alterar(alteracoes)
+        return self.interno.observar(colecao, ao_alterar_medido)
+
+def instrumentar(db):
+    """Embrulha um armazenamento em ArmazenamentoInstrumentado (sem embrulhar duas vezes)."""
+    if db is None or isinstance(db, ArmazenamentoInstrumentado):
+        return db
+    return ArmazenamentoInstrumentado(db)
@@ -1,94 +1,24 @@
 import streamlit as st
 import pandas as pd
-from firebase_admin import firestore
 import plotly.express as px
 from datetime import datetime, time
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception:
         return None
 
 db = get_db_connection()
 
 # --- FUNÇÕES DE CARREGAMENTO DE DADOS ---
-@st.cache_data(ttl=300)
-def carregar_dashboard_df(_perfil):
-    """Carrega a tabela de performance de um perfil."""
-    if not _perfil or not db:
-        return pd.DataFrame()
-    try:
-        colecao_dashboard = _perfil.get('colecao_dashboard')
-        docs = db.collection(colecao_dashboard).stream()
-        lista_de_topicos = [doc.to_dict() for doc in docs]
-
-        if not lista_de_topicos:
-            return pd.DataFrame()
-
-        df = pd.DataFrame(lista_de_topicos)
-        df.rename(columns={
-            'Total_Questoes_Topico': 'Qsts', 
-            'Total_Acertos_Topico': 'Acertos', 
-            'Ultima_Medicao': 'Últ. Medição'
-        }, inplace=True, errors='ignore')
-
-        colunas_finais = ['ID', 'Disciplina', 'Tópico do Edital', 'Teoria (T)', 'Qsts', 'Acertos', 'Domínio', '%', 'Últ. Medição']
-        df = df.reindex(columns=colunas_finais)
-
-        valores_padrao = {
-            'Qsts': 0, 'Acertos': 0, '%': 0, 'ID': 0,
-            'Disciplina': 'N/A', 'Tópico do Edital': '-', 'Teoria (T)': '[ ]',
-            'Domínio': '[Não Medido]', 'Últ. Medição': '-'
-        }
-        df.fillna(value=valores_padrao, inplace=True)
-
-        df['ID'] = pd.to_numeric(df['ID']).astype(int)
-        df['Qsts'] = pd.to_numeric(df['Qsts']).astype(int)
-        df['Acertos'] = pd.to_numeric(df['Acertos']).astype(int)
-        df['%'] = pd.to_numeric(df['%'])
-
-        df = df.sort_values(by='ID').reset_index(drop=True)
-        return df
-        
-    except Exception as e:
-        st.error(f"Erro ao carregar o dashboard: {e}")
-        return pd.DataFrame()
-
-@st.cache_data(ttl=300)
-def carregar_historico_tempo_df(_perfil):
-    """Carrega o histórico de tempo de estudo de um perfil."""
-    if not _perfil or not db:
-        return pd.DataFrame()
-    try:
-        id_perfil = _perfil.get('id_documento')
-        if not id_perfil: return pd.DataFrame()
-        
-        colecao_historico_tempo = f"historico_tempo_{id_perfil}"
-        docs = db.collection(colecao_historico_tempo).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        return df if not df.empty else pd.DataFrame()
-    except Exception:
-        return pd.DataFrame()
-
-@st.cache_data(ttl=300)
-def carregar_historico_questoes_df(_perfil):
-    """Carrega o histórico de questões de um perfil."""
-    if not _perfil or not db:
-        return pd.DataFrame()
-    try:
-        colecao_historico = _perfil.get('colecao_historico')
-        if not colecao_historico: return pd.DataFrame()
-        docs = db.collection(colecao_historico).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        return df if not df.empty else pd.DataFrame()
-    except Exception:
-        return pd.DataFrame()
-
 def formatar_minutos(total_minutos):
     """Converte um total de minutos para o formato 'Xh Ymin'."""
     if total_minutos is None or total_minutos < 0:
@@ -97,74 +27,145 @@ def formatar_minutos(total_minutos):
     minutos = int(total_minutos % 60)
     return f"{horas}h {minutos:02d}min"
 
+def data_inicio_meta(perfil):
+    """Devolve o início da meta semanal do perfil, ou None se não houver meta com data válida."""
+    try:
+        return datetime.strptime(perfil['meta_semanal']['data_inicio'], '%d/%m/%Y')
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# --- SECÇÕES DA PÁGINA ---
+# Só a tabela tem widgets, por isso só ela é um fragmento: mudar o filtro reexecuta
+# apenas a tabela, sem voltar a ler o perfil nem a reconstruir os gráficos. As outras
+# secções não se reexecutam sozinhas e são funções simples.
+
+def secao_meta_semanal(perfil, df_dias_meta, inicio_meta):
+    """Progresso da meta semanal do perfil, se estiver em curso."""
+    meta_semanal = perfil.get('meta_semanal')
+    if not meta_semanal:
+        return
+    hoje = datetime.now()
+    try:
+        data_inicio = datetime.strptime(meta_semanal['data_inicio'], '%d/%m/%Y')
+        data_fim = datetime.combine(datetime.strptime(meta_semanal['data_fim'], '%d/%m/%Y'), time.max)
+        
+        if data_inicio <= hoje <= data_fim:
+            st.subheader(f"🎯 Meta da Semana ({meta_semanal['data_inicio']} a {meta_semanal['data_fim']})")
+
+            # Cálculo do progresso das questões
+            questoes_objetivo = meta_semanal.get('questoes_objetivo', 0)
+            if data_inicio != inicio_meta or not isinstance(df_dias_meta, pd.DataFrame):
+                # A meta mudou entretanto (ou a leitura falhou): lê os dias da meta atual.
+                df_dias_meta = repositorio.carregar_resumos(db, perfil, repositorio.PERIODO_DIA, desde=data_inicio)
+            df_semana_meta = df_dias_meta[df_dias_meta['Data'].between(data_inicio, data_fim)]
+            questoes_semana = df_semana_meta['Total_Questoes'].sum()
+            
+            progresso_questoes = (questoes_semana / questoes_objetivo * 100) if questoes_objetivo > 0 else 0
+            st.markdown(f"**Questões Resolvidas:** {int(questoes_semana)} de {questoes_objetivo}")
+            st.progress(progresso_questoes / 100)
+
+            # Cálculo do progresso do tempo
+            horas_objetivo = meta_semanal.get('horas_objetivo', 0)
+            minutos_objetivo = horas_objetivo * 60
+            tempo_semana_min = df_semana_meta['Tempo_Estudado_Minutos'].sum()
+
+            progresso_tempo = (tempo_semana_min / minutos_objetivo * 100) if minutos_objetivo > 0 else 0
+            st.markdown(f"**Tempo de Estudo:** {formatar_minutos(tempo_semana_min)} de {horas_objetivo}h 00min")
+            st.progress(progresso_tempo / 100)
+
+            st.markdown("---")
+    except (ValueError, TypeError):
+         st.warning("A meta semanal atual tem um formato de data inválido. Por favor, defina uma nova meta.")
+
+def secao_graficos(df_dashboard, df_semanas):
+    """Distribuição por nível de domínio e tempo de estudo por matéria."""
+    st.subheader("Análise Visual")
+    chart_cols = st.columns(2)
+    with chart_cols[0]:
+        df_dominio = df_dashboard['Domínio'].value_counts().reset_index()
+        df_dominio.columns = ['Domínio', 'Contagem']
+        df_dominio = df_dominio[df_dominio['Contagem'] > 0]  # 'Domínio' é categórico: conta também os níveis vazios
+        fig = px.pie(df_dominio, values='Contagem', names='Domínio', 
+                     title='Distribuição por Nível de Domínio', hole=.4,
+                     color='Domínio',
+                     color_discrete_map={
+                         '[Domínio Mestre]': 'green',
+                         '[Domínio Sólido]': 'royalblue',
+                         '[Em Desenvolvimento]': 'orange',
+                         '[Revisão Urgente]': 'red',
+                         '[Não Medido]': 'grey'
+                     })
+        st.plotly_chart(fig, use_container_width=True)
+
+    with chart_cols[1]:
+        tempo_por_materia = df_semanas.groupby('Disciplina', observed=True)['Tempo_Estudado_Minutos'].sum().reset_index()
+        tempo_por_materia = tempo_por_materia[tempo_por_materia['Tempo_Estudado_Minutos'] > 0]
+        if not tempo_por_materia.empty:
+            fig_tempo = px.bar(tempo_por_materia, x='Disciplina', y='Tempo_Estudado_Minutos',
+                               title='Tempo de Estudo por Matéria (minutos)',
+                               labels={'Tempo_Estudado_Minutos': 'Minutos Estudados', 'Disciplina': 'Matéria'})
+            st.plotly_chart(fig_tempo, use_container_width=True)
+        else:
+            st.info("Registe o seu tempo de estudo para ver a distribuição por matéria.")
+
+@st.fragment
+def secao_tabela(df_dashboard):
+    """Tabela detalhada por tópico, com filtro por disciplina."""
+    st.subheader("Análise Detalhada por Tópico")
+
+    disciplinas = ["Todas"] + sorted(df_dashboard['Disciplina'].unique().tolist())
+    disciplina_selecionada = st.selectbox("Filtrar por Disciplina:", options=disciplinas)
+
+    df_filtrado = df_dashboard
+    if disciplina_selecionada != "Todas":
+        df_filtrado = df_dashboard[df_dashboard['Disciplina'] == disciplina_selecionada]
+
+    st.dataframe(df_filtrado, use_container_width=True, hide_index=True)
+
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Dashboard", page_icon="📊", layout="wide")
+instrumentacao.iniciar_rerun("Dashboard")
 st.markdown("# 📊 Dashboard de Performance")
 
 if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecionado:
     perfil = st.session_state.perfil_selecionado
     st.info(f"Exibindo dados para o concurso: **{perfil['nome']}**")
 
-    # Recarrega o perfil para obter os dados de meta mais recentes
-    perfil_atualizado_ref = db.collection('perfis_concursos').document(perfil['id_documento']).get()
-    if perfil_atualizado_ref.exists:
-        perfil = perfil_atualizado_ref.to_dict()
-        perfil['id_documento'] = perfil_atualizado_ref.id # Garante que o ID do documento está no perfil
-    
-    df_dashboard = carregar_dashboard_df(perfil)
-    df_tempo = carregar_historico_tempo_df(perfil)
-    df_questoes = carregar_historico_questoes_df(perfil)
-
-    if not df_dashboard.empty:
-        # --- SEÇÃO DE METAS SEMANAIS ---
-        meta_semanal = perfil.get('meta_semanal')
-        if meta_semanal:
-            hoje = datetime.now()
-            try:
-                data_inicio = datetime.strptime(meta_semanal['data_inicio'], '%d/%m/%Y')
-                data_fim = datetime.combine(datetime.strptime(meta_semanal['data_fim'], '%d/%m/%Y'), time.max)
-                
-                if data_inicio <= hoje <= data_fim:
-                    st.subheader(f"🎯 Meta da Semana ({meta_semanal['data_inicio']} a {meta_semanal['data_fim']})")
-
-                    # Cálculo do progresso das questões
-                    questoes_objetivo = meta_semanal.get('questoes_objetivo', 0)
-                    questoes_semana = 0
-                    if not df_questoes.empty and 'Data' in df_questoes.columns:
-                        df_questoes['Data_dt'] = pd.to_datetime(df_questoes['Data'], format='%d/%m/%Y', errors='coerce')
-                        questoes_semana = df_questoes[df_questoes['Data_dt'].between(data_inicio, data_fim)]['Total_Questoes'].sum()
-                    
-                    progresso_questoes = (questoes_semana / questoes_objetivo * 100) if questoes_objetivo > 0 else 0
-                    st.markdown(f"**Questões Resolvidas:** {int(questoes_semana)} de {questoes_objetivo}")
-                    st.progress(progresso_questoes / 100)
-
-                    # Cálculo do progresso do tempo
-                    horas_objetivo = meta_semanal.get('horas_objetivo', 0)
-                    minutos_objetivo = horas_objetivo * 60
-                    tempo_semana_min = 0
-                    if not df_tempo.empty and 'Data' in df_tempo.columns:
-                        df_tempo['Data_dt'] = pd.to_datetime(df_tempo['Data'], format='%d/%m/%Y', errors='coerce')
-                        tempo_semana_min = df_tempo[df_tempo['Data_dt'].between(data_inicio, data_fim)]['Tempo_Estudado_Minutos'].sum()
-
-                    progresso_tempo = (tempo_semana_min / minutos_objetivo * 100) if minutos_objetivo > 0 else 0
-                    st.markdown(f"**Tempo de Estudo:** {formatar_minutos(tempo_semana_min)} de {horas_objetivo}h 00min")
-                    st.progress(progresso_tempo / 100)
-
-                    st.markdown("---")
-            except (ValueError, TypeError):
-                 st.warning("A meta semanal atual tem um formato de data inválido. Por favor, defina uma nova meta.")
-
-
+    # Todas as leituras da página em simultâneo: a espera é a da mais lenta, não a soma.
+    # Cada secção é desenhada assim que a sua leitura chega, a começar pelos KPIs.
+    inicio_meta = data_inicio_meta(perfil)
+    cargas = {
+        # Recarrega o perfil para obter os dados de meta mais recentes
+        'perfil': lambda: db.ler(repositorio.COLECAO_PERFIS, perfil['id_documento']),
+        # Indicadores agregados no servidor: a linha de KPIs não espera pelos documentos da tabela
+        'kpis': lambda: repositorio.carregar_kpis(db, perfil),
+        'dashboard': lambda: repositorio.carregar_dashboard_df(db, perfil),
+        # Totais por semana e disciplina: um documento por semana em vez dos históricos completos
+        'semanas': lambda: repositorio.carregar_resumos(db, perfil, repositorio.PERIODO_SEMANA),
+    }
+    if inicio_meta:
+        # Resumos diários desde o início da meta (que pode não coincidir com uma segunda-feira)
+        cargas['dias_meta'] = lambda: repositorio.carregar_resumos(db, perfil, repositorio.PERIODO_DIA, desde=inicio_meta)
+    leituras = repositorio.iniciar_leituras(cargas)
+    # A meta fica acima dos KPIs, mas só é preenchida depois deles.
+    area_meta = st.container()
+
+    kpis = repositorio.resultado_leitura(leituras['kpis'])
+    if isinstance(kpis, Exception):
+        st.error(f"Erro ao carregar os indicadores: {kpis}")
+        kpis = None
+
+    if kpis and kpis['total_topicos'] > 0:
         # --- CÁLCULO DOS KPIs ---
-        total_questoes = df_dashboard['Qsts'].sum()
-        total_acertos = df_dashboard['Acertos'].sum()
+        total_questoes = kpis['total_questoes']
+        total_acertos = kpis['total_acertos']
         performance_geral = (total_acertos / total_questoes * 100) if total_questoes > 0 else 0
         
-        total_topicos = len(df_dashboard)
-        topicos_medidos = len(df_dashboard[df_dashboard['Domínio'] != '[Não Medido]'])
+        total_topicos = kpis['total_topicos']
+        topicos_medidos = kpis['topicos_medidos']
         progresso_edital = (topicos_medidos / total_topicos * 100) if total_topicos > 0 else 0
         
-        tempo_total_estudo_min = df_tempo['Tempo_Estudado_Minutos'].sum() if not df_tempo.empty else 0
+        tempo_total_estudo_min = kpis['tempo_total_minutos']
 
         # --- EXIBIÇÃO DOS KPIs ---
         st.subheader("Visão Geral do Progresso")
@@ -176,47 +177,32 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
 
         st.markdown("---")
 
-        # --- GRÁFICOS ---
-        st.subheader("Análise Visual")
-        chart_cols = st.columns(2)
-        with chart_cols[0]:
-            df_dominio = df_dashboard['Domínio'].value_counts().reset_index()
-            df_dominio.columns = ['Domínio', 'Contagem']
-            fig = px.pie(df_dominio, values='Contagem', names='Domínio', 
-                         title='Distribuição por Nível de Domínio', hole=.4,
-                         color='Domínio',
-                         color_discrete_map={
-                             '[Domínio Mestre]': 'green',
-                             '[Domínio Sólido]': 'royalblue',
-                             '[Em Desenvolvimento]': 'orange',
-                             '[Revisão Urgente]': 'red',
-                             '[Não Medido]': 'grey'
-                         })
-            st.plotly_chart(fig, use_container_width=True)
-
-        with chart_cols[1]:
-            if not df_tempo.empty:
-                tempo_por_materia = df_tempo.groupby('Disciplina')['Tempo_Estudado_Minutos'].sum().reset_index()
-                fig_tempo = px.bar(tempo_por_materia, x='Disciplina', y='Tempo_Estudado_Minutos',
-                                   title='Tempo de Estudo por Matéria (minutos)',
-                                   labels={'Tempo_Estudado_Minutos': 'Minutos Estudados', 'Disciplina': 'Matéria'})
-                st.plotly_chart(fig_tempo, use_container_width=True)
-            else:
-                st.info("Registe o seu tempo de estudo para ver a distribuição por matéria.")
-
-
-        st.markdown("---")
-        # --- TABELA DETALHADA COM FILTRO ---
-        st.subheader("Análise Detalhada por Tópico")
-        
-        disciplinas = ["Todas"] + sorted(df_dashboard['Disciplina'].unique().tolist())
-        disciplina_selecionada = st.selectbox("Filtrar por Disciplina:", options=disciplinas)
-
-        df_filtrado = df_dashboard
-        if disciplina_selecionada != "Todas":
-            df_filtrado = df_dashboard[df_dashboard['Disciplina'] == disciplina_selecionada]
-
-        st.dataframe(df_filtrado, use_container_width=True, hide_index=True)
+        # --- SEÇÃO DE METAS SEMANAIS ---
+        with area_meta:
+            perfil_atualizado = repositorio.resultado_leitura(leituras['perfil'])
+            if isinstance(perfil_atualizado, Exception):
+                st.warning(f"Não foi possível atualizar o perfil; a mostrar os dados da sessão: {perfil_atualizado}")
+            elif perfil_atualizado is not None:
+                perfil_atualizado['id_documento'] = perfil['id_documento'] # Garante que o ID do documento está no perfil
+                perfil = perfil_atualizado
+            dias_meta = repositorio.resultado_leitura(leituras['dias_meta']) if 'dias_meta' in leituras else None
+            secao_meta_semanal(perfil, dias_meta, inicio_meta)
+
+        df_dashboard = repositorio.resultado_leitura(leituras['dashboard'])
+        if isinstance(df_dashboard, Exception):
+            st.error(f"Erro ao carregar o dashboard: {df_dashboard}")
+            df_dashboard = pd.DataFrame()
+        df_semanas = repositorio.resultado_leitura(leituras['semanas'])
+        if isinstance(df_semanas, Exception):
+            df_semanas = pd.DataFrame(columns=repositorio.COLUNAS_RESUMO)
+
+        if not df_dashboard.empty:
+            # --- GRÁFICOS ---
+            secao_graficos(df_dashboard, df_semanas)
+
+            st.markdown("---")
+            # --- TABELA DETALHADA COM FILTRO ---
+            secao_tabela(df_dashboard)
 
     else:
         st.warning("Ainda não há dados no dashboard para este perfil.")
@@ -224,3 +210,4 @@ else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
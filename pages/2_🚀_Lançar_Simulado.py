@@ -1,42 +1,26 @@
 import streamlit as st
-import pandas as pd
-from firebase_admin import firestore
-from datetime import datetime, date
+from datetime import date
+import armazenamento
+import importacao
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception as e:
         st.error(f"Erro ao obter conexão com o Firebase: {e}")
         return None
 
 db = get_db_connection()
 
-@st.cache_data(ttl=300)
-def carregar_topicos_do_perfil(_perfil):
-    """Carrega a lista de tópicos de um perfil específico para o seletor."""
-    if not _perfil or not db:
-        return []
-    
-    colecao_dashboard = _perfil.get('colecao_dashboard')
-    if not colecao_dashboard:
-        st.error("Informação da coleção do dashboard não encontrada no perfil.")
-        return []
-
-    try:
-        docs = db.collection(colecao_dashboard).order_by("ID").stream()
-        topicos = [{"id": doc.id, "display": f"{doc.to_dict().get('ID')} - {doc.to_dict().get('Tópico do Edital')}"} for doc in docs]
-        return topicos
-    except Exception as e:
-        st.error(f"Erro ao carregar tópicos do Firebase: {e}")
-        return []
-
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Lançar Simulado", page_icon="🚀", layout="centered")
+instrumentacao.iniciar_rerun("Lançar Simulado")
 
 st.markdown("# 🚀 Lançar Resultado de Simulado")
 
@@ -54,7 +38,11 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
 
 
     st.subheader("1. Selecione os Tópicos Avaliados")
-    lista_topicos = carregar_topicos_do_perfil(perfil)
+    try:
+        lista_topicos = repositorio.opcoes_topicos(db, perfil)
+    except Exception as e:
+        st.error(f"Erro ao carregar tópicos do Firebase: {e}")
+        lista_topicos = []
     
     if lista_topicos:
         opcoes_display = [topico['display'] for topico in lista_topicos]
@@ -85,71 +73,60 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
             submitted = st.form_submit_button("Salvar Resultado", type="primary")
 
             if submitted:
-                with st.spinner("Salvando resultados na nuvem..."):
-                    try:
-                        # Determina a data a ser usada, com base na seleção do usuário
-                        data_simulado_obj = data_selecionada
-                        data_simulado_str = data_simulado_obj.strftime('%d/%m/%Y')
-
-                        colecao_dashboard = perfil['colecao_dashboard']
-                        colecao_historico = perfil['colecao_historico']
-                        
-                        erros = False
-                        for id_topico, data in resultados.items():
-                            novas_questoes = data['questoes']
-                            novos_acertos = data['acertos']
-
-                            if novos_acertos > novas_questoes:
-                                st.error(f"Erro no Tópico ID {id_topico}: O número de acertos não pode ser maior que o número de questões.")
-                                erros = True
-                                continue
-                            
-                            doc_ref = db.collection(colecao_dashboard).document(str(id_topico))
-                            
-                            @firestore.transactional
-                            def update_in_transaction(transaction, doc_ref, n_questoes, n_acertos, data_str):
-                                snapshot = doc_ref.get(transaction=transaction)
-                                total_q_antigo = snapshot.get('Total_Questoes_Topico') or 0
-                                total_a_antigo = snapshot.get('Total_Acertos_Topico') or 0
-                                
-                                novo_total_q = total_q_antigo + n_questoes
-                                novo_total_a = total_a_antigo + n_acertos
-                                
-                                perc = (novo_total_a / novo_total_q * 100) if novo_total_q > 0 else 0
-                                
-                                if perc >= 90: dominio = '[Domínio Mestre]'
-                                elif 80 <= perc < 90: dominio = '[Domínio Sólido]'
-                                elif 65 <= perc < 80: dominio = '[Em Desenvolvimento]'
-                                else: dominio = '[Revisão Urgente]'
-
-                                transaction.update(doc_ref, {
-                                    'Total_Questoes_Topico': novo_total_q,
-                                    'Total_Acertos_Topico': novo_total_a,
-                                    '%': perc,
-                                    'Domínio': dominio,
-                                    'Ultima_Medicao': data_str
-                                })
-                            
-                            transaction = db.transaction()
-                            update_in_transaction(transaction, doc_ref, novas_questoes, novos_acertos, data_simulado_str)
-                            
-                            db.collection(colecao_historico).add({
-                                'ID_Topico': int(id_topico),
-                                'Data': data_simulado_str,
-                                'Total_Questoes': novas_questoes,
-                                'Acertos': novos_acertos,
-                                '%': (novos_acertos / novas_questoes * 100) if novas_questoes > 0 else 0
-                            })
-
-                        if not erros:
+                erros = repositorio.validar_resultados(resultados)
+                for erro in erros:
+                    st.error(erro)
+
+                if not erros:
+                    with st.spinner("Salvando resultados na nuvem..."):
+                        try:
+                            # Todos os tópicos são gravados num único commit: ou entram todos, ou nenhum.
+                            # Os contadores são incrementados no servidor, sem leitura prévia.
+                            ids_atualizados = repositorio.lancar_simulado(db, perfil, resultados, data_selecionada)
+                            repositorio.agendar_reconciliacao(db, perfil, ids_atualizados)
                             st.success("Resultados salvos com sucesso!")
                             st.balloons()
-                            st.cache_data.clear() # Limpa o cache para que os outros painéis se atualizem
                             del st.session_state.mostrar_form_resultados
 
+                        except Exception as e:
+                            st.error(f"Ocorreu um erro ao salvar os dados: {e}")
+
+    # --- IMPORTAÇÃO EM MASSA ---
+    st.markdown("---")
+    with st.expander("📥 Importar vários lançamentos de um arquivo (CSV ou JSON)"):
+        st.caption("Uma linha por lançamento, com as colunas Data, ID_Topico, Questoes e Acertos "
+                   "(ex.: 15/03/2025;12;20;16). Se alguma linha for inválida, nada é gravado.")
+        arquivo = st.file_uploader("Arquivo de lançamentos", type=["csv", "json"], key="arquivo_lancamentos")
+        if arquivo:
+            df_importar = None
+            try:
+                df_importar = importacao.carregar_lancamentos(db, perfil, arquivo, importacao.TIPO_QUESTOES, arquivo.name)
+            except importacao.ErroValidacao as e:
+                for erro in e.erros:
+                    st.error(erro)
+            except Exception as e:
+                st.error(f"Não foi possível ler o arquivo: {e}")
+
+            importados = st.session_state.setdefault('arquivos_importados', set())
+            if df_importar is not None and arquivo.file_id in importados:
+                st.info("Este arquivo já foi importado.")
+            elif df_importar is not None:
+                st.dataframe(df_importar, hide_index=True, use_container_width=True)
+                st.caption(f"{len(df_importar)} lançamentos em {df_importar['ID_Topico'].nunique()} tópicos.")
+                if st.button("Gravar Lançamentos", type="primary"):
+                    barra = st.progress(0.0, text="A gravar lançamentos...")
+                    try:
+                        ids_atualizados = repositorio.lancar_questoes_em_massa(
+                            db, perfil, df_importar,
+                            lambda gravados, total: barra.progress(gravados / total, text=f"A gravar lançamentos: {gravados}/{total}")
+                        )
+                        repositorio.agendar_reconciliacao(db, perfil, ids_atualizados)
+                        importados.add(arquivo.file_id)
+                        st.success(f"{len(df_importar)} lançamentos gravados em {len(ids_atualizados)} tópicos!")
                     except Exception as e:
-                        st.error(f"Ocorreu um erro ao salvar os dados: {e}")
+                        st.error(f"Ocorreu um erro ao gravar os lançamentos: {e}")
 else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
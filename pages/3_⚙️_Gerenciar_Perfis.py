@@ -1,57 +1,220 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
-from firebase_admin import firestore
 import os
 from datetime import datetime, timedelta
+import armazenamento
+import importacao
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception as e:
         st.error(f"Erro ao obter conexão com o Firebase: {e}")
         return None
 
 db = get_db_connection()
 
-@st.cache_data(ttl=300)
-def carregar_todos_perfis():
-    """Carrega todos os perfis de concurso do banco de dados."""
-    if not db:
-        return {}
+# --- CARTÕES DOS PERFIS ---
+# Cada cartão é um fragmento: os botões e os formulários de um perfil reexecutam
+# só o seu cartão. Só as mudanças de status, que reordenam a lista, reexecutam a página.
+
+def _reexecutar_cartao():
+    """Reexecuta só o cartão atual; durante uma execução completa da página, que não o permite, a página."""
     try:
-        perfis_ref = db.collection('perfis_concursos').stream()
-        perfis = {}
-        for doc in perfis_ref:
-            perfil_data = doc.to_dict()
-            perfil_data['id_documento'] = doc.id
-            perfis[doc.id] = perfil_data
-        perfis_ordenados = dict(sorted(perfis.items(), key=lambda item: (item[1]['status'], item[1]['nome'])))
-        return perfis_ordenados
-    except Exception as e:
-        st.error(f"Erro ao carregar perfis: {e}")
-        return {}
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def _avisar_apos_reexecutar(perfil_id, mensagem):
+    """Guarda uma mensagem de sucesso para o cartão mostrar na próxima execução (o rerun apaga a atual)."""
+    st.session_state.setdefault('avisos_perfis', {})[perfil_id] = mensagem
+
+def _concluir_acao(perfil_id, mensagem, recarregar_pagina=False):
+    _avisar_apos_reexecutar(perfil_id, mensagem)
+    st.session_state.acoes_perfis.pop(perfil_id, None)
+    repositorio.invalidar(None, repositorio.COLECAO_PERFIS)
+    if recarregar_pagina:
+        st.rerun()
+    _reexecutar_cartao()
+
+def formulario_meta(perfil):
+    """Formulário para DEFINIR META SEMANAL."""
+    with st.form(key=f"form_meta_{perfil['id_documento']}"):
+        st.info(f"Definindo Meta Semanal para: **{perfil['nome']}**")
+        meta_atual = perfil.get('meta_semanal', {})
+        
+        meta_questoes = st.number_input("Meta de Questões para a semana:", min_value=0, step=50, value=meta_atual.get('questoes_objetivo', 300))
+        meta_horas = st.number_input("Meta de Horas de Estudo para a semana:", min_value=0, step=1, value=meta_atual.get('horas_objetivo', 20))
+        
+        submitted = st.form_submit_button("Salvar Meta")
+        if submitted:
+            with st.spinner("Salvando meta..."):
+                try:
+                    hoje = datetime.now()
+                    inicio_semana = hoje - timedelta(days=hoje.weekday())
+                    fim_semana = inicio_semana + timedelta(days=6)
+
+                    nova_meta = {
+                        "questoes_objetivo": meta_questoes,
+                        "horas_objetivo": meta_horas,
+                        "data_inicio": inicio_semana.strftime('%d/%m/%Y'),
+                        "data_fim": fim_semana.strftime('%d/%m/%Y')
+                    }
+                    db.atualizar(repositorio.COLECAO_PERFIS, perfil['id_documento'], {'meta_semanal': nova_meta})
+                except Exception as e:
+                    st.error(f"Erro ao salvar a meta: {e}")
+                else:
+                    _concluir_acao(perfil['id_documento'], "Meta semanal salva com sucesso!")
+
+def formulario_arquivar(perfil):
+    """Formulário para ARQUIVAR um perfil."""
+    with st.form(key=f"form_arquivar_{perfil['id_documento']}"):
+        st.warning(f"Arquivando: **{perfil['nome']}**")
+        registra_nota = st.checkbox("Registrar a nota final da prova", value=False)
+        nota_final = None
+        if registra_nota:
+            nota_final = st.number_input("Digite a nota final (ex: 85.75):", format="%.2f", step=0.01)
+        
+        submitted = st.form_submit_button("Confirmar Arquivamento")
+        if submitted:
+            with st.spinner("Arquivando..."):
+                try:
+                    db.atualizar(repositorio.COLECAO_PERFIS, perfil['id_documento'], {'status': 'Arquivado', 'nota_final': nota_final})
+                except Exception as e:
+                    st.error(f"Erro ao arquivar: {e}")
+                else:
+                    _concluir_acao(perfil['id_documento'], "Perfil arquivado com sucesso!", recarregar_pagina=True)
 
-@st.cache_data(ttl=300)
-def get_disciplinas_from_dashboard(_perfil):
-    """Obtém a lista de disciplinas únicas de um dashboard."""
-    if not _perfil or not db:
-        return []
+def formulario_nota(perfil):
+    """Formulário para EDITAR NOTA de um perfil arquivado."""
+    with st.form(key=f"form_edit_nota_{perfil['id_documento']}"):
+        st.info(f"Editando a nota final para: **{perfil['nome']}**")
+        nota_atual = perfil.get('nota_final') or 0.0
+        nova_nota = st.number_input("Digite a nova nota final:", value=float(nota_atual), format="%.2f", step=0.01)
+        
+        submitted = st.form_submit_button("Salvar Nota")
+        if submitted:
+            with st.spinner("Salvando nota..."):
+                try:
+                    db.atualizar(repositorio.COLECAO_PERFIS, perfil['id_documento'], {'nota_final': nova_nota})
+                except Exception as e:
+                    st.error(f"Erro ao salvar a nota: {e}")
+                else:
+                    _concluir_acao(perfil['id_documento'], "Nota salva com sucesso!")
+
+def formulario_estrutura(perfil):
+    """Formulário para EDITAR ESTRUTURA da prova."""
+    perfil_id = perfil['id_documento']
     try:
-        colecao_dashboard = _perfil.get('colecao_dashboard')
-        docs = db.collection(colecao_dashboard).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        if 'Disciplina' in df.columns and not df.empty:
-            return df['Disciplina'].unique().tolist()
-        return []
+        disciplinas = repositorio.listar_disciplinas(db, perfil)
     except Exception:
-        return []
+        disciplinas = []
+    if not disciplinas:
+        st.error("Não foi possível carregar as disciplinas para este perfil.")
+        if st.button("Ok", key=f"ok_estrutura_{perfil_id}"):
+            st.session_state.acoes_perfis.pop(perfil_id, None)
+            _reexecutar_cartao()
+        return
+    with st.form(key=f"form_edit_estrutura_{perfil_id}"):
+        st.info(f"Editando a Estrutura da Prova para: **{perfil['nome']}**")
+        estrutura_atual = perfil.get('estrutura_prova', {})
+        nova_estrutura = {}
+        for disciplina in disciplinas:
+            st.markdown(f"**{disciplina}**")
+            col1, col2 = st.columns(2)
+            dados_atuais = estrutura_atual.get(disciplina, {'num_questoes': 0, 'peso': 1.0})
+            num_questoes = col1.number_input(f"Nº de Questões", value=dados_atuais.get('num_questoes', 0), key=f"q_edit_{perfil_id}_{disciplina}", min_value=0, step=1)
+            peso = col2.number_input(f"Peso", value=dados_atuais.get('peso', 1.0), key=f"p_edit_{perfil_id}_{disciplina}", format="%.2f", min_value=0.0, step=0.1)
+            nova_estrutura[disciplina] = {'num_questoes': num_questoes, 'peso': peso}
+
+        submitted = st.form_submit_button("Salvar Estrutura da Prova")
+        if submitted:
+            with st.spinner("Salvando estrutura..."):
+                try:
+                    db.atualizar(repositorio.COLECAO_PERFIS, perfil_id, {'estrutura_prova': nova_estrutura})
+                except Exception as e:
+                    st.error(f"Erro ao salvar a estrutura: {e}")
+                else:
+                    _concluir_acao(perfil_id, "Estrutura da prova salva com sucesso!")
+
+FORMULARIOS = {
+    'meta': formulario_meta,
+    'arquivar': formulario_arquivar,
+    'nota': formulario_nota,
+    'estrutura': formulario_estrutura,
+}
+
+@st.fragment
+def cartao_perfil(perfil_id):
+    """Cartão de um perfil, com as suas ações e o formulário da ação escolhida."""
+    # Lido da cache a cada execução do cartão, para refletir as escritas feitas nele.
+    perfil = repositorio.carregar_perfis(db).get(perfil_id)
+    if perfil is None:
+        return
+    acoes = st.session_state.setdefault('acoes_perfis', {})  # id do perfil -> formulário aberto
+
+    with st.container(border=True):
+        aviso = st.session_state.get('avisos_perfis', {}).pop(perfil_id, None)
+        if aviso:
+            st.success(aviso)
+        col_info, col_action = st.columns([2, 1])
+        
+        with col_info:
+            st.markdown(f"**{perfil['nome']}** ({perfil['ano']})")
+            nota_final_str = f"{perfil.get('nota_final', 'N/A'):.2f}" if isinstance(perfil.get('nota_final'), (int, float)) else "Não registrada"
+            st.caption(f"Status: **{perfil['status']}** | Nota Final: **{nota_final_str}**")
+            if not perfil.get('resumos_disponiveis'):
+                if st.button("Gerar resumos", key=f"resumos_{perfil_id}", help="Calcula os resumos diários e semanais a partir do histórico, acelerando o Dashboard e os Relatórios."):
+                    with st.spinner("A calcular os resumos a partir do histórico..."):
+                        try:
+                            repositorio.reconstruir_resumos(db, perfil)
+                        except Exception as e:
+                            st.error(f"Erro ao gerar os resumos: {e}")
+                        else:
+                            # O cartão volta a ler o perfil, já sem o botão, e mostra o aviso.
+                            _avisar_apos_reexecutar(perfil_id, f"Resumos do perfil '{perfil['nome']}' gerados!")
+                            _reexecutar_cartao()
+
+        with col_action:
+            if perfil['status'] == 'Ativo':
+                sub_cols = st.columns(2)
+                with sub_cols[0]:
+                    if st.button("Arquivar", key=f"archive_{perfil_id}", use_container_width=True):
+                        acoes[perfil_id] = 'arquivar'
+                with sub_cols[1]:
+                    if st.button("Definir Meta", key=f"meta_{perfil_id}", use_container_width=True):
+                        acoes[perfil_id] = 'meta'
+            else: # Arquivado
+                sub_cols = st.columns(3)
+                with sub_cols[0]:
+                    if st.button("Reativar", key=f"reactivate_{perfil_id}", use_container_width=True):
+                        try:
+                            db.atualizar(repositorio.COLECAO_PERFIS, perfil_id, {'status': 'Ativo'})
+                        except Exception as e:
+                            st.error(f"Erro ao reativar: {e}")
+                        else:
+                            _concluir_acao(perfil_id, f"Perfil '{perfil['nome']}' reativado!", recarregar_pagina=True)
+                with sub_cols[1]:
+                    if st.button("Nota", key=f"edit_nota_{perfil_id}", use_container_width=True):
+                        acoes[perfil_id] = 'nota'
+                with sub_cols[2]:
+                    if st.button("Estrutura", key=f"edit_estrutura_{perfil_id}", use_container_width=True):
+                        acoes[perfil_id] = 'estrutura'
+
+        # --- Formulário da ação escolhida, dentro do próprio cartão ---
+        if acoes.get(perfil_id) in FORMULARIOS:
+            FORMULARIOS[acoes[perfil_id]](perfil)
 
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Gerenciar Perfis", page_icon="⚙️", layout="centered")
+instrumentacao.iniciar_rerun("Gerenciar Perfis")
 
 st.markdown("# ⚙️ Gerenciar Perfis")
 st.markdown("Crie novos perfis de estudo ou gerencie o status dos concursos existentes.")
@@ -62,160 +225,17 @@ tab1, tab2 = st.tabs(["Gerenciar Status", "Criar Novo Perfil"])
 with tab1:
     st.subheader("Gerenciar Concursos Existentes")
     
-    perfis = carregar_todos_perfis()
+    try:
+        perfis = repositorio.carregar_perfis(db)
+    except Exception as e:
+        st.error(f"Erro ao carregar perfis: {e}")
+        perfis = {}
 
     if not perfis:
         st.info("Nenhum perfil de concurso encontrado. Crie um na aba ao lado.")
     else:
-        for perfil_id, perfil in perfis.items():
-            with st.container(border=True):
-                col_info, col_action = st.columns([2, 1])
-                
-                with col_info:
-                    st.markdown(f"**{perfil['nome']}** ({perfil['ano']})")
-                    nota_final_str = f"{perfil.get('nota_final', 'N/A'):.2f}" if isinstance(perfil.get('nota_final'), (int, float)) else "Não registrada"
-                    st.caption(f"Status: **{perfil['status']}** | Nota Final: **{nota_final_str}**")
-
-                with col_action:
-                    if perfil['status'] == 'Ativo':
-                        sub_cols = st.columns(2)
-                        with sub_cols[0]:
-                            if st.button("Arquivar", key=f"archive_{perfil_id}", use_container_width=True):
-                                st.session_state.perfil_para_arquivar = perfil
-                                st.rerun()
-                        with sub_cols[1]:
-                            if st.button("Definir Meta", key=f"meta_{perfil_id}", use_container_width=True):
-                                st.session_state.perfil_para_definir_meta = perfil
-                                st.rerun()
-                    else: # Arquivado
-                        sub_cols = st.columns(3)
-                        with sub_cols[0]:
-                            if st.button("Reativar", key=f"reactivate_{perfil_id}", use_container_width=True):
-                                try:
-                                    db.collection('perfis_concursos').document(perfil_id).update({'status': 'Ativo'})
-                                    st.success(f"Perfil '{perfil['nome']}' reativado!")
-                                    st.cache_data.clear()
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"Erro ao reativar: {e}")
-                        with sub_cols[1]:
-                            if st.button("Nota", key=f"edit_nota_{perfil_id}", use_container_width=True):
-                                st.session_state.perfil_para_editar_nota = perfil
-                                st.rerun()
-                        with sub_cols[2]:
-                            if st.button("Estrutura", key=f"edit_estrutura_{perfil_id}", use_container_width=True):
-                                st.session_state.perfil_para_editar_estrutura = perfil
-                                st.rerun()
-    
-    # --- Formulários de Ação (Renderizados condicionalmente fora do loop) ---
-
-    # Formulário para DEFINIR META SEMANAL
-    if 'perfil_para_definir_meta' in st.session_state and st.session_state.perfil_para_definir_meta:
-        perfil = st.session_state.perfil_para_definir_meta
-        with st.form(key=f"form_meta_{perfil['id_documento']}"):
-            st.info(f"Definindo Meta Semanal para: **{perfil['nome']}**")
-            meta_atual = perfil.get('meta_semanal', {})
-            
-            meta_questoes = st.number_input("Meta de Questões para a semana:", min_value=0, step=50, value=meta_atual.get('questoes_objetivo', 300))
-            meta_horas = st.number_input("Meta de Horas de Estudo para a semana:", min_value=0, step=1, value=meta_atual.get('horas_objetivo', 20))
-            
-            submitted = st.form_submit_button("Salvar Meta")
-            if submitted:
-                with st.spinner("Salvando meta..."):
-                    try:
-                        hoje = datetime.now()
-                        inicio_semana = hoje - timedelta(days=hoje.weekday())
-                        fim_semana = inicio_semana + timedelta(days=6)
-
-                        nova_meta = {
-                            "questoes_objetivo": meta_questoes,
-                            "horas_objetivo": meta_horas,
-                            "data_inicio": inicio_semana.strftime('%d/%m/%Y'),
-                            "data_fim": fim_semana.strftime('%d/%m/%Y')
-                        }
-                        db.collection('perfis_concursos').document(perfil['id_documento']).update({'meta_semanal': nova_meta})
-                        st.success("Meta semanal salva com sucesso!")
-                        del st.session_state.perfil_para_definir_meta
-                        st.cache_data.clear()
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao salvar a meta: {e}")
-
-    # Formulário para ARQUIVAR um perfil
-    if 'perfil_para_arquivar' in st.session_state and st.session_state.perfil_para_arquivar:
-        perfil = st.session_state.perfil_para_arquivar
-        with st.form(key=f"form_arquivar_{perfil['id_documento']}"):
-            st.warning(f"Arquivando: **{perfil['nome']}**")
-            registra_nota = st.checkbox("Registrar a nota final da prova", value=False)
-            nota_final = None
-            if registra_nota:
-                nota_final = st.number_input("Digite a nota final (ex: 85.75):", format="%.2f", step=0.01)
-            
-            submitted = st.form_submit_button("Confirmar Arquivamento")
-            if submitted:
-                with st.spinner("Arquivando..."):
-                    try:
-                        db.collection('perfis_concursos').document(perfil['id_documento']).update({'status': 'Arquivado', 'nota_final': nota_final})
-                        st.success("Perfil arquivado com sucesso!")
-                        del st.session_state.perfil_para_arquivar
-                        st.cache_data.clear()
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao arquivar: {e}")
-
-    # Formulário para EDITAR NOTA de um perfil arquivado
-    if 'perfil_para_editar_nota' in st.session_state and st.session_state.perfil_para_editar_nota:
-        perfil = st.session_state.perfil_para_editar_nota
-        with st.form(key=f"form_edit_nota_{perfil['id_documento']}"):
-            st.info(f"Editando a nota final para: **{perfil['nome']}**")
-            nota_atual = perfil.get('nota_final') or 0.0
-            nova_nota = st.number_input("Digite a nova nota final:", value=float(nota_atual), format="%.2f", step=0.01)
-            
-            submitted = st.form_submit_button("Salvar Nota")
-            if submitted:
-                with st.spinner("Salvando nota..."):
-                    try:
-                        db.collection('perfis_concursos').document(perfil['id_documento']).update({'nota_final': nova_nota})
-                        st.success("Nota salva com sucesso!")
-                        del st.session_state.perfil_para_editar_nota
-                        st.cache_data.clear()
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Erro ao salvar a nota: {e}")
-
-    # Formulário para EDITAR ESTRUTURA da prova
-    if 'perfil_para_editar_estrutura' in st.session_state:
-        perfil = st.session_state.perfil_para_editar_estrutura
-        disciplinas = get_disciplinas_from_dashboard(perfil)
-        if disciplinas:
-            with st.form(key=f"form_edit_estrutura_{perfil['id_documento']}"):
-                st.info(f"Editando a Estrutura da Prova para: **{perfil['nome']}**")
-                estrutura_atual = perfil.get('estrutura_prova', {})
-                nova_estrutura = {}
-                for disciplina in disciplinas:
-                    st.markdown(f"**{disciplina}**")
-                    col1, col2 = st.columns(2)
-                    dados_atuais = estrutura_atual.get(disciplina, {'num_questoes': 0, 'peso': 1.0})
-                    num_questoes = col1.number_input(f"Nº de Questões", value=dados_atuais.get('num_questoes', 0), key=f"q_edit_{disciplina}", min_value=0, step=1)
-                    peso = col2.number_input(f"Peso", value=dados_atuais.get('peso', 1.0), key=f"p_edit_{disciplina}", format="%.2f", min_value=0.0, step=0.1)
-                    nova_estrutura[disciplina] = {'num_questoes': num_questoes, 'peso': peso}
-
-                submitted = st.form_submit_button("Salvar Estrutura da Prova")
-                if submitted:
-                    with st.spinner("Salvando estrutura..."):
-                        try:
-                            db.collection('perfis_concursos').document(perfil['id_documento']).update({'estrutura_prova': nova_estrutura})
-                            st.success("Estrutura da prova salva com sucesso!")
-                            del st.session_state.perfil_para_editar_estrutura
-                            st.cache_data.clear()
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Erro ao salvar a estrutura: {e}")
-        else:
-            st.error("Não foi possível carregar as disciplinas para este perfil.")
-            if st.button("Ok"):
-                del st.session_state.perfil_para_editar_estrutura
-                st.rerun()
+        for perfil_id in perfis:
+            cartao_perfil(perfil_id)
 
 
 # --- Aba de Criação de Perfil ---
@@ -261,38 +281,29 @@ with tab2:
             else:
                 with st.spinner("Criando novo perfil..."):
                     try:
-                        id_perfil = f"{nome.lower().replace(' ', '_').replace('/', '')}_{cargo.lower().replace(' ', '_')}_{ano}"
+                        id_perfil = importacao.id_perfil(nome, cargo, ano)
                         
-                        df_edital = pd.read_csv(uploaded_file, encoding='latin-1', sep=';')
-                        df_edital.columns = df_edital.columns.str.strip()
-
-                        df_edital['ID'] = df_edital.index + 1
-                        df_edital['Teoria (T)'] = '[ ]'
-                        df_edital['Domínio'] = '[Não Medido]'
-                        df_edital['%'] = 0.0
-                        df_edital['Total_Questoes_Topico'] = 0
-                        df_edital['Total_Acertos_Topico'] = 0
-                        df_edital['Ultima_Medicao'] = '-'
+                        df_edital = importacao.ler_edital_csv(uploaded_file)
                         
                         colecao_dashboard = f"dashboard_{id_perfil}"
                         colecao_historico = f"historico_{id_perfil}"
                         
                         perfil_doc = {'nome': nome, 'cargo': cargo, 'ano': ano, 'status': 'Ativo',
                                       'nota_final': None, 'estrutura_prova': estrutura_prova,
-                                      'colecao_dashboard': colecao_dashboard, 'colecao_historico': colecao_historico}
+                                      'colecao_dashboard': colecao_dashboard, 'colecao_historico': colecao_historico,
+                                      'resumos_disponiveis': True, 'datas_tipadas': True}
                         
-                        db.collection('perfis_concursos').document(id_perfil).set(perfil_doc)
-
-                        batch = db.batch()
-                        for _, row in df_edital.iterrows():
-                            doc_ref = db.collection(colecao_dashboard).document(str(row['ID']))
-                            batch.set(doc_ref, row.to_dict())
-                        batch.commit()
+                        barra = st.progress(0.0, text="A importar os tópicos do edital...")
+                        importados = importacao.importar_edital(
+                            db, id_perfil, perfil_doc, df_edital,
+                            lambda gravados, total: barra.progress(gravados / total, text=f"A importar tópicos: {gravados}/{total}")
+                        )
+                        barra.empty()
                         
-                        st.success(f"Perfil '{nome}' criado com sucesso!")
+                        st.success(f"Perfil '{nome}' criado com sucesso! {importados} tópicos importados.")
                         st.balloons()
-                        st.cache_data.clear()
 
                     except Exception as e:
                         st.error(f"Erro ao criar o perfil: {e}")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
@@ -1,15 +1,17 @@
 import streamlit as st
 import pandas as pd
-from firebase_admin import firestore
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 # Função para garantir a inicialização do Firebase
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception as e:
         st.error(f"Erro ao obter conexão com o Firebase: {e}")
         return None
@@ -17,39 +19,21 @@ def get_db_connection():
 db = get_db_connection()
 
 # Função para carregar perfis arquivados que têm nota final
-@st.cache_data(ttl=300)
 def carregar_perfis_para_analise():
     """Carrega todos os perfis arquivados que têm uma nota final registada."""
-    if not db:
-        return []
     try:
-        perfis_ref = db.collection('perfis_concursos').where('status', '==', 'Arquivado').stream()
-        perfis_elegiveis = []
-        for perfil in perfis_ref:
-            perfil_data = perfil.to_dict()
-            if perfil_data.get('nota_final') is not None and perfil_data.get('estrutura_prova'):
-                perfil_data['id_documento'] = perfil.id
-                perfis_elegiveis.append(perfil_data)
-        return perfis_elegiveis
+        perfis_arquivados = repositorio.carregar_perfis(db, status='Arquivado')
     except Exception as e:
         st.error(f"Erro ao carregar perfis arquivados: {e}")
         return []
-
-# Função para carregar o dashboard (a mesma da outra página, para consistência)
-@st.cache_data(ttl=300)
-def carregar_dashboard_df(_perfil):
-    """Carrega os dados do dashboard de um perfil específico."""
-    if not _perfil or not db:
-        return pd.DataFrame()
-    colecao_dashboard = _perfil.get('colecao_dashboard')
-    docs = db.collection(colecao_dashboard).stream()
-    df = pd.DataFrame([doc.to_dict() for doc in docs])
-    df.rename(columns={'Total_Questoes_Topico': 'Qsts', 
-                     'Total_Acertos_Topico': 'Acertos'}, inplace=True, errors='ignore')
-    return df
+    return [
+        perfil for perfil in perfis_arquivados.values()
+        if perfil.get('nota_final') is not None and perfil.get('estrutura_prova')
+    ]
 
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Análise Final", page_icon="🏆", layout="wide")
+instrumentacao.iniciar_rerun("Análise Final")
 
 st.markdown("# 🏆 Análise Final de Performance")
 st.markdown("Compare o seu desempenho nos estudos com o resultado real da prova.")
@@ -68,7 +52,10 @@ else:
         perfil_selecionado = next((p for p in perfis_analisaveis if f"{p['nome']} ({p['ano']})" == perfil_selecionado_nome), None)
 
         if perfil_selecionado:
-            df_dashboard = carregar_dashboard_df(perfil_selecionado)
+            try:
+                df_dashboard = repositorio.carregar_dashboard_df(db, perfil_selecionado)
+            except Exception:
+                df_dashboard = pd.DataFrame()
             
             if df_dashboard.empty:
                 st.error("Não foi possível carregar os dados de estudo para este perfil.")
@@ -78,31 +65,13 @@ else:
                 estrutura_prova = perfil_selecionado.get('estrutura_prova', {})
                 nota_real = perfil_selecionado.get('nota_final')
                 
-                resultados = []
-                nota_simulada_total = 0.0
-
-                for disciplina, dados_prova in estrutura_prova.items():
-                    df_disciplina = df_dashboard[df_dashboard['Disciplina'] == disciplina]
-                    
-                    total_acertos_disciplina = df_disciplina['Acertos'].sum()
-                    total_questoes_disciplina = df_disciplina['Qsts'].sum()
-
-                    perf_estudos = (total_acertos_disciplina / total_questoes_disciplina * 100) if total_questoes_disciplina > 0 else 0
-                    
-                    num_questoes_prova = dados_prova.get('num_questoes', 0)
-                    peso = dados_prova.get('peso', 1.0)
-                    
-                    pontuacao_maxima_disciplina = num_questoes_prova * peso
-                    pontuacao_estimada = (perf_estudos / 100) * pontuacao_maxima_disciplina
-                    nota_simulada_total += pontuacao_estimada
-
-                    resultados.append({
-                        'Disciplina': disciplina,
-                        'Perf. Estudos (%)': f"{perf_estudos:.2f}",
-                        'Pontuação Estimada': f"{pontuacao_estimada:.2f} / {pontuacao_maxima_disciplina:.2f}"
-                    })
-
-                df_relatorio = pd.DataFrame(resultados)
+                df_pontuacao, nota_simulada_total = repositorio.calcular_analise_final(estrutura_prova, df_dashboard)
+                df_relatorio = pd.DataFrame({
+                    'Disciplina': df_pontuacao['Disciplina'],
+                    'Perf. Estudos (%)': df_pontuacao['Perf. Estudos (%)'].map(lambda v: f"{v:.2f}"),
+                    'Pontuação Estimada': [f"{estimada:.2f} / {maxima:.2f}" for estimada, maxima in
+                                           zip(df_pontuacao['Pontuação Estimada'], df_pontuacao['Pontuação Máxima'])]
+                })
                 
                 st.dataframe(df_relatorio, hide_index=True, use_container_width=True)
                 
@@ -112,3 +81,4 @@ else:
                 col1.metric("Nota Simulada Final (com base nos estudos)", f"{nota_simulada_total:.2f}")
                 col2.metric("Nota Real na Prova", f"{nota_real:.2f}", delta=f"{nota_real - nota_simulada_total:.2f}")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
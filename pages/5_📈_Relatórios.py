@@ -1,51 +1,22 @@
 import streamlit as st
 import pandas as pd
-from firebase_admin import firestore
 from datetime import datetime, timedelta
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception:
         return None
 
 db = get_db_connection()
 
-# Funções de carregamento de dados
-@st.cache_data(ttl=300)
-def carregar_dashboard_df(_perfil):
-    if not _perfil or not db: return pd.DataFrame()
-    try:
-        docs = db.collection(_perfil.get('colecao_dashboard')).stream()
-        return pd.DataFrame([doc.to_dict() for doc in docs])
-    except Exception: return pd.DataFrame()
-
-@st.cache_data(ttl=300)
-def carregar_historico_tempo_df(_perfil):
-    if not _perfil or not db: return pd.DataFrame()
-    try:
-        docs = db.collection(f"historico_tempo_{_perfil.get('id_documento')}").stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        if not df.empty and 'Data' in df.columns:
-            df['Data_dt'] = pd.to_datetime(df['Data'], format='%d/%m/%Y', errors='coerce')
-        return df
-    except Exception: return pd.DataFrame()
-
-@st.cache_data(ttl=300)
-def carregar_historico_questoes_df(_perfil):
-    if not _perfil or not db: return pd.DataFrame()
-    try:
-        docs = db.collection(_perfil.get('colecao_historico')).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        if not df.empty and 'Data' in df.columns:
-            df['Data_dt'] = pd.to_datetime(df['Data'], format='%d/%m/%Y', errors='coerce')
-        return df
-    except Exception: return pd.DataFrame()
-
 def formatar_minutos(total_minutos):
     if total_minutos is None or total_minutos < 0: return "N/A"
     horas = int(total_minutos // 60)
@@ -54,6 +25,7 @@ def formatar_minutos(total_minutos):
 
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Relatórios", page_icon="📈", layout="wide")
+instrumentacao.iniciar_rerun("Relatórios")
 
 st.markdown("# 📈 Relatórios Analíticos")
 st.markdown("Analise seu progresso com visões consolidadas do seu desempenho.")
@@ -62,11 +34,6 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
     perfil = st.session_state.perfil_selecionado
     st.info(f"Exibindo relatórios para o concurso: **{perfil['nome']}**")
 
-    # --- CARREGAMENTO INICIAL DOS DADOS ---
-    df_dashboard_total = carregar_dashboard_df(perfil)
-    df_tempo_total = carregar_historico_tempo_df(perfil)
-    df_questoes_total = carregar_historico_questoes_df(perfil)
-
     # --- NOVO SELETOR DE PERÍODO ---
     st.sidebar.title("Filtro Temporal")
     periodo_selecionado = st.sidebar.selectbox(
@@ -95,13 +62,25 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
     elif periodo_selecionado == "Últimos 3 meses":
         data_inicio = hoje - timedelta(days=90)
 
-    # Filtra os dataframes de histórico
+    # --- CARREGAMENTO DOS DADOS ---
+    # O dashboard e os resumos diários do período (um documento por dia de estudo) são lidos em simultâneo
+    dados = repositorio.carregar_em_paralelo({
+        'dashboard': lambda: repositorio.carregar_dashboard_df(db, perfil),
+        'resumos': lambda: repositorio.carregar_resumos(db, perfil, repositorio.PERIODO_DIA, desde=data_inicio),
+    })
+    df_dashboard_total = dados['dashboard']
+    if isinstance(df_dashboard_total, Exception):
+        st.error(f"Erro ao carregar os dados do perfil: {df_dashboard_total}")
+        df_dashboard_total = pd.DataFrame()
+    df_resumo = dados['resumos']
+    if isinstance(df_resumo, Exception):
+        st.error(f"Erro ao carregar os resumos do período: {df_resumo}")
+        df_resumo = pd.DataFrame(columns=repositorio.COLUNAS_RESUMO)
     if data_inicio:
-        df_tempo = df_tempo_total[df_tempo_total['Data_dt'] >= data_inicio] if not df_tempo_total.empty else pd.DataFrame()
-        df_questoes = df_questoes_total[df_questoes_total['Data_dt'] >= data_inicio] if not df_questoes_total.empty else pd.DataFrame()
-    else: # "Todo o período"
-        df_tempo = df_tempo_total
-        df_questoes = df_questoes_total
+        df_resumo = df_resumo[df_resumo['Data'] >= data_inicio]
+
+    df_questoes = df_resumo[df_resumo['Total_Questoes'] > 0]
+    df_tempo = df_resumo[df_resumo['Tempo_Estudado_Minutos'] > 0]
 
     # ATENÇÃO: Os KPIs do dashboard (Total_Questoes_Topico, etc) refletem o total.
     # Para o relatório de performance por disciplina, vamos recalcular com base no histórico filtrado.
@@ -116,17 +95,16 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
         st.subheader(f"Painel de Controle Geral ({periodo_selecionado})")
         
         # Cálculos dos KPIs baseados nos dados FILTRADOS
-        total_questoes_periodo = df_questoes['Total_Questoes'].sum() if not df_questoes.empty else 0
-        total_acertos_periodo = df_questoes['Acertos'].sum() if not df_questoes.empty else 0
+        total_questoes_periodo = df_questoes['Total_Questoes'].sum()
+        total_acertos_periodo = df_questoes['Acertos'].sum()
         performance_periodo = (total_acertos_periodo / total_questoes_periodo * 100) if total_questoes_periodo > 0 else 0
         
-        tempo_total_periodo_min = df_tempo['Tempo_Estudado_Minutos'].sum() if not df_tempo.empty else 0
+        tempo_total_periodo_min = df_tempo['Tempo_Estudado_Minutos'].sum()
         
         media_diaria_min = 0
-        if not df_tempo.empty and 'Data_dt' in df_tempo.columns:
-            dias_de_estudo = df_tempo['Data_dt'].dropna().dt.date.nunique()
-            if dias_de_estudo > 0:
-                media_diaria_min = tempo_total_periodo_min / dias_de_estudo
+        dias_de_estudo = df_tempo['Data'].nunique()
+        if dias_de_estudo > 0:
+            media_diaria_min = tempo_total_periodo_min / dias_de_estudo
         
         progresso_edital = (len(df_dashboard[df_dashboard['Domínio'] != '[Não Medido]']) / len(df_dashboard) * 100) if not df_dashboard.empty else 0
 
@@ -148,11 +126,11 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
             if df_questoes.empty:
                 st.info("Sem dados de questões para o período selecionado.")
             else:
-                # Recalcula a performance com base nos tópicos do dashboard e no histórico de questões filtrado
-                performance_disciplina = df_questoes.groupby(df_questoes['ID_Topico'].map(df_dashboard.set_index('ID')['Disciplina'])).agg(
+                # Recalcula a performance com base nos resumos diários do período
+                performance_disciplina = df_questoes.groupby('Disciplina', observed=True).agg(
                     Total_Questoes=('Total_Questoes', 'sum'),
                     Total_Acertos=('Acertos', 'sum')
-                ).reset_index().rename(columns={'ID_Topico': 'Disciplina'})
+                ).reset_index()
 
                 performance_disciplina['Performance Geral (%)'] = (performance_disciplina['Total_Acertos'] / performance_disciplina['Total_Questoes'] * 100).fillna(0)
                 
@@ -164,15 +142,14 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
         # Aba 2: Atividade Diária
         with tab2:
             st.subheader(f"Atividade Diária ({periodo_selecionado})")
-            if df_questoes.empty or 'Data_dt' not in df_questoes.columns:
+            if df_questoes.empty:
                 st.info("Ainda não há registros de simulados para o período selecionado.")
             else:
-                atividade_diaria = df_questoes.groupby(df_questoes['Data_dt'].dt.date).agg(
+                atividade_diaria = df_questoes.groupby(df_questoes['Data'].dt.date).agg(
                     Total_Questoes=('Total_Questoes', 'sum'),
                     Acertos=('Acertos', 'sum')
                 ).reset_index()
                 atividade_diaria['Performance (%)'] = (atividade_diaria['Acertos'] / atividade_diaria['Total_Questoes'] * 100).fillna(0)
-                atividade_diaria.rename(columns={'Data_dt': 'Data'}, inplace=True)
                 
                 st.dataframe(atividade_diaria.sort_values(by='Data', ascending=False), use_container_width=True, hide_index=True)
                 
@@ -185,7 +162,7 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
             if df_tempo.empty:
                 st.info("Ainda não há registros de tempo de estudo para o período selecionado.")
             else:
-                tempo_por_materia = df_tempo.groupby('Disciplina')['Tempo_Estudado_Minutos'].sum().reset_index()
+                tempo_por_materia = df_tempo.groupby('Disciplina', observed=True)['Tempo_Estudado_Minutos'].sum().reset_index()
                 tempo_por_materia['Tempo Total'] = tempo_por_materia['Tempo_Estudado_Minutos'].apply(formatar_minutos)
                 
                 df_para_exibir = tempo_por_materia.sort_values(by='Tempo_Estudado_Minutos', ascending=False)
@@ -203,3 +180,4 @@ else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
@@ -1,38 +1,24 @@
 import streamlit as st
 import pandas as pd
-from firebase_admin import firestore
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception:
         return None
 
 db = get_db_connection()
 
-@st.cache_data(ttl=300)
-def carregar_dashboard_df(_perfil):
-    """Carrega a tabela de performance de um perfil."""
-    if not _perfil or not db:
-        return pd.DataFrame()
-    try:
-        colecao_dashboard = _perfil.get('colecao_dashboard')
-        docs = db.collection(colecao_dashboard).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        # Garante que a coluna 'ID' é numérica para ordenação
-        df['ID'] = pd.to_numeric(df['ID'], errors='coerce')
-        df.sort_values(by='ID', inplace=True)
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar o dashboard: {e}")
-        return pd.DataFrame()
-
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Estudo Teórico", page_icon="📖", layout="centered")
+instrumentacao.iniciar_rerun("Estudo Teórico")
 
 st.markdown("# 📖 Registro de Estudo Teórico")
 st.markdown("Marque os tópicos do edital cuja teoria já concluiu.")
@@ -41,7 +27,11 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
     perfil = st.session_state.perfil_selecionado
     st.info(f"A gerir o estudo teórico para o concurso: **{perfil['nome']}**")
 
-    df_dashboard = carregar_dashboard_df(perfil)
+    try:
+        df_dashboard = repositorio.carregar_dashboard_df(db, perfil)
+    except Exception as e:
+        st.error(f"Erro ao carregar o dashboard: {e}")
+        df_dashboard = pd.DataFrame()
 
     if not df_dashboard.empty:
         # Filtra apenas os tópicos que ainda não foram marcados como estudados
@@ -77,17 +67,15 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
                         with st.spinner("A atualizar o seu progresso na nuvem..."):
                             try:
                                 colecao_dashboard = perfil.get('colecao_dashboard')
-                                batch = db.batch()
+                                lote = db.lote()
                                 
                                 for id_topico in ids_para_marcar:
-                                    doc_ref = db.collection(colecao_dashboard).document(str(id_topico))
-                                    batch.update(doc_ref, {'Teoria (T)': '[X]'})
+                                    lote.atualizar(colecao_dashboard, str(id_topico), {'Teoria (T)': '[X]'})
                                 
-                                batch.commit()
+                                lote.confirmar()
+                                repositorio.invalidar(perfil['id_documento'], colecao_dashboard)
                                 st.success(f"{len(ids_para_marcar)} tópico(s) marcado(s) com sucesso!")
-                                
-                                # Limpa o cache para recarregar os dados atualizados
-                                st.cache_data.clear()
+
                                 # Força o recarregamento da página para atualizar a lista
                                 st.rerun()
 
@@ -100,3 +88,4 @@ else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
@@ -1,80 +1,37 @@
 import streamlit as st
 import pandas as pd
-from firebase_admin import firestore
-from datetime import datetime
+import armazenamento
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception:
         return None
 
 db = get_db_connection()
 
-@st.cache_data(ttl=300)
-def carregar_topicos_do_perfil(_perfil):
-    """Carrega a lista de todos os tópicos de um perfil."""
-    if not _perfil or not db:
-        return []
-    try:
-        colecao_dashboard = _perfil.get('colecao_dashboard')
-        docs = db.collection(colecao_dashboard).order_by("ID").stream()
-        topicos = [{"id": int(doc.to_dict().get('ID')), "display": f"{doc.to_dict().get('ID')} - {doc.to_dict().get('Tópico do Edital')}"} for doc in docs]
-        return topicos
-    except Exception as e:
-        st.error(f"Erro ao carregar tópicos do Firebase: {e}")
-        return []
-
-@st.cache_data(ttl=300)
-def carregar_historico_topico(_perfil, id_topico):
-    """Carrega o histórico de lançamentos para um tópico específico."""
-    if not _perfil or not db or not id_topico:
-        return pd.DataFrame()
-    try:
-        colecao_historico = _perfil.get('colecao_historico')
-        docs = db.collection(colecao_historico).where('ID_Topico', '==', id_topico).stream()
-        
-        registros = []
-        for doc in docs:
-            registro = doc.to_dict()
-            registro['id_documento_historico'] = doc.id
-            registros.append(registro)
-
-        if not registros:
-            return pd.DataFrame()
-
-        df = pd.DataFrame(registros)
-        # Converte a data para um formato ordenável e depois formata para exibição
-        df['Data'] = pd.to_datetime(df['Data'], format='%d/%m/%Y', errors='coerce')
-        df = df.sort_values(by='Data', ascending=False)
-        df['Data'] = df['Data'].dt.strftime('%d/%m/%Y')
-        return df
-
-    except Exception as e:
-        st.error(f"Erro ao carregar o histórico do tópico: {e}")
-        return pd.DataFrame()
-
-def get_nivel_dominio(percentual):
-    if percentual >= 90: return '[Domínio Mestre]'
-    elif 80 <= percentual < 90: return '[Domínio Sólido]'
-    elif 65 <= percentual < 80: return '[Em Desenvolvimento]'
-    else: return '[Revisão Urgente]'
-
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Gerenciar Histórico", page_icon="🗂️", layout="wide")
+instrumentacao.iniciar_rerun("Gerenciar Histórico")
 
 st.markdown("# 🗂️ Gerenciar Histórico de Lançamentos")
-st.markdown("Visualize o histórico detalhado de um tópico e apague registros incorretos.")
+st.markdown("Visualize o histórico detalhado de um tópico, selecione registros incorretos e apague-os de uma só vez.")
 
 if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecionado:
     perfil = st.session_state.perfil_selecionado
     st.info(f"A gerenciar o histórico para o concurso: **{perfil['nome']}**")
 
-    topicos = carregar_topicos_do_perfil(perfil)
+    try:
+        topicos = repositorio.opcoes_topicos(db, perfil)
+    except Exception as e:
+        st.error(f"Erro ao carregar tópicos do Firebase: {e}")
+        topicos = []
     if topicos:
         opcoes_display = [topico['display'] for topico in topicos]
         
@@ -87,75 +44,74 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
 
         if topico_selecionado_display:
             id_topico_selecionado = int(topico_selecionado_display.split(" - ")[0])
-            
-            df_historico_topico = carregar_historico_topico(perfil, id_topico_selecionado)
-
-            if df_historico_topico.empty:
+            tamanho_pagina = st.selectbox("Lançamentos por página:", options=[10, 20, 50],
+                                          index=[10, 20, 50].index(repositorio.TAMANHO_PAGINA_HISTORICO))
+
+            # Pilha dos cursores das páginas já visitadas; recomeça ao mudar de tópico ou de tamanho.
+            paginacao = st.session_state.get('paginacao_historico')
+            if not paginacao or paginacao['chave'] != (perfil['id_documento'], id_topico_selecionado, tamanho_pagina):
+                paginacao = {'chave': (perfil['id_documento'], id_topico_selecionado, tamanho_pagina), 'cursores': [None]}
+                st.session_state.paginacao_historico = paginacao
+            cursores = paginacao['cursores']
+
+            try:
+                df_historico_topico, proximo_cursor = repositorio.carregar_pagina_historico_topico(
+                    db, perfil, id_topico_selecionado, cursores[-1], tamanho_pagina)
+            except Exception as e:
+                st.error(f"Erro ao carregar o histórico do tópico: {e}")
+                df_historico_topico, proximo_cursor = pd.DataFrame(), None
+
+            if df_historico_topico.empty and len(cursores) > 1:
+                # A página ficou vazia (por ex. depois de apagar o seu último registro): volta à anterior.
+                cursores.pop()
+                st.rerun()
+            elif df_historico_topico.empty:
                 st.warning("Ainda não há lançamentos no histórico para este tópico.")
             else:
                 st.subheader(f"Histórico de: {topico_selecionado_display}")
                 
-                # Exibe cada registro com um botão de apagar
-                for index, row in df_historico_topico.iterrows():
-                    with st.container(border=True):
-                        col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
-                        col1.metric("Data", row['Data'])
-                        col2.metric("Nº de Questões", f"{row['Total_Questoes']:.0f}")
-                        col3.metric("Nº de Acertos", f"{row['Acertos']:.0f}")
-                        col4.metric("Performance", f"{row['%']:.2f}%")
-                        
-                        if col5.button("Apagar", key=row['id_documento_historico'], type="secondary"):
-                            
-                            with st.spinner("A apagar registro e a recalcular performance..."):
-                                try:
-                                    # Dados a serem subtraídos
-                                    questoes_a_remover = row['Total_Questoes']
-                                    acertos_a_remover = row['Acertos']
-                                    id_doc_historico = row['id_documento_historico']
-                                    
-                                    # Referências dos documentos
-                                    doc_ref_historico = db.collection(perfil['colecao_historico']).document(id_doc_historico)
-                                    doc_ref_dashboard = db.collection(perfil['colecao_dashboard']).document(str(id_topico_selecionado))
-                                    
-                                    # Transação para garantir consistência
-                                    @firestore.transactional
-                                    def apagar_e_atualizar(transaction, ref_dashboard, ref_historico, q_remover, a_remover):
-                                        # 1. Lê o estado atual do dashboard
-                                        snapshot_dashboard = ref_dashboard.get(transaction=transaction)
-                                        total_q_antigo = snapshot_dashboard.get('Total_Questoes_Topico') or 0
-                                        total_a_antigo = snapshot_dashboard.get('Total_Acertos_Topico') or 0
-
-                                        # 2. Calcula os novos totais
-                                        novo_total_q = total_q_antigo - q_remover
-                                        novo_total_a = total_a_antigo - a_remover
-                                        
-                                        # 3. Recalcula a performance
-                                        novo_perc = (novo_total_a / novo_total_q * 100) if novo_total_q > 0 else 0.0
-                                        novo_dominio = get_nivel_dominio(novo_perc) if novo_total_q > 0 else "[Não Medido]"
-
-                                        # 4. Atualiza o dashboard
-                                        transaction.update(ref_dashboard, {
-                                            'Total_Questoes_Topico': novo_total_q,
-                                            'Total_Acertos_Topico': novo_total_a,
-                                            '%': novo_perc,
-                                            'Domínio': novo_dominio
-                                        })
-
-                                        # 5. Apaga o registro do histórico
-                                        transaction.delete(ref_historico)
-
-                                    transaction = db.transaction()
-                                    apagar_e_atualizar(transaction, doc_ref_dashboard, doc_ref_historico, questoes_a_remover, acertos_a_remover)
-                                    
-                                    st.success("Registro apagado com sucesso!")
-                                    st.cache_data.clear() # Limpa todo o cache
-                                    st.rerun()
-
-                                except Exception as e:
-                                    st.error(f"Ocorreu um erro ao apagar o registro: {e}")
+                # Tabela da página com seleção de várias linhas; a chave muda com os dados,
+                # pelo que a seleção é limpa depois de apagar.
+                versao = repositorio.versao_dados(perfil['id_documento'], perfil['colecao_historico'])
+                selecao = st.dataframe(
+                    df_historico_topico[['Data', 'Total_Questoes', 'Acertos', '%']],
+                    column_config={
+                        'Total_Questoes': st.column_config.NumberColumn("Nº de Questões", format="%d"),
+                        'Acertos': st.column_config.NumberColumn("Nº de Acertos", format="%d"),
+                        '%': st.column_config.NumberColumn("Performance", format="%.2f%%"),
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                    on_select="rerun",
+                    selection_mode="multi-row",
+                    key=f"tabela_historico_{id_topico_selecionado}_{len(cursores)}_{versao}",
+                )
+                linhas_selecionadas = selecao.selection.rows
+
+                if st.button(f"Apagar selecionados ({len(linhas_selecionadas)})", type="primary",
+                             disabled=not linhas_selecionadas):
+                    with st.spinner("A apagar registros e a recalcular performance..."):
+                        try:
+                            # Uma só transação para todos: histórico, dashboard e resumos ficam sempre consistentes
+                            registros = df_historico_topico.iloc[linhas_selecionadas].to_dict('records')
+                            repositorio.apagar_registros_historico(db, perfil, registros)
+                            st.success(f"{len(registros)} registro(s) apagado(s) com sucesso!")
+                            st.rerun()
+
+                        except Exception as e:
+                            st.error(f"Ocorreu um erro ao apagar os registros: {e}")
+
+                col_anterior, col_pagina, col_seguinte = st.columns([1, 2, 1])
+                col_anterior.button("◀ Mais recentes", disabled=len(cursores) == 1,
+                                    on_click=cursores.pop, use_container_width=True)
+                col_pagina.caption(f"Página {len(cursores)}")
+                col_seguinte.button("Mais antigos ▶", disabled=proximo_cursor is None,
+                                    on_click=cursores.append, args=(proximo_cursor,), use_container_width=True)
 
     else:
         st.warning("Não foi possível carregar os tópicos do edital.")
 else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
+
+instrumentacao.concluir_rerun(mostrar_painel=True)
@@ -1,38 +1,26 @@
 import streamlit as st
-from firebase_admin import firestore
 from datetime import date
-import pandas as pd
+import armazenamento
+import importacao
+import instrumentacao
+import repositorio
 
 # --- FUNÇÕES AUXILIARES ---
 
 @st.cache_resource
 def get_db_connection():
-    """Obtém a conexão com o cliente do Firestore."""
+    """Obtém o armazenamento configurado (Firestore por omissão, ver armazenamento.py)."""
     try:
-        return firestore.client()
+        return armazenamento.conectar()
     except Exception as e:
         st.error(f"Erro ao obter conexão com o Firebase: {e}")
         return None
 
 db = get_db_connection()
 
-@st.cache_data(ttl=300)
-def get_disciplinas_from_dashboard(_perfil):
-    """Obtém a lista de disciplinas únicas de um dashboard."""
-    if not _perfil or not db:
-        return []
-    try:
-        colecao_dashboard = _perfil.get('colecao_dashboard')
-        docs = db.collection(colecao_dashboard).stream()
-        df = pd.DataFrame([doc.to_dict() for doc in docs])
-        if 'Disciplina' in df.columns and not df.empty:
-            return sorted(df['Disciplina'].unique().tolist())
-        return []
-    except Exception:
-        return []
-
 # --- LÓGICA DA PÁGINA ---
 st.set_page_config(page_title="Registrar Tempo de Estudo", page_icon="⏱️", layout="centered")
+instrumentacao.iniciar_rerun("Registrar Tempo de Estudo")
 
 st.markdown("# ⏱️ Registrar Tempo de Estudo")
 
@@ -52,7 +40,10 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
         st.subheader("Sessão de Estudo")
 
         # Seleção de Disciplinas (Matérias)
-        lista_disciplinas = get_disciplinas_from_dashboard(perfil)
+        try:
+            lista_disciplinas = repositorio.listar_disciplinas(db, perfil)
+        except Exception:
+            lista_disciplinas = []
         
         if not lista_disciplinas:
             st.warning("Não foi possível carregar as disciplinas do perfil selecionado.")
@@ -80,30 +71,51 @@ if 'perfil_selecionado' in st.session_state and st.session_state.perfil_selecion
                 else:
                     with st.spinner("Salvando sessão de estudo..."):
                         try:
-                            # CORREÇÃO AQUI: Usa o 'id_documento' garantido pela sessão
-                            id_perfil = perfil.get('id_documento')
-                            if not id_perfil:
-                                raise ValueError("ID do perfil não encontrado na sessão. Por favor, recarregue o perfil na página principal.")
-
-                            colecao_historico_tempo = f"historico_tempo_{id_perfil}"
-                            
-                            data_sessao_str = data_selecionada.strftime('%d/%m/%Y')
-                            
-                            db.collection(colecao_historico_tempo).add({
-                                'Disciplina': disciplina_selecionada,
-                                'Data': data_sessao_str,
-                                'Tempo_Estudado_Minutos': tempo_total_minutos
-                            })
+                            # Grava a sessão e atualiza os resumos do dia e da semana no mesmo commit
+                            repositorio.registrar_tempo(db, perfil, disciplina_selecionada, data_selecionada, tempo_total_minutos)
 
                             st.success(f"Sessão de estudo de {tempo_total_minutos} minutos em '{disciplina_selecionada}' registrada com sucesso!")
                             st.balloons()
-                            # Limpa o cache para que o relatório seja atualizado
-                            st.cache_data.clear()
 
                         except Exception as e:
                             st.error(f"Ocorreu um erro ao salvar a sessão: {e}")
 
+    # --- IMPORTAÇÃO EM MASSA ---
+    st.markdown("---")
+    with st.expander("📥 Importar várias sessões de um arquivo (CSV ou JSON)"):
+        st.caption("Uma linha por sessão, com as colunas Data, Disciplina e Minutos "
+                   "(ex.: 15/03/2025;Língua Portuguesa;90). Se alguma linha for inválida, nada é gravado.")
+        arquivo = st.file_uploader("Arquivo de sessões", type=["csv", "json"], key="arquivo_sessoes")
+        if arquivo:
+            df_importar = None
+            try:
+                df_importar = importacao.carregar_lancamentos(db, perfil, arquivo, importacao.TIPO_TEMPO, arquivo.name)
+            except importacao.ErroValidacao as e:
+                for erro in e.erros:
+                    st.error(erro)
+            except Exception as e:
+                st.error(f"Não foi possível ler o arquivo: {e}")
+
+            importados = st.session_state.setdefault('arquivos_importados', set())
+            if df_importar is not None and arquivo.file_id in importados:
+                st.info("Este arquivo já foi importado.")
+            elif df_importar is not None:
+                st.dataframe(df_importar, hide_index=True, use_container_width=True)
+                st.caption(f"{len(df_importar)} sessões, {df_importar['Tempo_Estudado_Minutos'].sum()} minutos no total.")
+                if st.button("Gravar Sessões", type="primary"):
+                    barra = st.progress(0.0, text="A gravar sessões...")
+                    try:
+                        gravadas = repositorio.registrar_tempo_em_massa(
+                            db, perfil, df_importar,
+                            lambda gravadas, total: barra.progress(gravadas / total, text=f"A gravar sessões: {gravadas}/{total}")
+                        )
+                        importados.add(arquivo.file_id)
+                        st.success(f"{gravadas} sessões de estudo gravadas!")
+                    except Exception as e:
+                        st.error(f"Ocorreu um erro ao gravar as sessões: {e}")
+
 else:
     st.warning("Por favor, selecione um perfil na página principal para começar.")
     st.page_link("app_gui.py", label="Ir para a Página Principal", icon="🏠")
 
+instrumentacao.concluir_rerun(mostrar_painel=True)
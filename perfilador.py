@@ -0,0 +1,187 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime
+
+# --- PERFILADOR OPCIONAL POR RERUN ---
+#
+# Com COACH_PERFILADOR definida, cada rerun de uma página (e cada ação do menu
+# da CLI) é perfilado entre instrumentacao.iniciar_rerun() e concluir_rerun():
+#   cprofile    - determinístico; grava o .prof (pstats, snakeviz) e um resumo .txt;
+#   amostragem  - amostra a pilha da thread do rerun a cada INTERVALO_AMOSTRAGEM
+#                 segundos, com custo quase nulo para a página; grava um resumo
+#                 .txt e as pilhas colapsadas (.folded, para flamegraph/speedscope).
+#
+# Os ficheiros ficam em PASTA_PADRAO (ou em COACH_PERFILADOR_PASTA), uma
+# subpasta por página, um ficheiro por rerun. O resumo lista as TOP_N funções
+# mais quentes, por tempo próprio e por tempo acumulado.
+
+VARIAVEL_AMBIENTE = 'COACH_PERFILADOR'
+VARIAVEL_PASTA = 'COACH_PERFILADOR_PASTA'
+MODO_CPROFILE = 'cprofile'
+MODO_AMOSTRAGEM = 'amostragem'
+PASTA_PADRAO = 'perfis_execucao'
+TOP_N = 30
+INTERVALO_AMOSTRAGEM = 0.005  # segundos
+
+_lock = threading.Lock()
+_abertas = {}  # ident da thread -> sessão ainda não concluída
+
+
+def modo():
+    """Devolve o modo pedido em COACH_PERFILADOR ('1' equivale a cprofile), ou None se desligado."""
+    valor = os.environ.get(VARIAVEL_AMBIENTE, '').strip().lower()
+    if valor in ('', '0', 'false', 'nao', 'não'):
+        return None
+    if valor in ('1', 'true', 'sim', MODO_CPROFILE):
+        return MODO_CPROFILE
+    if valor == MODO_AMOSTRAGEM:
+        return MODO_AMOSTRAGEM
+    raise ValueError(f"Modo de perfilamento desconhecido em {VARIAVEL_AMBIENTE}: '{valor}'.")
+
+def _nome_ficheiro(texto):
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^A-Za-z0-9]+', '_', texto).strip('_').lower() or 'pagina'
+
+
+# --- SESSÕES ---
+
+class _Sessao:
+    """Perfilamento de um rerun, na thread que o executa."""
+
+    def __init__(self, pagina):
+        self.pagina = pagina
+        self.thread = threading.get_ident()
+        self.iniciado_em = datetime.now()
+        self.inicio = time.perf_counter()
+
+    def caminho_base(self):
+        pasta = os.path.join(os.environ.get(VARIAVEL_PASTA, PASTA_PADRAO), _nome_ficheiro(self.pagina))
+        os.makedirs(pasta, exist_ok=True)
+        return os.path.join(pasta, self.iniciado_em.strftime('%Y%m%d-%H%M%S-%f'))
+
+    def cabecalho(self, concluido):
+        duracao = time.perf_counter() - self.inicio
+        estado = '' if concluido else ' (interrompido: st.rerun, st.stop ou exceção)'
+        return (f"Página: {self.pagina}\nInício: {self.iniciado_em.isoformat(timespec='milliseconds')}\n"
+                f"Duração: {duracao * 1000:.1f} ms{estado}\n")
+
+
+class _SessaoCProfile(_Sessao):
+
+    def __init__(self, pagina):
+        super().__init__(pagina)
+        self.perfil = cProfile.Profile()
+        self.perfil.enable()
+
+    def gravar(self, concluido):
+        self.perfil.disable()
+        base = self.caminho_base()
+        self.perfil.dump_stats(f"{base}.prof")
+        texto = io.StringIO()
+        estatisticas = pstats.Stats(self.perfil, stream=texto).strip_dirs()
+        for ordem, titulo in ((pstats.SortKey.TIME, 'tempo próprio'), (pstats.SortKey.CUMULATIVE, 'tempo acumulado')):
+            texto.write(f"\n=== Top {TOP_N} por {titulo} ===\n")
+            estatisticas.sort_stats(ordem).print_stats(TOP_N)
+        with open(f"{base}.txt", 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write(self.cabecalho(concluido) + texto.getvalue())
+        return f"{base}.txt"
+
+
+class _SessaoAmostragem(_Sessao):
+
+    def __init__(self, pagina):
+        super().__init__(pagina)
+        self.pilhas = Counter()  # pilha (da raiz para a folha) -> amostras
+        self._parar = threading.Event()
+        self._amostrador = threading.Thread(target=self._amostrar, daemon=True, name='perfilador-amostragem')
+        self._amostrador.start()
+
+    def _amostrar(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM):
+            frame = sys._current_frames().get(self.thread)
+            if frame is None:
+                # A thread do rerun terminou sem concluir.
+                return
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            self.pilhas[tuple(reversed(pilha))] += 1
+
+    def gravar(self, concluido):
+        self._parar.set()
+        if self._amostrador is not threading.current_thread():
+            self._amostrador.join()
+        base = self.caminho_base()
+        with open(f"{base}.folded", 'w', encoding='utf-8') as ficheiro:
+            for pilha, amostras in self.pilhas.most_common():
+                ficheiro.write(f"{';'.join(pilha)} {amostras}\n")
+
+        total = sum(self.pilhas.values())
+        proprio, acumulado = Counter(), Counter()
+        for pilha, amostras in self.pilhas.items():
+            proprio[pilha[-1]] += amostras
+            # Recursão: cada função conta uma só vez por pilha.
+            for funcao in set(pilha):
+                acumulado[funcao] += amostras
+
+        linhas = [self.cabecalho(concluido), f"Amostras: {total} (intervalo de {INTERVALO_AMOSTRAGEM * 1000:.0f} ms)\n"]
+        for titulo, contagem in (('tempo próprio', proprio), ('tempo acumulado', acumulado)):
+            linhas.append(f"\n=== Top {TOP_N} por {titulo} ===")
+            linhas.append(f"{'amostras':>9} {'%':>6}  função")
+            for funcao, amostras in contagem.most_common(TOP_N):
+                linhas.append(f"{amostras:>9} {amostras / total * 100 if total else 0:>6.1f}  {funcao}")
+        with open(f"{base}.txt", 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write('\n'.join(linhas) + '\n')
+        return f"{base}.txt"
+
+
+def _fechar(sessao, concluido):
+    try:
+        caminho = sessao.gravar(concluido)
+        print(f"[perfilador] {sessao.pagina}: {caminho}", file=sys.stderr)
+        return caminho
+    except OSError as e:
+        # O perfilamento nunca deve fazer falhar a página que está a medir.
+        print(f"[perfilador] Não foi possível gravar o perfil de '{sessao.pagina}': {e}", file=sys.stderr)
+        return None
+
+def iniciar(pagina):
+    """Começa a perfilar um rerun de `pagina` na thread atual, se COACH_PERFILADOR estiver definida."""
+    modo_pedido = modo()
+    if modo_pedido is None:
+        return
+    # Um rerun interrompido nunca chega a concluir(): grava-o agora, se a sua
+    # thread já terminou ou se é esta mesma thread.
+    atual = threading.get_ident()
+    vivas = {thread.ident for thread in threading.enumerate()}
+    with _lock:
+        interrompidas = [_abertas.pop(ident) for ident in list(_abertas) if ident == atual or ident not in vivas]
+    for sessao in interrompidas:
+        _fechar(sessao, concluido=False)
+
+    try:
+        sessao = _SessaoCProfile(pagina) if modo_pedido == MODO_CPROFILE else _SessaoAmostragem(pagina)
+    except ValueError:
+        # A partir do Python 3.12 só pode haver um cProfile ativo no processo: um
+        # rerun concorrente de outra sessão fica sem perfil.
+        return
+    with _lock:
+        _abertas[atual] = sessao
+
+def concluir():
+    """Termina o perfil do rerun atual e grava-o; devolve o caminho do resumo, ou None."""
+    with _lock:
+        sessao = _abertas.pop(threading.get_ident(), None)
+    if sessao is None:
+        return None
+    return _fechar(sessao, concluido=True)
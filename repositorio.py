@@ -0,0 +1,1473 @@
+import importlib.util
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import armazenamento
+import cache_limitada
+import espelho
+import instrumentacao
+
+# --- CAMADA DE ACESSO A DADOS (PARTILHADA ENTRE AS PÁGINAS E A CLI) ---
+#
+# Cada coleção de um perfil é lida uma única vez por versão de dados. O
+# DataFrame tipado, a lista de disciplinas e as opções dos seletores são
+# todos derivados dessa mesma leitura, em vez de cada página voltar a
+# percorrer a coleção inteira.
+#
+# Quando USAR_ESPELHO está ativo, as leituras vêm do espelho mantido pelos
+# listeners (ver espelho.py) e a versão avança a cada delta recebido, pelo
+# que os dados nunca ficam desatualizados nem voltam a ser lidos por inteiro.
+
+COLUNAS_DASHBOARD = ['ID', 'Disciplina', 'Tópico do Edital', 'Teoria (T)', 'Qsts', 'Acertos', 'Domínio', '%', 'Últ. Medição']
+
+VALORES_PADRAO_DASHBOARD = {
+    'Qsts': 0, 'Acertos': 0, '%': 0, 'ID': 0,
+    'Disciplina': 'N/A', 'Tópico do Edital': '-', 'Teoria (T)': '[ ]',
+    'Domínio': '[Não Medido]', 'Últ. Medição': '-'
+}
+
+# Campo gravado de cada coluna do dashboard, quando o nome difere. '%' e 'Domínio'
+# não são lidos: são recalculados a partir dos contadores (ver calcular_derivados).
+CAMPOS_GRAVADOS_DASHBOARD = {'Qsts': 'Total_Questoes_Topico', 'Acertos': 'Total_Acertos_Topico', 'Últ. Medição': 'Ultima_Medicao'}
+COLUNAS_DERIVADAS_DASHBOARD = ['%', 'Domínio']
+# (coluna, campo gravado, valor por omissão) lidos por decodificar_documentos.
+CAMPOS_DASHBOARD = [
+    (coluna, CAMPOS_GRAVADOS_DASHBOARD.get(coluna, coluna), VALORES_PADRAO_DASHBOARD[coluna])
+    for coluna in COLUNAS_DASHBOARD if coluna not in COLUNAS_DERIVADAS_DASHBOARD
+]
+
+# --- ESQUEMA CANÓNICO DOS DATAFRAMES ---
+#
+# Os DataFrames guardados na cache recebem os tipos uma única vez, na leitura
+# (ver aplicar_esquema): textos repetidos (disciplina, domínio, data) como
+# categorias, contadores em int32, datas em datetime64 e os nomes dos tópicos,
+# todos distintos, em strings do Arrow. Os agrupamentos por colunas categóricas
+# usam observed=True, para não gerar as combinações sem dados.
+
+NIVEIS_DOMINIO = ['[Não Medido]', '[Revisão Urgente]', '[Em Desenvolvimento]', '[Domínio Sólido]', '[Domínio Mestre]']
+TIPO_DOMINIO = pd.CategoricalDtype(NIVEIS_DOMINIO, ordered=True)
+# Sem o pyarrow (opcional com pandas < 3), as strings do pandas sobre arrays de objetos.
+TIPO_TEXTO = 'string[pyarrow]' if importlib.util.find_spec('pyarrow') else 'string'
+TIPO_CONTADOR = 'int32'
+
+ESQUEMA_DASHBOARD = {
+    'ID': TIPO_CONTADOR, 'Disciplina': 'category', 'Tópico do Edital': TIPO_TEXTO, 'Teoria (T)': 'category',
+    'Qsts': TIPO_CONTADOR, 'Acertos': TIPO_CONTADOR, 'Domínio': TIPO_DOMINIO, '%': 'float64', 'Últ. Medição': 'category',
+}
+ESQUEMA_HISTORICO = {
+    'ID_Topico': TIPO_CONTADOR, 'Disciplina': 'category', 'Data': 'category', 'Data_dt': 'datetime64[ns]',
+    'Total_Questoes': TIPO_CONTADOR, 'Acertos': TIPO_CONTADOR, 'Tempo_Estudado_Minutos': TIPO_CONTADOR, '%': 'float64',
+    'id_documento': TIPO_TEXTO,
+}
+ESQUEMA_RESUMO = {
+    'Data': 'datetime64[ns]', 'Disciplina': 'category',
+    'Total_Questoes': TIPO_CONTADOR, 'Acertos': TIPO_CONTADOR, 'Tempo_Estudado_Minutos': TIPO_CONTADOR,
+}
+ESQUEMA_CATALOGO = {'ID': TIPO_CONTADOR, 'Disciplina': 'category', 'Tópico do Edital': TIPO_TEXTO}
+
+# Modos de escrita de lancar_simulado. Em MODO_INCREMENTO os contadores recebem
+# um Incremento sem leitura prévia; '%' e 'Domínio' passam a ser calculados
+# na leitura (ver calcular_derivados) e gravados depois por reconciliar_derivados.
+MODO_INCREMENTO = 'incremento'
+MODO_TRANSACAO = 'transacao'
+
+USAR_ESPELHO = True
+
+# Sem espelho, alterações feitas noutros dispositivos não passam por
+# invalidar, por isso uma entrada nunca é reutilizada para além deste limite.
+IDADE_MAXIMA_CACHE = 300
+
+# Tempo máximo que uma leitura espera pelo delta de uma escrita feita neste processo.
+ESPERA_ESCRITA = 2.0
+
+COLECAO_PERFIS = 'perfis_concursos'
+
+# Data dos registos do histórico como timestamp nativo (meia-noite do dia), ao lado
+# da string 'Data' em '%d/%m/%Y'. Permite ordenar e filtrar intervalos no servidor
+# nos perfis marcados com 'datas_tipadas' (ver migrar_datas_historico).
+CAMPO_DATA = 'Data_Timestamp'
+
+# Lançamentos por página no histórico de um tópico (ver carregar_pagina_historico_topico).
+TAMANHO_PAGINA_HISTORICO = 20
+
+# Resumos pré-agregados por dia e por semana ISO (ver carregar_resumos).
+PERIODO_DIA = 'dia'
+PERIODO_SEMANA = 'semana'
+COLUNAS_RESUMO = ['Data', 'Disciplina', 'Total_Questoes', 'Acertos', 'Tempo_Estudado_Minutos']
+METRICAS_RESUMO = ['Total_Questoes', 'Acertos', 'Tempo_Estudado_Minutos']
+
+# Catálogo compacto dos tópicos (ID, disciplina e nome) usado pelos seletores, para
+# não ler todos os documentos do dashboard. Cada parte fica bem abaixo do limite
+# de 1 MiB por documento do Firestore.
+COLUNAS_CATALOGO = ['ID', 'Disciplina', 'Tópico do Edital']
+LIMITE_BYTES_CATALOGO = 900_000
+
+_logger = logging.getLogger('coach.repositorio')
+
+_lock = threading.Lock()
+# As chaves de versão são (id do perfil, coleção); a lista de perfis usa (None, COLECAO_PERFIS).
+# As entradas da cache acrescentam uma variante, para consultas parciais da mesma coleção.
+_versoes = {}     # (id, coleção) -> versão local, avançada pelas escritas
+_pendentes = {}   # (id, coleção) -> versão do espelho no momento da última escrita
+# (id, coleção, variante) -> (chave de versão, instante da leitura, valor derivado), limitada a
+# COACH_CACHE_MB juntamente com os espelhos: despeja primeiro os perfis usados há mais tempo
+# (ver cache_limitada.py).
+_cache = cache_limitada.DADOS
+_cargas = {}      # (id, coleção, variante) -> [lock da leitura em curso dessa entrada, nº de leitores]
+
+
+def colecao_historico_tempo(perfil):
+    """Nome da coleção do histórico de tempo de estudo de um perfil."""
+    id_perfil = perfil.get('id_documento')
+    return f"historico_tempo_{id_perfil}" if id_perfil else None
+
+def colecao_catalogo(id_perfil):
+    """Nome da coleção com as partes do catálogo de tópicos de um perfil."""
+    return f"catalogo_topicos_{id_perfil}" if id_perfil else None
+
+def colecao_resumos(perfil, periodo):
+    """Nome da coleção de resumos diários ou semanais de um perfil."""
+    id_perfil = perfil.get('id_documento')
+    if not id_perfil:
+        return None
+    return f"resumos_diarios_{id_perfil}" if periodo == PERIODO_DIA else f"resumos_semanais_{id_perfil}"
+
+def carimbo_data(data):
+    """Devolve o valor gravado em CAMPO_DATA para uma data: a meia-noite desse dia."""
+    return datetime(data.year, data.month, data.day)
+
+def versao_dados(id_perfil, colecao):
+    """Devolve a versão local dos dados de uma coleção de um perfil."""
+    with _lock:
+        return _versoes.get((id_perfil, colecao), 0)
+
+def invalidar(id_perfil, colecao):
+    """
+    Avança a versão de uma coleção de um perfil após uma escrita.
+    Só o que foi derivado dessa coleção é descartado; os outros perfis e coleções continuam em cache.
+    """
+    chave = (id_perfil, colecao)
+    espelho_atual = espelho.espelho_existente(id_perfil, colecao)
+    with _lock:
+        _versoes[chave] = _versoes.get(chave, 0) + 1
+        for chave_cache in [c for c in _cache if c[:2] == chave]:
+            del _cache[chave_cache]
+        if espelho_atual is not None and not espelho_atual.sincrono:
+            _pendentes[chave] = espelho_atual.versao
+
+def _aguardar_escrita_pendente(chave, espelho_atual):
+    with _lock:
+        versao_base = _pendentes.pop(chave, None)
+    if versao_base is not None:
+        # O delta pode já ter chegado antes de invalidar; nesse caso a espera
+        # termina pelo tempo limite e apenas atrasa esta leitura.
+        espelho_atual.aguardar_versao(versao_base + 1, ESPERA_ESCRITA)
+
+@contextmanager
+def _carga_exclusiva(chave_cache):
+    """Serializa as leituras de uma entrada; o lock é descartado quando ninguém o usa."""
+    with _lock:
+        entrada = _cargas.setdefault(chave_cache, [threading.RLock(), 0])
+        entrada[1] += 1
+    try:
+        with entrada[0]:
+            yield
+    finally:
+        with _lock:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del _cargas[chave_cache]
+
+def _carregar(db, id_perfil, colecao, construir, filtros=None, variante=None, ler=None):
+    """
+    Devolve o valor derivado de uma coleção, reconstruindo-o só quando a versão muda.
+    Com `filtros` ([(campo, operador, valor)]) lê só os documentos que passam, sem espelho,
+    e guarda o resultado à parte sob `variante`. Com `ler`, os documentos vêm de ler()
+    (por exemplo, uma página ordenada) em vez de db.listar.
+    """
+    chave = (id_perfil, colecao)
+    chave_cache = (id_perfil, colecao, variante)
+    usar_espelho = USAR_ESPELHO and not filtros and ler is None
+    espelho_atual = espelho.obter_espelho(db, id_perfil, colecao) if usar_espelho else None
+    if espelho_atual is not None:
+        _aguardar_escrita_pendente(chave, espelho_atual)
+
+    # Leituras simultâneas da mesma entrada (por ex. de carregar_em_paralelo) esperam pela
+    # primeira e aproveitam o seu resultado, em vez de repetirem a leitura.
+    with _carga_exclusiva(chave_cache):
+        with _lock:
+            versao_local = _versoes.get(chave, 0)
+            entrada = _cache.get(chave_cache)
+
+        if espelho_atual is not None:
+            if entrada and entrada[0] == (versao_local, espelho_atual.versao):
+                instrumentacao.registrar_cache(acerto=True)
+                return entrada[2]
+            versao_espelho, documentos = espelho_atual.instantaneo()
+            chave_versao = (versao_local, versao_espelho)
+        else:
+            chave_versao = (versao_local, None)
+            if entrada and entrada[0] == chave_versao and time.monotonic() - entrada[1] < IDADE_MAXIMA_CACHE:
+                instrumentacao.registrar_cache(acerto=True)
+                return entrada[2]
+            documentos = ler() if ler is not None else db.listar(colecao, filtros or ())
+        instrumentacao.registrar_cache(acerto=False)
+
+        valor = construir(documentos)
+
+        with _lock:
+            # Só guarda se ninguém escreveu na coleção enquanto a leitura decorria.
+            if _versoes.get(chave, 0) == versao_local:
+                _cache[chave_cache] = (chave_versao, time.monotonic(), valor)
+        return valor
+
+def calcular_derivados(questoes, acertos):
+    """Calcula, de forma vetorizada, o '%' e o 'Domínio' a partir dos contadores brutos de cada tópico."""
+    percentual = (acertos / questoes.where(questoes > 0) * 100).fillna(0.0)
+    dominio = np.select(
+        [questoes <= 0, percentual >= 90, percentual >= 80, percentual >= 65],
+        ['[Não Medido]', '[Domínio Mestre]', '[Domínio Sólido]', '[Em Desenvolvimento]'],
+        default='[Revisão Urgente]'
+    )
+    return percentual, pd.Series(dominio, index=questoes.index, dtype=object)
+
+def aplicar_esquema(df, esquema):
+    """Converte as colunas de `df` presentes no esquema para os tipos canónicos (contadores em falta passam a 0)."""
+    for coluna, tipo in esquema.items():
+        if coluna not in df.columns:
+            continue
+        if tipo == TIPO_CONTADOR:
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').fillna(0).astype(tipo)
+        elif tipo == 'float64':
+            df[coluna] = pd.to_numeric(df[coluna], errors='coerce').astype(tipo)
+        elif tipo == 'datetime64[ns]':
+            df[coluna] = pd.to_datetime(df[coluna], errors='coerce').astype(tipo)
+        else:
+            df[coluna] = df[coluna].astype(tipo)
+    return df
+
+def decodificar_documentos(documentos, campos, esquema):
+    """
+    Decodifica os documentos (uma coleção de dicionários) diretamente para um array pré-alocado por
+    coluna e devolve o DataFrame já com os tipos do esquema. `campos` lista (coluna, campo gravado,
+    valor por omissão); campos em falta, a None ou NaN recebem o valor por omissão.
+    """
+    total = len(documentos)
+    colunas = {}
+    for coluna, campo, padrao in campos:
+        valores = np.fromiter((dados.get(campo) for dados in documentos), dtype=object, count=total)
+        valores[pd.isna(valores)] = padrao
+        colunas[coluna] = pd.Series(valores, dtype=object, copy=False)
+    return aplicar_esquema(pd.DataFrame(colunas, copy=False), esquema)
+
+def normalizar_dashboard(documentos):
+    """Converte os documentos brutos do dashboard (uma coleção de dicionários) num DataFrame tipado e ordenado por ID."""
+    if not documentos:
+        return pd.DataFrame()
+
+    df = decodificar_documentos(documentos, CAMPOS_DASHBOARD, ESQUEMA_DASHBOARD)
+    # Os contadores são a fonte de verdade; '%' e 'Domínio' gravados podem estar atrasados.
+    percentual, dominio = calcular_derivados(df['Qsts'], df['Acertos'])
+    df['%'], df['Domínio'] = percentual, dominio.astype(TIPO_DOMINIO)
+
+    return df[COLUNAS_DASHBOARD].sort_values(by='ID').reset_index(drop=True)
+
+def normalizar_historico(documentos):
+    """Converte os documentos de um histórico ({id: dados}) num DataFrame com a data já interpretada."""
+    if not documentos:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(list(documentos.values()))
+    df['id_documento'] = list(documentos.keys())
+
+    datas = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    if CAMPO_DATA in df.columns:
+        # Gravado como meia-noite sem fuso, que o Firestore devolve em UTC.
+        datas = pd.to_datetime(df[CAMPO_DATA], utc=True).dt.tz_localize(None).astype('datetime64[ns]')
+    if 'Data' in df.columns:
+        # Só os registos ainda não migrados precisam de interpretar a string.
+        em_falta = datas.isna()
+        if em_falta.any():
+            datas[em_falta] = pd.to_datetime(df.loc[em_falta, 'Data'], format='%d/%m/%Y', errors='coerce')
+    if CAMPO_DATA in df.columns or 'Data' in df.columns:
+        df['Data_dt'] = datas
+    return aplicar_esquema(df, ESQUEMA_HISTORICO)
+
+def _construir_perfis(documentos):
+    perfis = {}
+    for id_perfil, dados in documentos.items():
+        perfil = dict(dados)
+        perfil['id_documento'] = id_perfil
+        perfis[id_perfil] = perfil
+    return dict(sorted(perfis.items(), key=lambda item: (item[1].get('status', ''), item[1].get('nome', ''))))
+
+def carregar_perfis(db, status=None):
+    """Carrega os perfis de concurso ({id: perfil}), ordenados por status e nome, opcionalmente filtrados por status."""
+    if db is None:
+        return {}
+    perfis = _carregar(db, None, COLECAO_PERFIS, _construir_perfis)
+    # Cópias, para que quem chama possa alterar os dicionários sem afetar a cache partilhada.
+    return {
+        id_perfil: dict(perfil)
+        for id_perfil, perfil in perfis.items()
+        if status is None or perfil.get('status') == status
+    }
+
+def carregar_dashboard_df(db, perfil):
+    """Carrega a tabela de performance de um perfil."""
+    if not perfil or db is None:
+        return pd.DataFrame()
+    colecao_dashboard = perfil.get('colecao_dashboard')
+    if not colecao_dashboard:
+        return pd.DataFrame()
+    return _carregar(db, perfil.get('id_documento'), colecao_dashboard,
+                     lambda documentos: normalizar_dashboard(documentos.values()))
+
+def _carregar_historico(db, perfil, colecao, desde=None):
+    if not colecao:
+        return pd.DataFrame()
+    if desde is None:
+        return _carregar(db, perfil.get('id_documento'), colecao, normalizar_historico)
+
+    inicio = carimbo_data(desde)
+    if perfil.get('datas_tipadas'):
+        # Todos os registos têm CAMPO_DATA: o intervalo é filtrado no servidor.
+        return _carregar(db, perfil.get('id_documento'), colecao, normalizar_historico,
+                         filtros=[(CAMPO_DATA, '>=', inicio)], variante=inicio)
+    df = _carregar(db, perfil.get('id_documento'), colecao, normalizar_historico)
+    if df.empty or 'Data_dt' not in df.columns:
+        return df
+    return df[df['Data_dt'] >= inicio].reset_index(drop=True)
+
+def carregar_historico_questoes_df(db, perfil, desde=None):
+    """Carrega o histórico de questões de um perfil, opcionalmente só a partir do dia `desde`."""
+    if not perfil or db is None:
+        return pd.DataFrame()
+    return _carregar_historico(db, perfil, perfil.get('colecao_historico'), desde)
+
+def carregar_historico_tempo_df(db, perfil, desde=None):
+    """Carrega o histórico de tempo de estudo de um perfil, opcionalmente só a partir do dia `desde`."""
+    if not perfil or db is None:
+        return pd.DataFrame()
+    return _carregar_historico(db, perfil, colecao_historico_tempo(perfil), desde)
+
+def carregar_historico_topico(db, perfil, id_topico):
+    """Devolve os lançamentos de um tópico, do mais recente para o mais antigo."""
+    df = carregar_historico_questoes_df(db, perfil)
+    if df.empty or 'ID_Topico' not in df.columns:
+        return pd.DataFrame()
+    df_topico = df[df['ID_Topico'] == id_topico]
+    if 'Data_dt' in df_topico.columns:
+        df_topico = df_topico.sort_values(by='Data_dt', ascending=False)
+    return df_topico.reset_index(drop=True)
+
+def indices_compostos(perfil):
+    """
+    Índices compostos do Firestore (formato do firestore.indexes.json) de que as consultas
+    de um perfil precisam: o histórico de um tópico ordenado por data, do mais recente.
+    """
+    colecao = perfil.get('colecao_historico')
+    if not colecao:
+        return []
+    return [{
+        'collectionGroup': colecao,
+        'queryScope': 'COLLECTION',
+        'fields': [
+            {'fieldPath': 'ID_Topico', 'order': 'ASCENDING'},
+            {'fieldPath': CAMPO_DATA, 'order': 'DESCENDING'},
+            {'fieldPath': '__name__', 'order': 'DESCENDING'},
+        ],
+    }]
+
+def carregar_pagina_historico_topico(db, perfil, id_topico, cursor=None, tamanho=TAMANHO_PAGINA_HISTORICO):
+    """
+    Devolve (df, cursor seguinte) com uma página dos lançamentos de um tópico, do mais recente para
+    o mais antigo. O cursor é opaco: passa-se de volta para obter a página seguinte e é None na última.
+    """
+    colecao = perfil.get('colecao_historico') if perfil else None
+    if db is None or not colecao:
+        return pd.DataFrame(), None
+
+    if perfil.get('datas_tipadas') and not isinstance(cursor, int):
+        # Todos os registos têm CAMPO_DATA: o servidor ordena e lê só a página pedida,
+        # mais um registo para saber se há página seguinte.
+        filtros = [('ID_Topico', '==', id_topico)]
+        try:
+            df = _carregar(
+                db, perfil.get('id_documento'), colecao, normalizar_historico,
+                filtros=filtros, variante=('pagina', id_topico, cursor, tamanho),
+                ler=lambda: db.listar_ordenado(colecao, CAMPO_DATA, descendente=True, apos=cursor,
+                                               limite=tamanho + 1, filtros=filtros),
+            )
+        except armazenamento.IndiceEmFalta:
+            # Sem o índice composto no projeto, pagina sobre o histórico completo em cache.
+            if cursor is not None:
+                raise
+        else:
+            if len(df) <= tamanho:
+                return df, None
+            df = df.iloc[:tamanho]
+            ultimo = df.iloc[-1]
+            return df, (pd.Timestamp(ultimo[CAMPO_DATA]).to_pydatetime(), ultimo['id_documento'])
+
+    # Perfis por migrar: a ordem depende da string 'Data', pelo que a paginação é feita
+    # localmente e o cursor é a posição do próximo lançamento.
+    inicio = cursor or 0
+    df_topico = carregar_historico_topico(db, perfil, id_topico)
+    df = df_topico.iloc[inicio:inicio + tamanho].reset_index(drop=True)
+    return df, (inicio + tamanho if inicio + tamanho < len(df_topico) else None)
+
+def inicio_periodo(data, periodo):
+    """Devolve a meia-noite do dia, ou da segunda-feira da semana ISO, a que uma data pertence."""
+    inicio = carimbo_data(data)
+    if periodo == PERIODO_SEMANA:
+        inicio -= timedelta(days=inicio.weekday())
+    return inicio
+
+def _id_resumo(inicio, periodo):
+    if periodo == PERIODO_DIA:
+        return inicio.strftime('%Y-%m-%d')
+    ano, semana, _ = inicio.isocalendar()
+    return f"{ano}-W{semana:02d}"
+
+def normalizar_resumos(documentos):
+    """Converte documentos de resumo num DataFrame longo, com uma linha por período e disciplina."""
+    linhas = []
+    for dados in documentos.values():
+        for disciplina, valores in (dados.get('Disciplinas') or {}).items():
+            linhas.append((dados.get('Inicio'), disciplina) + tuple(valores.get(m, 0) for m in METRICAS_RESUMO))
+    df = pd.DataFrame(linhas, columns=COLUNAS_RESUMO)
+    # 'Inicio' foi gravado como meia-noite sem fuso, que o Firestore guarda e devolve em UTC.
+    df['Data'] = pd.to_datetime(df['Data'], utc=True).dt.tz_localize(None)
+    return aplicar_esquema(df, ESQUEMA_RESUMO)
+
+def _resumos_do_historico(db, perfil, periodo, desde=None):
+    """Calcula os mesmos resumos de carregar_resumos diretamente a partir dos históricos."""
+    inicio = inicio_periodo(desde, periodo) if desde is not None else None
+    df_questoes = carregar_historico_questoes_df(db, perfil, inicio)
+    df_tempo = carregar_historico_tempo_df(db, perfil, inicio)
+
+    def inicio_serie(datas):
+        inicio = datas.dt.normalize()
+        if periodo == PERIODO_SEMANA:
+            inicio = inicio - pd.to_timedelta(inicio.dt.weekday, unit='D')
+        return inicio
+
+    partes = []
+    if not df_questoes.empty and 'Data_dt' in df_questoes.columns:
+        df_dashboard = carregar_dashboard_df(db, perfil)
+        if df_dashboard.empty:
+            disciplinas = pd.Series('N/A', index=df_questoes.index)
+        else:
+            disciplinas = df_questoes['ID_Topico'].map(df_dashboard.set_index('ID')['Disciplina']).astype(object).fillna('N/A')
+        partes.append(pd.DataFrame({
+            'Data': inicio_serie(df_questoes['Data_dt']),
+            'Disciplina': disciplinas,
+            'Total_Questoes': df_questoes['Total_Questoes'],
+            'Acertos': df_questoes['Acertos'],
+        }))
+    if not df_tempo.empty and 'Data_dt' in df_tempo.columns:
+        partes.append(pd.DataFrame({
+            'Data': inicio_serie(df_tempo['Data_dt']),
+            'Disciplina': df_tempo['Disciplina'].astype(object),
+            'Tempo_Estudado_Minutos': df_tempo['Tempo_Estudado_Minutos'],
+        }))
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS_RESUMO)
+
+    df = pd.concat(partes, ignore_index=True).reindex(columns=COLUNAS_RESUMO)
+    df[METRICAS_RESUMO] = df[METRICAS_RESUMO].fillna(0)
+    df = df.dropna(subset=['Data']).groupby(['Data', 'Disciplina'], as_index=False)[METRICAS_RESUMO].sum()
+    return aplicar_esquema(df.reset_index(drop=True), ESQUEMA_RESUMO)
+
+def carregar_resumos(db, perfil, periodo=PERIODO_DIA, desde=None):
+    """
+    Carrega os totais de questões, acertos e minutos por período (dia ou semana ISO) e disciplina,
+    a partir do período que contém `desde`. Lê apenas os documentos de resumo do intervalo pedido;
+    para perfis ainda sem resumos (ver reconstruir_resumos) calcula-os a partir dos históricos.
+    """
+    if not perfil or db is None:
+        return pd.DataFrame(columns=COLUNAS_RESUMO)
+    if not perfil.get('resumos_disponiveis'):
+        return _resumos_do_historico(db, perfil, periodo, desde)
+
+    colecao = colecao_resumos(perfil, periodo)
+    filtros, inicio = [], None
+    if desde is not None:
+        inicio = inicio_periodo(desde, periodo)
+        filtros = [('Inicio', '>=', inicio)]
+    return _carregar(db, perfil.get('id_documento'), colecao, normalizar_resumos, filtros=filtros, variante=inicio)
+
+def get_nivel_dominio(percentual):
+    if percentual >= 90: return '[Domínio Mestre]'
+    elif 80 <= percentual < 90: return '[Domínio Sólido]'
+    elif 65 <= percentual < 80: return '[Em Desenvolvimento]'
+    else: return '[Revisão Urgente]'
+
+def calcular_analise_final(estrutura_prova, df_dashboard):
+    """
+    Estima a nota da prova a partir da performance nos estudos de cada disciplina.
+    Devolve um DataFrame (Disciplina, Perf. Estudos (%), Pontuação Estimada, Pontuação Máxima),
+    pela ordem de estrutura_prova, e a nota simulada total.
+    """
+    if df_dashboard.empty:
+        totais = pd.DataFrame(columns=['Qsts', 'Acertos'])
+    else:
+        totais = df_dashboard.groupby('Disciplina', observed=True)[['Qsts', 'Acertos']].sum()
+
+    linhas = []
+    for disciplina, dados_prova in estrutura_prova.items():
+        questoes = totais['Qsts'].get(disciplina, 0)
+        acertos = totais['Acertos'].get(disciplina, 0)
+        perf_estudos = (acertos / questoes * 100) if questoes > 0 else 0
+
+        pontuacao_maxima = dados_prova.get('num_questoes', 0) * dados_prova.get('peso', 1.0)
+        linhas.append({
+            'Disciplina': disciplina,
+            'Perf. Estudos (%)': perf_estudos,
+            'Pontuação Estimada': (perf_estudos / 100) * pontuacao_maxima,
+            'Pontuação Máxima': pontuacao_maxima,
+        })
+
+    df_relatorio = pd.DataFrame(linhas, columns=['Disciplina', 'Perf. Estudos (%)', 'Pontuação Estimada', 'Pontuação Máxima'])
+    return df_relatorio, float(df_relatorio['Pontuação Estimada'].sum())
+
+# --- INDICADORES GERAIS (AGREGAÇÕES NO SERVIDOR) ---
+
+def _carregar_agregacao(db, id_perfil, colecao, agregar):
+    """
+    Executa `agregar()` (agregações feitas no servidor, ver Armazenamento.agregar) e guarda
+    o dicionário que devolve em cache até a coleção mudar.
+    """
+    chave = (id_perfil, colecao)
+    chave_cache = (id_perfil, colecao, 'agregacao')
+    with _carga_exclusiva(chave_cache):
+        with _lock:
+            versao_local = _versoes.get(chave, 0)
+            entrada = _cache.get(chave_cache)
+        if entrada and entrada[0] == (versao_local, None) and time.monotonic() - entrada[1] < IDADE_MAXIMA_CACHE:
+            instrumentacao.registrar_cache(acerto=True)
+            return entrada[2]
+
+        instrumentacao.registrar_cache(acerto=False)
+        valores = agregar()
+
+        with _lock:
+            if _versoes.get(chave, 0) == versao_local:
+                _cache[chave_cache] = ((versao_local, None), time.monotonic(), valores)
+        return valores
+
+def _indicadores(db, id_perfil, colecao, agregar, calcular_local):
+    """
+    Calcula indicadores de uma coleção no servidor, com agregações que não descarregam
+    os documentos. Se a coleção já estiver espelhada, ou se o servidor não responder, calcula-os
+    com `calcular_local({id: dados})` a partir do espelho.
+    """
+    espelho_atual = espelho.espelho_existente(id_perfil, colecao) if USAR_ESPELHO else None
+    if espelho_atual is not None and espelho_atual.ativo:
+        # Os documentos já estão em memória: calcular localmente não custa leituras.
+        return _carregar(db, id_perfil, colecao, calcular_local, variante='indicadores')
+    try:
+        return _carregar_agregacao(db, id_perfil, colecao, agregar)
+    except Exception:
+        if espelho_atual is None:
+            raise
+        # Sem ligação ao servidor: usa a última cópia recebida pelo espelho.
+        return calcular_local(espelho_atual.instantaneo()[1])
+
+def _indicadores_dashboard_locais(documentos):
+    df = normalizar_dashboard(documentos.values())
+    if df.empty:
+        return {'total_topicos': 0, 'topicos_medidos': 0, 'total_questoes': 0, 'total_acertos': 0}
+    return {
+        'total_topicos': len(df),
+        'topicos_medidos': int((df['Qsts'] > 0).sum()),
+        'total_questoes': int(df['Qsts'].sum()),
+        'total_acertos': int(df['Acertos'].sum()),
+    }
+
+def carregar_kpis(db, perfil):
+    """
+    Devolve os indicadores gerais de um perfil: total_topicos, topicos_medidos, total_questoes,
+    total_acertos e tempo_total_minutos. Um tópico conta como medido quando tem questões, o mesmo
+    critério de calcular_derivados para '[Não Medido]'.
+    """
+    kpis = {'total_topicos': 0, 'topicos_medidos': 0, 'total_questoes': 0, 'total_acertos': 0, 'tempo_total_minutos': 0}
+    if not perfil or db is None:
+        return kpis
+    id_perfil = perfil.get('id_documento')
+
+    colecao_dashboard = perfil.get('colecao_dashboard')
+    if colecao_dashboard:
+        def agregar_dashboard():
+            # Duas agregações: a contagem filtrada não pode partilhar o pedido dos totais.
+            totais = db.agregar(colecao_dashboard, somas=['Total_Questoes_Topico', 'Total_Acertos_Topico'])
+            medidos = db.agregar(colecao_dashboard, filtros=[('Total_Questoes_Topico', '>', 0)])
+            return {
+                'total_topicos': totais['contagem'],
+                'total_questoes': totais['Total_Questoes_Topico'],
+                'total_acertos': totais['Total_Acertos_Topico'],
+                'topicos_medidos': medidos['contagem'],
+            }
+        kpis.update(_indicadores(db, id_perfil, colecao_dashboard, agregar_dashboard, _indicadores_dashboard_locais))
+
+    colecao_tempo = colecao_historico_tempo(perfil)
+    if colecao_tempo:
+        kpis.update(_indicadores(
+            db, id_perfil, colecao_tempo,
+            lambda: {'tempo_total_minutos': db.agregar(colecao_tempo, somas=['Tempo_Estudado_Minutos'])['Tempo_Estudado_Minutos']},
+            lambda documentos: {'tempo_total_minutos': sum(
+                dados.get('Tempo_Estudado_Minutos') or 0 for dados in documentos.values()
+            )}
+        ))
+
+    return {nome: int(valor or 0) for nome, valor in kpis.items()}
+
+# --- LEITURAS EM PARALELO ---
+#
+# As páginas pedem várias coleções independentes por rerun. Feitas em série, a
+# página espera pela soma das latências; carregar_em_paralelo lança-as ao mesmo
+# tempo, num pool partilhado, e a espera passa a ser a da leitura mais lenta.
+# As leituras continuam a passar pela cache; duas leituras simultâneas da
+# mesma entrada fazem um só pedido (ver _carregar). O mesmo pool aquece a
+# cache de um perfil assim que é carregado (aquecer_perfil), para que a
+# primeira página aberta já encontre os dados.
+
+MAXIMO_LEITURAS_PARALELAS = 8
+_executor_leituras = ThreadPoolExecutor(max_workers=MAXIMO_LEITURAS_PARALELAS, thread_name_prefix='coach-leitura')
+
+def iniciar_leituras(cargas):
+    """
+    Submete as leituras {nome: função sem argumentos} e devolve logo {nome: Future}, para quem chama
+    usar cada resultado assim que chega (ver resultado_leitura). As mesmas regras de carregar_em_paralelo.
+    """
+    return {nome: _executor_leituras.submit(instrumentacao.propagar(funcao)) for nome, funcao in cargas.items()}
+
+def resultado_leitura(futuro):
+    """Espera por uma leitura de iniciar_leituras e devolve o seu resultado, ou a exceção se falhou."""
+    try:
+        return futuro.result()
+    except Exception as e:
+        return e
+
+def carregar_em_paralelo(cargas):
+    """
+    Executa as leituras {nome: função sem argumentos} em simultâneo e devolve {nome: resultado}.
+    Uma leitura que falhe devolve a sua exceção no lugar do resultado, para cada uma ser tratada à parte.
+    As funções não devem chamar carregar_em_paralelo nem usar o Streamlit.
+    """
+    return {nome: resultado_leitura(futuro) for nome, futuro in iniciar_leituras(cargas).items()}
+
+
+class Aquecimento:
+    """Leituras de um perfil a decorrer em segundo plano (ver aquecer_perfil)."""
+
+    def __init__(self, id_perfil, futuros):
+        self.id_perfil = id_perfil
+        self.futuros = futuros  # nome -> Future
+
+    @property
+    def total(self):
+        return len(self.futuros)
+
+    @property
+    def concluidas(self):
+        return sum(futuro.done() for futuro in self.futuros.values())
+
+    @property
+    def terminado(self):
+        return self.concluidas == self.total
+
+    def erros(self):
+        """Devolve {nome: exceção} das leituras que já falharam."""
+        return {
+            nome: futuro.exception() for nome, futuro in self.futuros.items()
+            if futuro.done() and futuro.exception() is not None
+        }
+
+_aquecimentos = {}  # id do perfil -> Aquecimento mais recente
+
+def aquecer_perfil(db, perfil):
+    """
+    Começa a carregar para a cache, em segundo plano, o que as páginas de um perfil leem primeiro
+    (dashboard, históricos, catálogo, indicadores e resumos semanais) e devolve logo um Aquecimento.
+    Se já houver um aquecimento do perfil a decorrer, devolve esse.
+    """
+    id_perfil = perfil.get('id_documento')
+    with _lock:
+        atual = _aquecimentos.get(id_perfil)
+        if atual is not None and not atual.terminado:
+            return atual
+        cargas = {
+            'Dashboard': lambda: carregar_dashboard_df(db, perfil),
+            'Histórico de questões': lambda: carregar_historico_questoes_df(db, perfil),
+            'Histórico de tempo': lambda: carregar_historico_tempo_df(db, perfil),
+            'Catálogo de tópicos': lambda: carregar_catalogo(db, perfil),
+            'Indicadores': lambda: carregar_kpis(db, perfil),
+            'Resumos semanais': lambda: carregar_resumos(db, perfil, PERIODO_SEMANA),
+        }
+        # Sem propagar a medição: as leituras terminam depois do rerun que as pediu.
+        aquecimento = Aquecimento(id_perfil, {nome: _executor_leituras.submit(funcao) for nome, funcao in cargas.items()})
+        _aquecimentos[id_perfil] = aquecimento
+    return aquecimento
+
+# --- CATÁLOGO DE TÓPICOS ---
+
+def _partes_catalogo(df):
+    """Divide o catálogo em partes cujo tamanho estimado fica abaixo de LIMITE_BYTES_CATALOGO."""
+    partes, atual, tamanho = [], {'IDs': [], 'Disciplinas': [], 'Topicos': []}, 0
+    for id_topico, disciplina, topico in zip(df['ID'], df['Disciplina'], df['Tópico do Edital']):
+        disciplina, topico = str(disciplina), str(topico)
+        # Strings ocupam os seus bytes UTF-8 mais 1; inteiros ocupam 8.
+        tamanho_topico = len(disciplina.encode('utf-8')) + len(topico.encode('utf-8')) + 2 + 8
+        if atual['IDs'] and tamanho + tamanho_topico > LIMITE_BYTES_CATALOGO:
+            partes.append(atual)
+            atual, tamanho = {'IDs': [], 'Disciplinas': [], 'Topicos': []}, 0
+        atual['IDs'].append(int(id_topico))
+        atual['Disciplinas'].append(disciplina)
+        atual['Topicos'].append(topico)
+        tamanho += tamanho_topico
+    partes.append(atual)
+    return partes
+
+def gravar_catalogo(db, id_perfil, df_topicos):
+    """
+    Grava o catálogo de tópicos de um perfil a partir de um DataFrame com ID, Disciplina e
+    Tópico do Edital, substituindo o anterior. Devolve o nº de partes gravadas.
+    """
+    colecao = colecao_catalogo(id_perfil)
+    df = df_topicos[COLUNAS_CATALOGO].sort_values(by='ID')
+    partes = _partes_catalogo(df)
+
+    lote = db.lote()
+    for numero, parte in enumerate(partes):
+        parte['Parte'] = numero
+        lote.gravar(colecao, f"{numero:03d}", parte)
+    for id_parte in db.listar(colecao, campos=[]):
+        if not id_parte.isdigit() or int(id_parte) >= len(partes):
+            lote.apagar(colecao, id_parte)
+    lote.confirmar()
+
+    invalidar(id_perfil, colecao_catalogo(id_perfil))
+    return len(partes)
+
+def normalizar_catalogo(documentos):
+    """Junta as partes do catálogo, pela ordem gravada, num DataFrame com COLUNAS_CATALOGO."""
+    ids, disciplinas, topicos = [], [], []
+    for parte in sorted(documentos.values(), key=lambda dados: dados.get('Parte', 0)):
+        ids.extend(parte.get('IDs', []))
+        disciplinas.extend(parte.get('Disciplinas', []))
+        topicos.extend(parte.get('Topicos', []))
+    df = pd.DataFrame({'ID': ids, 'Disciplina': disciplinas, 'Tópico do Edital': topicos}, columns=COLUNAS_CATALOGO)
+    return aplicar_esquema(df, ESQUEMA_CATALOGO)
+
+def carregar_catalogo(db, perfil):
+    """
+    Carrega o catálogo de tópicos de um perfil (ID, Disciplina, Tópico do Edital), ordenado por ID.
+    Perfis criados antes do catálogo recebem-no na primeira leitura, a partir do dashboard.
+    """
+    if not perfil or db is None:
+        return pd.DataFrame(columns=COLUNAS_CATALOGO)
+    id_perfil = perfil.get('id_documento')
+    colecao = colecao_catalogo(id_perfil)
+    if not colecao:
+        return pd.DataFrame(columns=COLUNAS_CATALOGO)
+
+    df = _carregar(db, id_perfil, colecao, normalizar_catalogo)
+    if df.empty:
+        df_dashboard = carregar_dashboard_df(db, perfil)
+        if df_dashboard.empty:
+            return df
+        gravar_catalogo(db, id_perfil, df_dashboard)
+        df = df_dashboard[COLUNAS_CATALOGO].reset_index(drop=True)
+    return df
+
+def listar_disciplinas(db, perfil):
+    """Obtém a lista ordenada de disciplinas únicas de um perfil."""
+    df = carregar_catalogo(db, perfil)
+    if df.empty:
+        return []
+    return sorted(df['Disciplina'].unique().tolist())
+
+def opcoes_topicos(db, perfil):
+    """Devolve os tópicos de um perfil, ordenados por ID, no formato usado pelos seletores."""
+    df = carregar_catalogo(db, perfil)
+    if df.empty:
+        return []
+    return [
+        {"id": id_topico, "display": f"{id_topico} - {topico}"}
+        for id_topico, topico in zip(df['ID'].tolist(), df['Tópico do Edital'].tolist())
+    ]
+
+# --- ESCRITAS ---
+
+def validar_resultados(resultados):
+    """Valida os resultados de um simulado ({id_topico: {'questoes', 'acertos'}}), devolvendo a lista de erros."""
+    erros = []
+    if not resultados:
+        erros.append("Nenhum tópico foi informado.")
+    for id_topico, dados in resultados.items():
+        if dados['questoes'] <= 0:
+            erros.append(f"Erro no Tópico ID {id_topico}: O número de questões deve ser maior que zero.")
+        elif not 0 <= dados['acertos'] <= dados['questoes']:
+            erros.append(f"Erro no Tópico ID {id_topico}: O número de acertos não pode ser maior que o número de questões.")
+    return erros
+
+def _data_medicao(texto):
+    """Interpreta uma 'Ultima_Medicao' gravada ('%d/%m/%Y'); devolve None para '-' ou valores inválidos."""
+    try:
+        return pd.Timestamp(datetime.strptime(texto, '%d/%m/%Y'))
+    except (TypeError, ValueError):
+        return None
+
+def lancar_simulado(db, perfil, resultados, data_simulado, modo=MODO_INCREMENTO):
+    """
+    Regista todos os tópicos de um simulado num único commit atómico, juntamente com os resumos
+    do dia e da semana; se algum tópico for inválido, nada é gravado.
+
+    Em MODO_INCREMENTO os contadores recebem um Incremento sem os ler, pelo que lançamentos
+    simultâneos de vários dispositivos não entram em conflito. Em MODO_TRANSACAO os tópicos são
+    lidos numa só chamada e '%' e 'Domínio' são gravados já recalculados. Em ambos os modos,
+    'Ultima_Medicao' só avança: um lançamento retroativo não a substitui por uma data anterior.
+    """
+    erros = validar_resultados(resultados)
+    if erros:
+        raise ValueError("\n".join(erros))
+
+    colecao_dashboard = perfil['colecao_dashboard']
+    colecao_historico = perfil['colecao_historico']
+    data_str = data_simulado.strftime('%d/%m/%Y')
+
+    novos = {int(id_topico): dados for id_topico, dados in resultados.items()}
+    medicao = pd.Timestamp(data_simulado)
+
+    def mensagem_em_falta(existentes):
+        em_falta = [str(id_topico) for id_topico in novos if str(id_topico) not in existentes]
+        return f"Tópico(s) não encontrado(s) no dashboard: {', '.join(em_falta)}"
+
+    def registro_historico(id_topico):
+        n_questoes = novos[id_topico]['questoes']
+        n_acertos = novos[id_topico]['acertos']
+        return {
+            'ID_Topico': id_topico,
+            'Data': data_str,
+            CAMPO_DATA: carimbo_data(data_simulado),
+            'Total_Questoes': n_questoes,
+            'Acertos': n_acertos,
+            '%': n_acertos / n_questoes * 100
+        }
+
+    def aplicar(transacao):
+        atuais = transacao.ler_varios(colecao_dashboard, [str(id_topico) for id_topico in novos])
+        if len(atuais) < len(novos):
+            raise ValueError(mensagem_em_falta(atuais))
+
+        resumos = {}
+        for id_topico in novos:
+            atual = atuais[str(id_topico)]
+            novo_total_q = (atual.get('Total_Questoes_Topico') or 0) + novos[id_topico]['questoes']
+            novo_total_a = (atual.get('Total_Acertos_Topico') or 0) + novos[id_topico]['acertos']
+            perc = (novo_total_a / novo_total_q * 100) if novo_total_q > 0 else 0
+
+            alteracoes = {
+                'Total_Questoes_Topico': novo_total_q,
+                'Total_Acertos_Topico': novo_total_a,
+                '%': perc,
+                'Domínio': get_nivel_dominio(perc),
+            }
+            ultima = _data_medicao(atual.get('Ultima_Medicao'))
+            if ultima is None or medicao > ultima:
+                alteracoes['Ultima_Medicao'] = data_str
+            transacao.atualizar(colecao_dashboard, str(id_topico), alteracoes)
+            transacao.gravar(colecao_historico, db.novo_id(colecao_historico), registro_historico(id_topico))
+            _acumular_resumo(resumos, data_simulado, atual.get('Disciplina'),
+                             questoes=novos[id_topico]['questoes'], acertos=novos[id_topico]['acertos'])
+        _gravar_resumos(transacao, perfil, resumos)
+
+    if modo == MODO_TRANSACAO:
+        db.executar_transacao(aplicar)
+    else:
+        # A disciplina de cada tópico vem do catálogo, para não voltar a ler os tópicos.
+        df_catalogo = carregar_catalogo(db, perfil)
+        disciplinas = dict(zip(df_catalogo['ID'], df_catalogo['Disciplina']))
+
+        # Só 'Ultima_Medicao' é lida, numa chamada, para não a recuar. Um lançamento simultâneo
+        # pode ainda deixá-la atrasada; reconstruir_contadores corrige-a.
+        ultimas = {
+            id_topico: _data_medicao(dados.get('Ultima_Medicao'))
+            for id_topico, dados in db.ler_varios(colecao_dashboard, [str(id_topico) for id_topico in novos]).items()
+        }
+
+        # Um update sobre um tópico inexistente faz falhar o lote inteiro, que é atómico.
+        lote = db.lote()
+        resumos = {}
+        for id_topico in novos:
+            alteracoes = {
+                'Total_Questoes_Topico': armazenamento.Incremento(novos[id_topico]['questoes']),
+                'Total_Acertos_Topico': armazenamento.Incremento(novos[id_topico]['acertos']),
+            }
+            ultima = ultimas.get(str(id_topico))
+            if ultima is None or medicao > ultima:
+                alteracoes['Ultima_Medicao'] = data_str
+            lote.atualizar(colecao_dashboard, str(id_topico), alteracoes)
+            lote.gravar(colecao_historico, db.novo_id(colecao_historico), registro_historico(id_topico))
+            _acumular_resumo(resumos, data_simulado, disciplinas.get(id_topico),
+                             questoes=novos[id_topico]['questoes'], acertos=novos[id_topico]['acertos'])
+        _gravar_resumos(lote, perfil, resumos)
+        try:
+            lote.confirmar()
+        except armazenamento.DocumentoInexistente as e:
+            raise ValueError(mensagem_em_falta(ultimas)) from e
+
+    invalidar(perfil.get('id_documento'), colecao_dashboard)
+    invalidar(perfil.get('id_documento'), colecao_historico)
+    _invalidar_resumos(perfil)
+    return list(novos)
+
+def reconciliar_derivados(db, perfil, ids_topicos=None):
+    """
+    Regrava '%' e 'Domínio' dos tópicos cujos valores gravados já não batem com os contadores.
+    Com ids_topicos lê apenas esses tópicos; devolve o número de tópicos corrigidos.
+    """
+    colecao_dashboard = perfil['colecao_dashboard']
+    if ids_topicos is None:
+        documentos = db.listar(colecao_dashboard)
+    else:
+        documentos = db.ler_varios(colecao_dashboard, [str(id_topico) for id_topico in ids_topicos])
+    if not documentos:
+        return 0
+    ids = list(documentos)
+    gravados = list(documentos.values())
+
+    df = pd.DataFrame(gravados).reindex(columns=['Total_Questoes_Topico', 'Total_Acertos_Topico', '%', 'Domínio'])
+    questoes = pd.to_numeric(df['Total_Questoes_Topico'], errors='coerce').fillna(0)
+    acertos = pd.to_numeric(df['Total_Acertos_Topico'], errors='coerce').fillna(0)
+    percentual, dominio = calcular_derivados(questoes, acertos)
+
+    percentual_gravado = pd.to_numeric(df['%'], errors='coerce')
+    desatualizados = ((percentual_gravado - percentual).abs() > 1e-9) | percentual_gravado.isna() | (df['Domínio'] != dominio)
+
+    lote = db.lote()
+    corrigidos = 0
+    for posicao in np.flatnonzero(desatualizados.to_numpy()):
+        lote.atualizar(colecao_dashboard, ids[posicao], {'%': float(percentual.iat[posicao]), 'Domínio': dominio.iat[posicao]})
+        corrigidos += 1
+        if corrigidos % 500 == 0:
+            lote.confirmar()
+            lote = db.lote()
+    if corrigidos % 500:
+        lote.confirmar()
+
+    # Não é preciso invalidar a cache: os DataFrames já calculam '%' e 'Domínio' na leitura.
+    return corrigidos
+
+def agendar_reconciliacao(db, perfil, ids_topicos):
+    """Executa reconciliar_derivados em segundo plano, sem atrasar quem acabou de gravar; devolve a thread."""
+    def executar():
+        try:
+            reconciliar_derivados(db, perfil, ids_topicos)
+        except Exception:
+            # Os valores gravados ficam desatualizados até à próxima reconciliação, mas quem
+            # lê pelo repositório continua a ver os valores corretos. Fica o registo da falha.
+            _logger.exception("Falha ao reconciliar '%%' e 'Domínio' do perfil %s (tópicos %s)",
+                              perfil.get('id_documento'), ids_topicos)
+    thread = threading.Thread(target=executar, daemon=True)
+    thread.start()
+    return thread
+
+# --- RESUMOS DIÁRIOS E SEMANAIS ---
+#
+# Cada escrita no histórico acumula também, no mesmo commit, os seus totais nos
+# documentos resumos_diarios_{id}/AAAA-MM-DD e resumos_semanais_{id}/AAAA-Www.
+
+def _acumular_resumo(acumulado, data, disciplina, questoes=0, acertos=0, minutos=0):
+    """Soma um lançamento aos resumos do seu dia e da sua semana, agrupando vários lançamentos por documento."""
+    valores = (questoes, acertos, minutos)
+    for periodo in (PERIODO_DIA, PERIODO_SEMANA):
+        inicio = inicio_periodo(data, periodo)
+        resumo = acumulado.setdefault((periodo, _id_resumo(inicio, periodo)), {'Inicio': inicio, 'Disciplinas': {}})
+        por_disciplina = resumo['Disciplinas'].setdefault(disciplina or 'N/A', dict.fromkeys(METRICAS_RESUMO, 0))
+        for metrica, valor in zip(METRICAS_RESUMO, valores):
+            por_disciplina[metrica] += valor
+
+def _gravar_resumos(escritor, perfil, acumulado):
+    """Aplica os resumos acumulados com Incremento, num lote ou numa transação já aberta."""
+    for (periodo, id_resumo), resumo in acumulado.items():
+        totais = dict.fromkeys(METRICAS_RESUMO, 0)
+        disciplinas = {}
+        for disciplina, valores in resumo['Disciplinas'].items():
+            disciplinas[disciplina] = {m: armazenamento.Incremento(valores[m]) for m in METRICAS_RESUMO}
+            for m in METRICAS_RESUMO:
+                totais[m] += valores[m]
+        dados = {'Inicio': resumo['Inicio'], 'Disciplinas': disciplinas}
+        dados.update({m: armazenamento.Incremento(totais[m]) for m in METRICAS_RESUMO})
+        escritor.gravar(colecao_resumos(perfil, periodo), id_resumo, dados, mesclar=True)
+
+def _invalidar_resumos(perfil):
+    for periodo in (PERIODO_DIA, PERIODO_SEMANA):
+        invalidar(perfil.get('id_documento'), colecao_resumos(perfil, periodo))
+
+def registrar_tempo(db, perfil, disciplina, data_sessao, minutos):
+    """Regista uma sessão de estudo e soma-a aos resumos do dia e da semana, num único commit."""
+    colecao = colecao_historico_tempo(perfil)
+    if not colecao:
+        raise ValueError("ID do perfil não encontrado na sessão. Por favor, recarregue o perfil na página principal.")
+
+    lote = db.lote()
+    lote.gravar(colecao, db.novo_id(colecao), {
+        'Disciplina': disciplina,
+        'Data': data_sessao.strftime('%d/%m/%Y'),
+        CAMPO_DATA: carimbo_data(data_sessao),
+        'Tempo_Estudado_Minutos': minutos
+    })
+    resumos = {}
+    _acumular_resumo(resumos, data_sessao, disciplina, minutos=minutos)
+    _gravar_resumos(lote, perfil, resumos)
+    lote.confirmar()
+
+    # Só o histórico de tempo e os resumos deste perfil deixam de estar em cache
+    invalidar(perfil.get('id_documento'), colecao)
+    _invalidar_resumos(perfil)
+
+def apagar_registro_historico(db, perfil, registro):
+    """
+    Apaga um lançamento do histórico de questões numa transação, subtraindo-o do tópico
+    e dos resumos do seu dia e da sua semana.
+    """
+    apagar_registros_historico(db, perfil, [registro])
+
+def _subtrair_resumo(atual, removido):
+    """
+    Devolve o documento de resumo `atual` sem os totais de `removido` (ver _acumular_resumo). As
+    disciplinas que ficam a zero saem do documento, como em reconstruir_resumos; se não sobrar
+    nenhuma, devolve None e o documento deve ser apagado.
+    """
+    disciplinas = {}
+    for disciplina, valores in (atual.get('Disciplinas') or {}).items():
+        menos = removido['Disciplinas'].get(disciplina, {})
+        restantes = {m: (valores.get(m) or 0) - menos.get(m, 0) for m in METRICAS_RESUMO}
+        if any(restantes.values()):
+            disciplinas[disciplina] = restantes
+    if not disciplinas:
+        return None
+    dados = {'Inicio': atual.get('Inicio', removido['Inicio']), 'Disciplinas': disciplinas}
+    dados.update({m: sum(valores[m] for valores in disciplinas.values()) for m in METRICAS_RESUMO})
+    return dados
+
+def _ultima_medicao_sem(db, perfil, id_topico, ids_registros):
+    """'Ultima_Medicao' de um tópico depois de apagados os registos `ids_registros` ('-' se não sobrar nenhum)."""
+    df, _ = carregar_pagina_historico_topico(db, perfil, id_topico, tamanho=len(ids_registros) + 1)
+    if df.empty:
+        return '-'
+    restantes = df[~df['id_documento'].isin(ids_registros)]
+    if restantes.empty or pd.isna(restantes['Data_dt'].iloc[0]):
+        return '-'
+    return restantes['Data_dt'].iloc[0].strftime('%d/%m/%Y')
+
+def apagar_registros_historico(db, perfil, registros):
+    """
+    Apaga vários lançamentos do histórico de questões numa única transação, subtraindo os seus
+    totais de cada tópico afetado (com '%' e 'Domínio' recalculados uma vez por tópico) e dos resumos,
+    e recua 'Ultima_Medicao' para o lançamento mais recente que sobra. Devolve os IDs dos tópicos atualizados.
+    """
+    colecao_historico = perfil['colecao_historico']
+    colecao_dashboard = perfil['colecao_dashboard']
+    a_remover = {}  # id do tópico -> [questões, acertos, [(data, questões, acertos)]]
+    ids_por_topico = {}  # id do tópico -> ids dos registros a apagar
+    for registro in registros:
+        id_topico = str(int(registro['ID_Topico']))
+        q_remover = int(registro['Total_Questoes'])
+        ac_remover = int(registro['Acertos'])
+        data_registro = registro.get('Data_dt')
+        if data_registro is None or pd.isna(data_registro):
+            data_registro = datetime.strptime(registro['Data'], '%d/%m/%Y')
+        totais = a_remover.setdefault(id_topico, [0, 0, []])
+        totais[0] += q_remover
+        totais[1] += ac_remover
+        totais[2].append((data_registro, q_remover, ac_remover))
+        ids_por_topico.setdefault(id_topico, set()).add(registro['id_documento'])
+    ids_registros = {registro['id_documento'] for registro in registros}
+    if not ids_registros:
+        return []
+    # Cada tópico e cada registro é uma escrita, e os resumos de um dia e de uma semana por registro, no máximo.
+    if len(a_remover) + 3 * len(ids_registros) > armazenamento.LIMITE_LOTE:
+        raise ValueError(f"Selecione no máximo {armazenamento.LIMITE_LOTE // 4} registros de cada vez.")
+
+    # A nova 'Ultima_Medicao' vem dos lançamentos mais recentes de cada tópico, lidos antes da
+    # transação. Um lançamento simultâneo pode deixá-la atrasada; reconstruir_contadores corrige-a.
+    ultimas = {id_topico: _ultima_medicao_sem(db, perfil, int(id_topico), ids) for id_topico, ids in ids_por_topico.items()}
+
+    def apagar_e_atualizar(transacao):
+        # 1. Lê o estado atual dos tópicos afetados e dos seus resumos
+        atuais = transacao.ler_varios(colecao_dashboard, list(a_remover))
+        resumos = {}
+        for id_topico, (_, _, lancamentos) in a_remover.items():
+            for data_registro, questoes, acertos in lancamentos:
+                _acumular_resumo(resumos, data_registro, (atuais.get(id_topico) or {}).get('Disciplina'),
+                                 questoes=questoes, acertos=acertos)
+        resumos_atuais = {}
+        for periodo in (PERIODO_DIA, PERIODO_SEMANA):
+            ids_resumos = [id_resumo for (p, id_resumo) in resumos if p == periodo]
+            for id_resumo, dados in transacao.ler_varios(colecao_resumos(perfil, periodo), ids_resumos).items():
+                resumos_atuais[(periodo, id_resumo)] = dados
+
+        # 2. Calcula os novos totais e recalcula a performance de cada tópico uma só vez
+        for id_topico, (q_remover, ac_remover, _) in a_remover.items():
+            atual = atuais.get(id_topico) or {}
+            novo_total_q = (atual.get('Total_Questoes_Topico') or 0) - q_remover
+            novo_total_a = (atual.get('Total_Acertos_Topico') or 0) - ac_remover
+            novo_perc = (novo_total_a / novo_total_q * 100) if novo_total_q > 0 else 0.0
+            novo_dominio = get_nivel_dominio(novo_perc) if novo_total_q > 0 else "[Não Medido]"
+
+            # 3. Atualiza o dashboard
+            transacao.atualizar(colecao_dashboard, id_topico, {
+                'Total_Questoes_Topico': novo_total_q,
+                'Total_Acertos_Topico': novo_total_a,
+                '%': novo_perc,
+                'Domínio': novo_dominio,
+                'Ultima_Medicao': ultimas[id_topico]
+            })
+
+        # 4. Regrava os resumos sem os totais removidos e apaga os registros do histórico
+        for (periodo, id_resumo), removido in resumos.items():
+            atual = resumos_atuais.get((periodo, id_resumo))
+            if atual is None:
+                continue
+            restante = _subtrair_resumo(atual, removido)
+            if restante is None:
+                transacao.apagar(colecao_resumos(perfil, periodo), id_resumo)
+            else:
+                transacao.gravar(colecao_resumos(perfil, periodo), id_resumo, restante)
+        for id_registro in ids_registros:
+            transacao.apagar(colecao_historico, id_registro)
+
+    db.executar_transacao(apagar_e_atualizar)
+
+    invalidar(perfil.get('id_documento'), colecao_dashboard)
+    invalidar(perfil.get('id_documento'), colecao_historico)
+    _invalidar_resumos(perfil)
+    return list(a_remover)
+
+def reconstruir_resumos(db, perfil):
+    """
+    Recalcula todos os resumos diários e semanais a partir dos históricos completos e marca o perfil
+    com 'resumos_disponiveis'. Deve correr sem lançamentos em curso; devolve o nº de documentos gravados.
+    """
+    gravados = 0
+    for periodo in (PERIODO_DIA, PERIODO_SEMANA):
+        df = _resumos_do_historico(db, perfil, periodo)
+        colecao = colecao_resumos(perfil, periodo)
+
+        novos = {}
+        for inicio, grupo in df.groupby('Data'):
+            inicio = inicio.to_pydatetime()
+            dados = {'Inicio': inicio, 'Disciplinas': {}}
+            dados.update({m: int(grupo[m].sum()) for m in METRICAS_RESUMO})
+            for disciplina, linha in zip(grupo['Disciplina'], grupo[METRICAS_RESUMO].itertuples(index=False)):
+                dados['Disciplinas'][disciplina] = {m: int(v) for m, v in zip(METRICAS_RESUMO, linha)}
+            novos[_id_resumo(inicio, periodo)] = dados
+
+        obsoletos = [id_resumo for id_resumo in db.listar(colecao, campos=[]) if id_resumo not in novos]
+
+        lote, pendentes = db.lote(), 0
+        operacoes = [(id_resumo, dados) for id_resumo, dados in novos.items()] + [(id_resumo, None) for id_resumo in obsoletos]
+        for id_resumo, dados in operacoes:
+            if dados is None:
+                lote.apagar(colecao, id_resumo)
+            else:
+                lote.gravar(colecao, id_resumo, dados)
+            pendentes += 1
+            if pendentes == 500:
+                lote.confirmar()
+                lote, pendentes = db.lote(), 0
+        if pendentes:
+            lote.confirmar()
+        gravados += len(novos)
+
+    db.atualizar(COLECAO_PERFIS, perfil['id_documento'], {'resumos_disponiveis': True})
+    perfil['resumos_disponiveis'] = True
+    invalidar(None, COLECAO_PERFIS)
+    _invalidar_resumos(perfil)
+    return gravados
+
+# --- RECONCILIAÇÃO DOS CONTADORES DO DASHBOARD ---
+#
+# Os contadores de cada tópico são mantidos por incrementos (lançamentos,
+# importações e remoções). reconstruir_contadores recalcula-os a partir do
+# histórico, com um único groupby, e grava só os tópicos que divergem.
+
+CAMPOS_CONTADORES = ['Total_Questoes_Topico', 'Total_Acertos_Topico', '%', 'Domínio', 'Ultima_Medicao']
+MAXIMO_TRABALHADORES_RECONCILIACAO = 4
+
+def _contadores_do_historico(df_historico, ids_topicos):
+    """Calcula CAMPOS_CONTADORES de cada tópico (índice: id do documento do dashboard) a partir do histórico."""
+    totais = pd.DataFrame(index=pd.Index(ids_topicos, dtype=object))
+    if not df_historico.empty and 'ID_Topico' in df_historico.columns:
+        df = pd.DataFrame({
+            'ID_Topico': pd.to_numeric(df_historico['ID_Topico'], errors='coerce'),
+            'Total_Questoes': pd.to_numeric(df_historico.get('Total_Questoes'), errors='coerce'),
+            'Acertos': pd.to_numeric(df_historico.get('Acertos'), errors='coerce'),
+            'Data_dt': df_historico['Data_dt'] if 'Data_dt' in df_historico.columns else pd.NaT,
+        }).dropna(subset=['ID_Topico'])
+        df['ID_Topico'] = df['ID_Topico'].astype('int64').astype(str)
+        agrupado = df.groupby('ID_Topico').agg(
+            questoes=('Total_Questoes', 'sum'), acertos=('Acertos', 'sum'), ultima=('Data_dt', 'max'))
+        totais = totais.join(agrupado)
+    else:
+        totais = totais.assign(questoes=0, acertos=0, ultima=pd.NaT)
+
+    questoes = totais['questoes'].fillna(0).astype('int64')
+    acertos = totais['acertos'].fillna(0).astype('int64')
+    percentual, dominio = calcular_derivados(questoes, acertos)
+    ultima = pd.to_datetime(totais['ultima']).dt.strftime('%d/%m/%Y').fillna('-')
+    return pd.DataFrame({
+        'Total_Questoes_Topico': questoes, 'Total_Acertos_Topico': acertos,
+        '%': percentual.astype(float), 'Domínio': dominio, 'Ultima_Medicao': ultima,
+    })
+
+def reconstruir_contadores(db, perfil):
+    """
+    Recalcula os contadores, '%', 'Domínio' e 'Ultima_Medicao' de todos os tópicos a partir do
+    histórico de questões e grava só os tópicos cujos valores diferem. Deve correr sem lançamentos
+    em curso; devolve o número de tópicos corrigidos.
+    """
+    colecao_dashboard = perfil['colecao_dashboard']
+    gravados = db.listar(colecao_dashboard, campos=CAMPOS_CONTADORES)
+    if not gravados:
+        return 0
+    documentos = db.listar(perfil['colecao_historico'], campos=['ID_Topico', 'Total_Questoes', 'Acertos', 'Data', CAMPO_DATA])
+    esperados = _contadores_do_historico(normalizar_historico(documentos), list(gravados))
+
+    atuais = pd.DataFrame(list(gravados.values()), index=esperados.index).reindex(columns=CAMPOS_CONTADORES)
+    diferentes = pd.Series(False, index=esperados.index)
+    for campo in ('Total_Questoes_Topico', 'Total_Acertos_Topico', '%'):
+        numeros = pd.to_numeric(atuais[campo], errors='coerce')
+        diferentes |= numeros.isna() | ((numeros - esperados[campo]).abs() > 1e-9)
+    for campo in ('Domínio', 'Ultima_Medicao'):
+        diferentes |= atuais[campo].astype(object).ne(esperados[campo])
+
+    lote, pendentes = db.lote(), 0
+    corrigidos = esperados[diferentes]
+    for id_topico, linha in zip(corrigidos.index, corrigidos.itertuples(index=False)):
+        lote.atualizar(colecao_dashboard, id_topico, {
+            'Total_Questoes_Topico': int(linha[0]), 'Total_Acertos_Topico': int(linha[1]),
+            '%': float(linha[2]), 'Domínio': linha[3], 'Ultima_Medicao': linha[4],
+        })
+        pendentes += 1
+        if pendentes == 500:
+            lote.confirmar()
+            lote, pendentes = db.lote(), 0
+    if pendentes:
+        lote.confirmar()
+
+    if len(corrigidos):
+        invalidar(perfil.get('id_documento'), colecao_dashboard)
+    return len(corrigidos)
+
+def reconstruir_contadores_perfis(db, perfis=None, max_trabalhadores=MAXIMO_TRABALHADORES_RECONCILIACAO):
+    """
+    Executa reconstruir_contadores em vários perfis em paralelo (por omissão, todos). Devolve
+    {id do perfil: nº de tópicos corrigidos, ou a exceção que o impediu}.
+    """
+    if perfis is None:
+        perfis = carregar_perfis(db)
+    perfis = {id_perfil: perfil for id_perfil, perfil in perfis.items() if perfil.get('colecao_dashboard')}
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=max_trabalhadores) as executor:
+        futuros = {executor.submit(reconstruir_contadores, db, perfil): id_perfil for id_perfil, perfil in perfis.items()}
+        for futuro in as_completed(futuros):
+            try:
+                resultados[futuros[futuro]] = futuro.result()
+            except Exception as e:
+                resultados[futuros[futuro]] = e
+    return resultados
+
+# --- LANÇAMENTOS EM MASSA ---
+#
+# Cada lote leva um bloco de lançamentos e tudo o que deles depende: os
+# contadores de cada tópico, somados num só Incremento, os registos do
+# histórico e os resumos do dia e da semana. Nunca passa de LIMITE_LOTE
+# escritas. Se um lote falhar, os anteriores ficam gravados e coerentes.
+
+def _blocos_por_lote(df, colunas_agrupadas):
+    """
+    Divide df em blocos cujas escritas cabem num lote: uma por linha e mais uma por valor
+    distinto de cada coluna de colunas_agrupadas (documentos escritos uma só vez por bloco).
+    """
+    inicio = 0
+    while inicio < len(df):
+        resto = df.iloc[inicio:inicio + armazenamento.LIMITE_LOTE]
+        escritas = np.arange(1, len(resto) + 1)
+        for coluna in colunas_agrupadas:
+            escritas = escritas + (~resto[coluna].duplicated()).cumsum().to_numpy()
+        fim = inicio + max(1, int(np.searchsorted(escritas, armazenamento.LIMITE_LOTE, side='right')))
+        yield df.iloc[inicio:fim]
+        inicio = fim
+
+def _com_periodos(df):
+    """Acrescenta os identificadores dos resumos diário e semanal de cada linha (_dia, _semana)."""
+    datas = df['Data'].dt.normalize()
+    return df.assign(
+        _dia=datas.dt.strftime('%Y-%m-%d'),
+        _semana=(datas - pd.to_timedelta(datas.dt.weekday, unit='D')).dt.strftime('%G-W%V'),
+    )
+
+def _acumular_resumos_bloco(bloco, coluna_disciplina, metricas):
+    """Soma as métricas ({métrica do resumo: coluna}) de um bloco por data e disciplina."""
+    resumos = {}
+    por_dia = bloco.groupby(['Data', coluna_disciplina], dropna=False)[list(metricas.values())].sum()
+    for (data, disciplina), valores in zip(por_dia.index, por_dia.itertuples(index=False)):
+        _acumular_resumo(resumos, data, None if pd.isna(disciplina) else disciplina,
+                         **{metrica: int(valor) for metrica, valor in zip(metricas, valores)})
+    return resumos
+
+def lancar_questoes_em_massa(db, perfil, df_lancamentos, ao_progredir=None):
+    """
+    Regista lançamentos já validados (colunas Data, ID_Topico, Total_Questoes, Acertos) em lotes.
+    Chama ao_progredir(gravados, total) após cada lote e devolve os IDs dos tópicos atualizados.
+    """
+    colecao_dashboard = perfil['colecao_dashboard']
+    colecao_historico = perfil['colecao_historico']
+    df_catalogo = carregar_catalogo(db, perfil)
+    disciplinas = dict(zip(df_catalogo['ID'], df_catalogo['Disciplina']))
+    df = _com_periodos(df_lancamentos.sort_values('Data', kind='stable'))
+    df['Disciplina'] = df['ID_Topico'].map(disciplinas)
+    # Lançamentos antigos não podem recuar a 'Ultima_Medicao' gravada: lê-a uma vez e só a
+    # substitui por datas posteriores.
+    ultimas = {
+        int(id_topico): _data_medicao(dados.get('Ultima_Medicao'))
+        for id_topico, dados in db.ler_varios(colecao_dashboard, [str(i) for i in df['ID_Topico'].unique().tolist()]).items()
+    }
+
+    gravados, atualizados = 0, set()
+    try:
+        for bloco in _blocos_por_lote(df, ['ID_Topico', '_dia', '_semana']):
+            lote = db.lote()
+            por_topico = bloco.groupby('ID_Topico').agg(
+                Total_Questoes=('Total_Questoes', 'sum'), Acertos=('Acertos', 'sum'), Data=('Data', 'max')
+            )
+            for id_topico, questoes, acertos, data in zip(por_topico.index.tolist(), por_topico['Total_Questoes'].tolist(),
+                                                          por_topico['Acertos'].tolist(), por_topico['Data']):
+                alteracoes = {
+                    'Total_Questoes_Topico': armazenamento.Incremento(questoes),
+                    'Total_Acertos_Topico': armazenamento.Incremento(acertos),
+                }
+                ultima = ultimas.get(id_topico)
+                if ultima is None or data > ultima:
+                    alteracoes['Ultima_Medicao'] = data.strftime('%d/%m/%Y')
+                    ultimas[id_topico] = data
+                lote.atualizar(colecao_dashboard, str(id_topico), alteracoes)
+            for data, id_topico, questoes, acertos in zip(bloco['Data'], bloco['ID_Topico'].tolist(),
+                                                          bloco['Total_Questoes'].tolist(), bloco['Acertos'].tolist()):
+                lote.gravar(colecao_historico, db.novo_id(colecao_historico), {
+                    'ID_Topico': id_topico,
+                    'Data': data.strftime('%d/%m/%Y'),
+                    CAMPO_DATA: carimbo_data(data),
+                    'Total_Questoes': questoes,
+                    'Acertos': acertos,
+                    '%': acertos / questoes * 100
+                })
+            _gravar_resumos(lote, perfil, _acumular_resumos_bloco(
+                bloco, 'Disciplina', {'questoes': 'Total_Questoes', 'acertos': 'Acertos'}))
+            lote.confirmar()
+
+            gravados += len(bloco)
+            atualizados.update(por_topico.index.tolist())
+            if ao_progredir:
+                ao_progredir(gravados, len(df))
+    finally:
+        if gravados:
+            invalidar(perfil.get('id_documento'), colecao_dashboard)
+            invalidar(perfil.get('id_documento'), colecao_historico)
+            _invalidar_resumos(perfil)
+    return sorted(atualizados)
+
+def registrar_tempo_em_massa(db, perfil, df_sessoes, ao_progredir=None):
+    """
+    Regista sessões de estudo já validadas (colunas Data, Disciplina, Tempo_Estudado_Minutos) em lotes.
+    Chama ao_progredir(gravadas, total) após cada lote e devolve o número de sessões gravadas.
+    """
+    colecao = colecao_historico_tempo(perfil)
+    if not colecao:
+        raise ValueError("ID do perfil não encontrado na sessão. Por favor, recarregue o perfil na página principal.")
+    df = _com_periodos(df_sessoes.sort_values('Data', kind='stable'))
+
+    gravadas = 0
+    try:
+        for bloco in _blocos_por_lote(df, ['_dia', '_semana']):
+            lote = db.lote()
+            for data, disciplina, minutos in zip(bloco['Data'], bloco['Disciplina'].tolist(),
+                                                 bloco['Tempo_Estudado_Minutos'].tolist()):
+                lote.gravar(colecao, db.novo_id(colecao), {
+                    'Disciplina': disciplina,
+                    'Data': data.strftime('%d/%m/%Y'),
+                    CAMPO_DATA: carimbo_data(data),
+                    'Tempo_Estudado_Minutos': minutos
+                })
+            _gravar_resumos(lote, perfil, _acumular_resumos_bloco(
+                bloco, 'Disciplina', {'minutos': 'Tempo_Estudado_Minutos'}))
+            lote.confirmar()
+
+            gravadas += len(bloco)
+            if ao_progredir:
+                ao_progredir(gravadas, len(df))
+    finally:
+        if gravadas:
+            invalidar(perfil.get('id_documento'), colecao)
+            _invalidar_resumos(perfil)
+    return gravadas
+
+# --- MIGRAÇÕES ---
+
+class DatasInvalidas(ValueError):
+    """Registos do histórico cuja 'Data' não é interpretável; `registros` lista (coleção, id, Data)."""
+
+    def __init__(self, registros, atualizados):
+        self.registros = registros
+        self.atualizados = atualizados
+        exemplos = ', '.join(f"{colecao}/{id_registro} ({data!r})" for colecao, id_registro, data in registros[:5])
+        super().__init__(f"{len(registros)} registros com 'Data' inválida (ex.: {exemplos}); "
+                         f"os outros {atualizados} foram migrados. Corrija-os ou apague-os e repita a migração.")
+
+
+def migrar_datas_historico(db, perfil):
+    """
+    Acrescenta CAMPO_DATA aos registos dos históricos que só têm a string 'Data' e marca o
+    perfil com 'datas_tipadas'. Pode ser repetida sem efeitos; devolve o nº de registos atualizados.
+    Se algum registo tiver uma 'Data' inválida, migra os outros mas não marca o perfil (as leituras
+    tipadas deixariam de o ver) e levanta DatasInvalidas.
+    """
+    atualizados, invalidos = 0, []
+    for colecao in (perfil.get('colecao_historico'), colecao_historico_tempo(perfil)):
+        if not colecao:
+            continue
+        lote, pendentes = db.lote(), 0
+        for id_registro, dados in db.listar(colecao, campos=['Data', CAMPO_DATA]).items():
+            if dados.get(CAMPO_DATA) is not None:
+                continue
+            try:
+                data = datetime.strptime(dados.get('Data') or '', '%d/%m/%Y')
+            except ValueError:
+                invalidos.append((colecao, id_registro, dados.get('Data')))
+                continue
+            lote.atualizar(colecao, id_registro, {CAMPO_DATA: carimbo_data(data)})
+            pendentes += 1
+            atualizados += 1
+            if pendentes == 500:
+                lote.confirmar()
+                lote, pendentes = db.lote(), 0
+        if pendentes:
+            lote.confirmar()
+        invalidar(perfil.get('id_documento'), colecao)
+
+    if invalidos:
+        raise DatasInvalidas(invalidos, atualizados)
+    db.atualizar(COLECAO_PERFIS, perfil['id_documento'], {'datas_tipadas': True})
+    perfil['datas_tipadas'] = True
+    invalidar(None, COLECAO_PERFIS)
+    return atualizados
@@ -0,0 +1,36 @@
+import os
+import sys
+import uuid
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import repositorio
+
+
+@pytest.fixture
+def db():
+    """Um armazenamento em memória novo para cada teste."""
+    armazenamento = pytest.importorskip('armazenamento')
+    return armazenamento.ArmazenamentoMemoria()
+
+
+@pytest.fixture
+def perfil(db):
+    """Perfil com três tópicos de duas disciplinas, sem lançamentos. O id é único, pois a cache é do processo."""
+    id_perfil = f"teste_{uuid.uuid4().hex[:8]}"
+    perfil = {
+        'nome': 'Teste', 'cargo': 'Analista', 'ano': 2026, 'status': 'Ativo',
+        'colecao_dashboard': f"dashboard_{id_perfil}", 'colecao_historico': f"historico_{id_perfil}",
+        'resumos_disponiveis': True, 'datas_tipadas': True,
+    }
+    topicos = [('Português', 'Crase'), ('Português', 'Regência'), ('Informática', 'Redes')]
+    for id_topico, (disciplina, topico) in enumerate(topicos, start=1):
+        db.gravar(perfil['colecao_dashboard'], str(id_topico), {
+            'ID': id_topico, 'Disciplina': disciplina, 'Tópico do Edital': topico, 'Teoria (T)': '[ ]',
+            'Domínio': '[Não Medido]', '%': 0.0, 'Total_Questoes_Topico': 0, 'Total_Acertos_Topico': 0,
+            'Ultima_Medicao': '-',
+        })
+    db.gravar(repositorio.COLECAO_PERFIS, id_perfil, perfil)
+    perfil['id_documento'] = id_perfil
+    return perfil
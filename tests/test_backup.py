@@ -0,0 +1,52 @@
+from datetime import date
+import pandas as pd
+import pytest
+import backup
+import repositorio
+
+
+def _documentos(db, perfil):
+    return {papel: {id_documento: dados for pagina in db.percorrer(colecao) for id_documento, dados in pagina.items()}
+            for papel, colecao in backup.colecoes_perfil(perfil).items()}
+
+
+@pytest.fixture
+def perfil_com_dados(db, perfil):
+    repositorio.gravar_catalogo(db, perfil['id_documento'], pd.DataFrame({
+        'ID': [1, 2, 3], 'Disciplina': ['Português', 'Português', 'Informática'],
+        'Tópico do Edital': ['Crase', 'Regência', 'Redes'],
+    }))
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}, '3': {'questoes': 4, 'acertos': 1}},
+                                date(2026, 10, 12))
+    repositorio.registrar_tempo(db, perfil, 'Português', date(2026, 10, 13), 45)
+    # Um campo fora do esquema e um valor de outro tipo vão para a coluna de extras.
+    db.atualizar(perfil['colecao_dashboard'], '2', {'Notas': {'fonte': 'manual'}, '%': 50})
+    return perfil
+
+
+@pytest.mark.parametrize('nome', ['perfil.ndjson.gz', 'perfil_parquet'])
+def test_backup_restaura_os_documentos_tal_como_foram_exportados(db, perfil_com_dados, tmp_path, nome):
+    pytest.importorskip('pyarrow')
+    destino = str(tmp_path / nome)
+    contagens = backup.exportar_perfil(db, perfil_com_dados['id_documento'], destino)
+    assert contagens[backup.PAPEL_DASHBOARD] == 3
+
+    novo_id = perfil_com_dados['id_documento'] + '_copia'
+    assert backup.restaurar_perfil(db, destino, id_perfil=novo_id) == {p: n for p, n in contagens.items() if n}
+    copia = dict(db.ler(repositorio.COLECAO_PERFIS, novo_id), id_documento=novo_id)
+    assert _documentos(db, copia) == _documentos(db, perfil_com_dados)
+
+
+def test_parquet_guarda_os_campos_em_colunas_tipadas(db, perfil_com_dados, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    backup.exportar_perfil(db, perfil_com_dados['id_documento'], str(tmp_path))
+
+    tabela = pq.read_table(tmp_path / 'dashboard.parquet')
+    assert tabela.schema.field('Total_Questoes_Topico').type == pa.int64()
+    assert tabela.schema.field('%').type == pa.float64()
+    linhas = {linha['id']: linha for linha in tabela.to_pylist()}
+    assert linhas['1']['Total_Questoes_Topico'] == 10 and linhas['1'][backup.COLUNA_EXTRAS] is None
+    assert linhas['2']['%'] is None
+    historico = pq.read_table(tmp_path / 'historico.parquet')
+    assert pa.types.is_timestamp(historico.schema.field(repositorio.CAMPO_DATA).type)
@@ -0,0 +1,79 @@
+import armazenamento
+import cache_limitada
+import espelho
+
+
+def _cache(orcamento, **opcoes):
+    return cache_limitada.CacheLimitada('teste', orcamento=orcamento, medir=lambda valor: 10, **opcoes)
+
+
+def test_despeja_o_perfil_usado_ha_mais_tempo_com_todas_as_entradas():
+    cache = _cache(40)
+    cache[('a', 'x')] = 1
+    cache[('a', 'y')] = 2
+    cache[('b', 'x')] = 3
+    cache.get(('a', 'x'))
+    cache[('c', 'x')] = 4
+    cache[('c', 'y')] = 5
+
+    assert ('b', 'x') not in cache
+    assert ('a', 'x') in cache and ('a', 'y') in cache
+    assert cache.ocupacao == 40
+    assert cache.estatisticas()['despejos'] == 1
+
+
+def test_um_so_perfil_acima_do_orcamento_perde_as_entradas_mais_antigas():
+    cache = _cache(20)
+    for chave in 'xyz':
+        cache[('a', chave)] = chave
+    assert list(cache) == [('a', 'y'), ('a', 'z')]
+
+
+def test_valor_maior_que_o_orcamento_nao_e_guardado():
+    cache = cache_limitada.CacheLimitada('teste', orcamento=5, medir=lambda valor: 10)
+    cache[('a', 'x')] = 1
+    assert len(cache) == 0 and cache.rejeitadas == 1
+
+
+def test_redimensionar_despeja_e_avisa_ao_despejar():
+    fechados = []
+    cache = _cache(30, ao_despejar=fechados.append)
+    cache[('a', 'x')] = 'antigo'
+    cache[('b', 'x')] = 'espelho'
+    assert cache.redimensionar(('b', 'x'), 25)
+    assert fechados == ['antigo']
+    assert cache.ocupacao == 25
+    assert not cache.redimensionar(('b', 'x'), 31)
+    assert fechados == ['antigo', 'espelho']
+
+
+def test_espelhos_contam_no_orcamento_e_sao_despejados_por_perfil(monkeypatch):
+    cache = cache_limitada.CacheLimitada('teste', orcamento=200_000, ao_despejar=lambda valor: valor.fechar())
+    monkeypatch.setattr(espelho, '_cache', cache)
+    db = armazenamento.ArmazenamentoMemoria()
+    for id_perfil in ('p1', 'p2'):
+        for i in range(300):
+            db.gravar(f"dashboard_{id_perfil}", str(i), {'Tópico do Edital': 'x' * 200})
+
+    primeiro = espelho.obter_espelho(db, 'p1', 'dashboard_p1')
+    assert primeiro is not None and primeiro.tamanho > 60_000
+    assert cache.ocupacao >= primeiro.tamanho
+
+    segundo = espelho.obter_espelho(db, 'p2', 'dashboard_p2')
+    assert segundo is not None
+    assert espelho.espelho_existente('p1', 'dashboard_p1') is None
+    assert not primeiro.ativo
+    assert cache.ocupacao <= cache.orcamento
+
+
+def test_colecao_maior_que_o_orcamento_nao_e_espelhada(monkeypatch):
+    cache = cache_limitada.CacheLimitada('teste', orcamento=10_000, ao_despejar=lambda valor: valor.fechar())
+    monkeypatch.setattr(espelho, '_cache', cache)
+    monkeypatch.setattr(espelho, '_grandes_demais', set())
+    db = armazenamento.ArmazenamentoMemoria()
+    for i in range(100):
+        db.gravar('grande', str(i), {'Tópico do Edital': 'x' * 200})
+
+    assert espelho.obter_espelho(db, 'p1', 'grande') is None
+    assert len(cache) == 0
+    assert espelho.obter_espelho(db, 'p1', 'grande') is None
@@ -0,0 +1,39 @@
+import math
+import repositorio
+
+
+def _documento(id_topico, **campos):
+    dados = {'ID': id_topico, 'Disciplina': 'Português', 'Tópico do Edital': f"Tópico {id_topico}",
+             'Teoria (T)': '[x]', 'Total_Questoes_Topico': 10, 'Total_Acertos_Topico': 9, 'Ultima_Medicao': '01/10/2026'}
+    dados.update(campos)
+    return dados
+
+
+def test_decodificar_documentos_aplica_valores_por_omissao_e_esquema():
+    documentos = [
+        _documento(2),
+        {'ID': 1, 'Disciplina': None, 'Total_Questoes_Topico': math.nan},
+    ]
+    df = repositorio.decodificar_documentos(documentos, repositorio.CAMPOS_DASHBOARD, repositorio.ESQUEMA_DASHBOARD)
+
+    assert df['Qsts'].tolist() == [10, 0]
+    assert df['Disciplina'].tolist() == ['Português', 'N/A']
+    assert df['Últ. Medição'].tolist() == ['01/10/2026', '-']
+    assert str(df['Qsts'].dtype) == repositorio.TIPO_CONTADOR
+    assert str(df['Disciplina'].dtype) == 'category'
+
+
+def test_normalizar_dashboard_recalcula_os_derivados_a_partir_dos_contadores():
+    # '%' e 'Domínio' gravados podem estar atrasados em relação aos contadores.
+    documentos = {'2': _documento(2, **{'%': 0.0, 'Domínio': '[Não Medido]'}),
+                  '1': _documento(1, Total_Questoes_Topico=0, Total_Acertos_Topico=0)}
+    df = repositorio.normalizar_dashboard(documentos.values())
+
+    assert df['ID'].tolist() == [1, 2]
+    assert df['%'].tolist() == [0.0, 90.0]
+    assert df['Domínio'].tolist() == ['[Não Medido]', '[Domínio Mestre]']
+    assert list(df.columns) == repositorio.COLUNAS_DASHBOARD
+
+
+def test_normalizar_dashboard_vazio():
+    assert repositorio.normalizar_dashboard([]).empty
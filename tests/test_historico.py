@@ -0,0 +1,71 @@
+from datetime import date
+import pytest
+import repositorio
+
+
+def _gravar_registros(db, perfil, datas, id_topico=1):
+    for numero, data in enumerate(datas):
+        db.gravar(perfil['colecao_historico'], f"r{numero:03d}", {
+            'ID_Topico': id_topico, 'Data': data, 'Total_Questoes': 10, 'Acertos': 7, '%': 70.0,
+        })
+
+
+def _por_migrar(db, perfil):
+    perfil['datas_tipadas'] = False
+    db.atualizar(repositorio.COLECAO_PERFIS, perfil['id_documento'], {'datas_tipadas': False})
+
+
+def test_migracao_com_data_invalida_nao_marca_o_perfil(db, perfil):
+    _por_migrar(db, perfil)
+    _gravar_registros(db, perfil, ['01/03/2026', 'xx/yy', '02/03/2026'])
+
+    with pytest.raises(repositorio.DatasInvalidas) as erro:
+        repositorio.migrar_datas_historico(db, perfil)
+
+    assert erro.value.atualizados == 2
+    assert erro.value.registros == [(perfil['colecao_historico'], 'r001', 'xx/yy')]
+    assert not perfil.get('datas_tipadas')
+    assert not db.ler(repositorio.COLECAO_PERFIS, perfil['id_documento']).get('datas_tipadas')
+    assert len(repositorio.carregar_historico_topico(db, perfil, 1)) == 3
+
+
+def test_migracao_conclui_depois_de_apagado_o_registo_invalido(db, perfil):
+    _por_migrar(db, perfil)
+    _gravar_registros(db, perfil, ['01/03/2026', 'xx/yy', '02/03/2026'])
+    with pytest.raises(repositorio.DatasInvalidas):
+        repositorio.migrar_datas_historico(db, perfil)
+
+    db.apagar(perfil['colecao_historico'], 'r001')
+    assert repositorio.migrar_datas_historico(db, perfil) == 0
+    assert perfil['datas_tipadas']
+    assert repositorio.carregar_historico_topico(db, perfil, 1)['Data'].tolist() == ['02/03/2026', '01/03/2026']
+
+
+def _resumos(db, perfil):
+    return {periodo: db.listar(repositorio.colecao_resumos(perfil, periodo))
+            for periodo in (repositorio.PERIODO_DIA, repositorio.PERIODO_SEMANA)}
+
+
+def test_apagar_registros_subtrai_contadores_e_resumos(db, perfil):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}, '3': {'questoes': 4, 'acertos': 1}},
+                                date(2026, 10, 12))
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 6, 'acertos': 6}}, date(2026, 10, 14))
+    repositorio.registrar_tempo(db, perfil, 'Português', date(2026, 10, 12), 30)
+    df = repositorio.carregar_historico_questoes_df(db, perfil)
+    a_apagar = df[(df['ID_Topico'] == 3) | (df['Data'] == '14/10/2026')]
+
+    assert sorted(repositorio.apagar_registros_historico(db, perfil, a_apagar.to_dict('records'))) == ['1', '3']
+
+    topico = db.ler(perfil['colecao_dashboard'], '1')
+    assert (topico['Total_Questoes_Topico'], topico['Total_Acertos_Topico'], topico['Ultima_Medicao']) == (10, 8, '12/10/2026')
+    topico = db.ler(perfil['colecao_dashboard'], '3')
+    assert (topico['Total_Questoes_Topico'], topico['Domínio'], topico['Ultima_Medicao']) == (0, '[Não Medido]', '-')
+    assert len(db.listar(perfil['colecao_historico'])) == 1
+
+    # Sem disciplinas a zero nem dias vazios: os resumos coincidem com os reconstruídos do histórico.
+    resumos = _resumos(db, perfil)
+    assert set(resumos[repositorio.PERIODO_DIA]) == {'2026-10-12'}
+    assert set(resumos[repositorio.PERIODO_SEMANA]['2026-W42']['Disciplinas']) == {'Português'}
+    repositorio.reconstruir_resumos(db, perfil)
+    assert _resumos(db, perfil) == resumos
+    assert repositorio.reconstruir_contadores(db, perfil) == 0
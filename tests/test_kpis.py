@@ -0,0 +1,31 @@
+from datetime import date
+import pytest
+import repositorio
+
+
+@pytest.mark.parametrize('usar_espelho', [False, True])
+def test_kpis_somam_os_contadores_e_o_tempo(db, perfil, monkeypatch, usar_espelho):
+    monkeypatch.setattr(repositorio, 'USAR_ESPELHO', usar_espelho)
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}, '3': {'questoes': 4, 'acertos': 1}},
+                                date(2026, 10, 10))
+    repositorio.registrar_tempo(db, perfil, 'Português', date(2026, 10, 10), 30)
+    repositorio.registrar_tempo(db, perfil, 'Informática', date(2026, 10, 11), 15)
+    if usar_espelho:
+        # Com as coleções espelhadas, os indicadores são calculados a partir do espelho.
+        repositorio.carregar_dashboard_df(db, perfil)
+        repositorio.carregar_historico_tempo_df(db, perfil)
+
+    assert repositorio.carregar_kpis(db, perfil) == {
+        'total_topicos': 3, 'topicos_medidos': 2, 'total_questoes': 14, 'total_acertos': 9, 'tempo_total_minutos': 45,
+    }
+
+    # Uma escrita invalida os indicadores em cache.
+    repositorio.lancar_simulado(db, perfil, {'2': {'questoes': 6, 'acertos': 6}}, date(2026, 10, 12))
+    kpis = repositorio.carregar_kpis(db, perfil)
+    assert (kpis['topicos_medidos'], kpis['total_questoes'], kpis['total_acertos']) == (3, 20, 15)
+
+
+def test_kpis_sem_perfil():
+    assert repositorio.carregar_kpis(None, None) == {
+        'total_topicos': 0, 'topicos_medidos': 0, 'total_questoes': 0, 'total_acertos': 0, 'tempo_total_minutos': 0,
+    }
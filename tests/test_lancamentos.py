@@ -0,0 +1,28 @@
+from datetime import date
+import pandas as pd
+import repositorio
+
+
+def _importar(db, perfil, linhas):
+    df = pd.DataFrame(linhas, columns=['Data', 'ID_Topico', 'Total_Questoes', 'Acertos'])
+    df['Data'] = pd.to_datetime(df['Data'], format='%d/%m/%Y')
+    return repositorio.lancar_questoes_em_massa(db, perfil, df)
+
+
+def test_importacao_de_datas_antigas_nao_recua_a_ultima_medicao(db, perfil):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}}, date(2026, 10, 17))
+    _importar(db, perfil, [('17/09/2026', 1, 5, 5), ('20/09/2026', 2, 4, 2)])
+
+    topico = db.ler(perfil['colecao_dashboard'], '1')
+    assert topico['Ultima_Medicao'] == '17/10/2026'
+    assert topico['Total_Questoes_Topico'] == 15
+    assert db.ler(perfil['colecao_dashboard'], '2')['Ultima_Medicao'] == '20/09/2026'
+
+
+def test_importacao_avanca_a_ultima_medicao_para_a_data_mais_recente(db, perfil):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}}, date(2026, 9, 1))
+    _importar(db, perfil, [('03/09/2026', 1, 5, 5), ('02/09/2026', 1, 5, 1)])
+
+    assert db.ler(perfil['colecao_dashboard'], '1')['Ultima_Medicao'] == '03/09/2026'
+    df = repositorio.carregar_dashboard_df(db, perfil)
+    assert df.loc[df['ID'] == 1, 'Qsts'].item() == 20
@@ -0,0 +1,43 @@
+import time
+from datetime import date, datetime, timedelta
+import repositorio
+
+
+def _lancar(db, perfil, n, id_topico=1):
+    for dia in range(n):
+        repositorio.lancar_simulado(db, perfil, {str(id_topico): {'questoes': 10, 'acertos': dia % 10}},
+                                    date(2026, 1, 1) + timedelta(days=dia))
+
+
+def test_locks_das_leituras_sao_libertados(db, perfil):
+    _lancar(db, perfil, 5)
+    cursor = None
+    while True:
+        _, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, cursor, tamanho=2)
+        if cursor is None:
+            break
+    repositorio.carregar_em_paralelo({
+        'dashboard': lambda: repositorio.carregar_dashboard_df(db, perfil),
+        'desde': lambda: repositorio.carregar_historico_questoes_df(db, perfil, desde=datetime(2026, 1, 3)),
+    })
+    assert repositorio._cargas == {}
+
+
+def test_leituras_simultaneas_da_mesma_entrada_leem_uma_vez(db, perfil, monkeypatch):
+    leituras = []
+    listar = db.listar
+
+    def listar_lento(colecao, filtros=(), campos=None):
+        leituras.append(colecao)
+        time.sleep(0.2)
+        return listar(colecao, filtros, campos)
+
+    monkeypatch.setattr(repositorio, 'USAR_ESPELHO', False)
+    monkeypatch.setattr(db, 'listar', listar_lento)
+    resultados = repositorio.carregar_em_paralelo({
+        nome: (lambda: repositorio.carregar_dashboard_df(db, perfil)) for nome in ('a', 'b', 'c')
+    })
+
+    assert leituras == [perfil['colecao_dashboard']]
+    assert all(len(df) == 3 for df in resultados.values())
+    assert repositorio._cargas == {}
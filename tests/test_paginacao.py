@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+import repositorio
+
+
+def _lancar_dias(db, perfil, total):
+    for dia in range(total):
+        repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 2, 'acertos': 1}}, date(2026, 9, 1) + timedelta(days=dia))
+    # Um lançamento de outro tópico não entra nas páginas.
+    repositorio.lancar_simulado(db, perfil, {'2': {'questoes': 3, 'acertos': 3}}, date(2026, 9, 5))
+
+
+def _todas_as_paginas(db, perfil, tamanho):
+    paginas, cursor = [], None
+    while True:
+        df, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, cursor, tamanho)
+        paginas.append(df)
+        if cursor is None:
+            return paginas
+
+
+def test_paginas_com_datas_tipadas_usam_o_cursor_do_servidor(db, perfil):
+    _lancar_dias(db, perfil, 7)
+    paginas = _todas_as_paginas(db, perfil, 3)
+
+    assert [len(df) for df in paginas] == [3, 3, 1]
+    datas = [data for df in paginas for data in df[repositorio.CAMPO_DATA]]
+    assert datas == sorted(datas, reverse=True) and len(set(datas)) == 7
+    df, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, None, 3)
+    assert cursor[1] == df['id_documento'].iloc[-1]
+
+
+def test_paginas_sem_datas_tipadas_usam_a_posicao(db, perfil):
+    _lancar_dias(db, perfil, 6)
+    perfil['datas_tipadas'] = False
+
+    df, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, None, 4)
+    assert (len(df), cursor) == (4, 4)
+    df, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, cursor, 4)
+    assert (len(df), cursor) == (2, None)
+    assert df['Data'].tolist() == ['02/09/2026', '01/09/2026']
+
+
+def test_pagina_exata_nao_devolve_cursor(db, perfil):
+    _lancar_dias(db, perfil, 3)
+    df, cursor = repositorio.carregar_pagina_historico_topico(db, perfil, 1, None, 3)
+    assert (len(df), cursor) == (3, None)
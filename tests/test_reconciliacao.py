@@ -0,0 +1,50 @@
+from datetime import date
+import repositorio
+
+
+def _registar_atualizacoes(db, monkeypatch):
+    """Devolve a lista, preenchida à medida, dos (coleção, id) atualizados pelos lotes de `db`."""
+    atualizados = []
+    criar_lote = db.lote
+
+    def lote():
+        novo = criar_lote()
+        atualizar = novo.atualizar
+
+        def registar(colecao, id_documento, dados):
+            atualizados.append((colecao, id_documento))
+            return atualizar(colecao, id_documento, dados)
+        novo.atualizar = registar
+        return novo
+    monkeypatch.setattr(db, 'lote', lote)
+    return atualizados
+
+
+def test_reconstruir_contadores_grava_so_os_topicos_divergentes(db, perfil, monkeypatch):
+    for data, resultados in [(date(2026, 10, 10), {'1': {'questoes': 10, 'acertos': 8}, '3': {'questoes': 4, 'acertos': 1}}),
+                             (date(2026, 10, 12), {'3': {'questoes': 6, 'acertos': 6}})]:
+        repositorio.lancar_simulado(db, perfil, resultados, data, modo=repositorio.MODO_TRANSACAO)
+    colecao = perfil['colecao_dashboard']
+    db.atualizar(colecao, '1', {'Total_Questoes_Topico': 99})
+    db.atualizar(colecao, '3', {'Ultima_Medicao': '01/01/2026'})
+    atualizados = _registar_atualizacoes(db, monkeypatch)
+
+    assert repositorio.reconstruir_contadores(db, perfil) == 2
+
+    assert sorted(atualizados) == [(colecao, '1'), (colecao, '3')]
+    topico = db.ler(colecao, '1')
+    assert (topico['Total_Questoes_Topico'], topico['%'], topico['Domínio']) == (10, 80.0, repositorio.get_nivel_dominio(80.0))
+    topico = db.ler(colecao, '3')
+    assert (topico['Total_Questoes_Topico'], topico['Total_Acertos_Topico'], topico['Ultima_Medicao']) == (10, 7, '12/10/2026')
+
+    atualizados.clear()
+    assert repositorio.reconstruir_contadores(db, perfil) == 0
+    assert atualizados == []
+
+
+def test_reconstruir_contadores_zera_topicos_sem_historico(db, perfil):
+    db.atualizar(perfil['colecao_dashboard'], '2', {'Total_Questoes_Topico': 5, 'Total_Acertos_Topico': 5, 'Ultima_Medicao': '02/10/2026'})
+
+    assert repositorio.reconstruir_contadores(db, perfil) == 1
+    topico = db.ler(perfil['colecao_dashboard'], '2')
+    assert (topico['Total_Questoes_Topico'], topico['Domínio'], topico['Ultima_Medicao']) == (0, '[Não Medido]', '-')
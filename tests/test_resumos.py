@@ -0,0 +1,41 @@
+from datetime import date, datetime
+import repositorio
+
+
+def _resumos(db, perfil, periodo):
+    return db.listar(repositorio.colecao_resumos(perfil, periodo))
+
+
+def test_acumular_resumo_agrupa_por_dia_e_por_semana():
+    acumulado = {}
+    repositorio._acumular_resumo(acumulado, date(2026, 10, 13), 'Português', questoes=10, acertos=7)
+    repositorio._acumular_resumo(acumulado, date(2026, 10, 13), 'Português', questoes=5, acertos=5)
+    repositorio._acumular_resumo(acumulado, date(2026, 10, 15), None, minutos=30)
+
+    assert set(acumulado) == {
+        (repositorio.PERIODO_DIA, '2026-10-13'), (repositorio.PERIODO_DIA, '2026-10-15'),
+        (repositorio.PERIODO_SEMANA, '2026-W42'),
+    }
+    dia = acumulado[(repositorio.PERIODO_DIA, '2026-10-13')]
+    assert dia['Disciplinas'] == {'Português': {'Total_Questoes': 15, 'Acertos': 12, 'Tempo_Estudado_Minutos': 0}}
+    semana = acumulado[(repositorio.PERIODO_SEMANA, '2026-W42')]
+    assert semana['Inicio'] == datetime(2026, 10, 12)
+    assert semana['Disciplinas']['N/A']['Tempo_Estudado_Minutos'] == 30
+
+
+def test_reconstruir_resumos_coincide_com_os_mantidos_nos_lancamentos(db, perfil):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}, '3': {'questoes': 4, 'acertos': 1}},
+                                date(2026, 10, 12))
+    repositorio.lancar_simulado(db, perfil, {'2': {'questoes': 6, 'acertos': 3}}, date(2026, 10, 19))
+    repositorio.registrar_tempo(db, perfil, 'Português', date(2026, 10, 13), 45)
+    mantidos = {periodo: _resumos(db, perfil, periodo) for periodo in (repositorio.PERIODO_DIA, repositorio.PERIODO_SEMANA)}
+    # Um resumo sem lançamentos correspondentes é apagado na reconstrução.
+    db.gravar(repositorio.colecao_resumos(perfil, repositorio.PERIODO_DIA), '2026-01-01',
+              {'Inicio': datetime(2026, 1, 1), 'Disciplinas': {}, 'Total_Questoes': 3})
+
+    repositorio.reconstruir_resumos(db, perfil)
+
+    for periodo, esperados in mantidos.items():
+        assert _resumos(db, perfil, periodo) == esperados
+    semana = mantidos[repositorio.PERIODO_SEMANA]['2026-W42']
+    assert (semana['Total_Questoes'], semana['Acertos'], semana['Tempo_Estudado_Minutos']) == (14, 9, 45)
@@ -0,0 +1,57 @@
+from datetime import date
+import pytest
+import repositorio
+
+MODOS = [repositorio.MODO_INCREMENTO, repositorio.MODO_TRANSACAO]
+
+
+@pytest.mark.parametrize('modo', MODOS)
+def test_topico_invalido_nao_grava_nada(db, perfil, modo):
+    with pytest.raises(ValueError, match='não encontrado.*99'):
+        repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}, '99': {'questoes': 5, 'acertos': 5}},
+                                    date(2026, 10, 10), modo=modo)
+
+    assert db.ler(perfil['colecao_dashboard'], '1')['Total_Questoes_Topico'] == 0
+    assert db.listar(perfil['colecao_historico']) == {}
+    for periodo in (repositorio.PERIODO_DIA, repositorio.PERIODO_SEMANA):
+        assert db.listar(repositorio.colecao_resumos(perfil, periodo)) == {}
+
+
+@pytest.mark.parametrize('modo', MODOS)
+def test_lancamento_retroativo_nao_recua_a_ultima_medicao(db, perfil, modo):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}}, date(2026, 10, 10), modo=modo)
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 4, 'acertos': 2}, '2': {'questoes': 3, 'acertos': 3}},
+                                date(2026, 10, 1), modo=modo)
+
+    topico = db.ler(perfil['colecao_dashboard'], '1')
+    assert (topico['Ultima_Medicao'], topico['Total_Questoes_Topico'], topico['Total_Acertos_Topico']) == ('10/10/2026', 14, 10)
+    assert db.ler(perfil['colecao_dashboard'], '2')['Ultima_Medicao'] == '01/10/2026'
+    if modo == repositorio.MODO_TRANSACAO:
+        # Com '%' e 'Domínio' já gravados, a reconciliação não encontra divergências.
+        assert repositorio.reconstruir_contadores(db, perfil) == 0
+
+
+def test_incrementos_acumulam_e_a_reconciliacao_grava_os_derivados(db, perfil):
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 10, 'acertos': 8}}, date(2026, 10, 10))
+    repositorio.lancar_simulado(db, perfil, {'1': {'questoes': 4, 'acertos': 2}}, date(2026, 10, 11))
+
+    topico = db.ler(perfil['colecao_dashboard'], '1')
+    assert (topico['Total_Questoes_Topico'], topico['Total_Acertos_Topico'], topico['%']) == (14, 10, 0.0)
+    # A leitura já recalcula os derivados; a reconciliação só os grava.
+    df = repositorio.carregar_dashboard_df(db, perfil)
+    assert df.loc[df['ID'] == 1, '%'].item() == pytest.approx(10 / 14 * 100)
+
+    repositorio.agendar_reconciliacao(db, perfil, [1]).join()
+    topico = db.ler(perfil['colecao_dashboard'], '1')
+    assert topico['%'] == pytest.approx(10 / 14 * 100) and topico['Domínio'] == repositorio.get_nivel_dominio(topico['%'])
+    assert repositorio.reconciliar_derivados(db, perfil) == 0
+
+
+def test_falha_da_reconciliacao_fica_registada(db, perfil, monkeypatch, caplog):
+    def falhar(*args):
+        raise RuntimeError('sem ligação')
+    monkeypatch.setattr(repositorio, 'reconciliar_derivados', falhar)
+
+    repositorio.agendar_reconciliacao(db, perfil, [1]).join()
+
+    assert 'sem ligação' in caplog.text and perfil['id_documento'] in caplog.text